@@ -2,59 +2,303 @@ from pathlib import Path
 from dotenv import load_dotenv
 from pathlib import Path
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli
+from livekit import rtc
+from livekit.agents import JobContext, JobProcess, RoomInputOptions, WorkerOptions, cli
 from livekit.agents.voice import Agent as VoiceAgent, AgentSession
 from livekit.plugins import silero, openai
+from openai import AsyncOpenAI
+import httpx
+import asyncio
+import atexit
+import collections
 import datetime
 import os
+import time
 
-from app.database.helpers import (
-    init_database,
-    setup_database_session,
-    update_session_room,
-    save_transcript
+from app.audio_archive import AudioArchive, merge_segment_refs
+from app.database.helpers import init_database
+from app.database.paragraphs import UtteranceMerger, TRANSCRIPT_MERGE_GAP_MS
+from app.database.sink import TranscriptSink
+from app.database.spool import SpoolReplayer, TranscriptSpool, TRANSCRIPT_SPOOL_ENABLED
+from app.database.writer import TranscriptWriter
+from app.logging_config import configure_logging
+from app.metrics import (
+    AGENT_FIRST_TRANSCRIPT_SECONDS, AGENT_JOB_STARTUP_SECONDS, AGENT_PREWARM_SECONDS,
+    Gauge, STT_TURNAROUND_SECONDS, start_metrics_server
 )
 
 load_dotenv()
 
-init_database()
+logger = configure_logging()
+init_database(role="agent")
+
+# Transcripts are spooled to local disk first and replayed into the database
+transcript_spool = TranscriptSpool() if TRANSCRIPT_SPOOL_ENABLED else None
+spool_replayer = SpoolReplayer(transcript_spool) if transcript_spool else None
+
+transcript_writer = TranscriptWriter(
+    max_queue_size=int(os.environ.get("TRANSCRIPT_QUEUE_SIZE", "1000")),
+    batch_size=int(os.environ.get("TRANSCRIPT_BATCH_SIZE", "50")),
+    flush_interval=float(os.environ.get("TRANSCRIPT_FLUSH_INTERVAL", "0.5")),
+    spool=transcript_spool,
+    submit_timeout=float(os.environ.get("TRANSCRIPT_SUBMIT_TIMEOUT", "0.1"))
+)
+# atexit runs in reverse: the writer flushes into the spool before the replayer drains it
+if spool_replayer:
+    atexit.register(spool_replayer.close)
+atexit.register(transcript_writer.close)
+
+Gauge("transcript_writer_queue_depth", "Transcripts waiting in the writer queue",
+      callback=lambda: transcript_writer.stats()["queue_depth"])
+if transcript_spool:
+    Gauge("transcript_spool_pending_bytes", "Spooled transcript bytes not yet in the database",
+          callback=lambda: transcript_spool.stats()["spool_pending_bytes"])
+    Gauge("transcript_spool_lag_seconds", "Age of the oldest spooled transcript not yet in the database",
+          callback=lambda: transcript_spool.stats()["spool_lag_seconds"])
+
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(int(os.environ["METRICS_PORT"]))
+
+AUDIO_ARCHIVE_ENABLED = os.environ.get("AUDIO_ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+STT_BASE_URL = os.environ.get("STT_BASE_URL", "http://localhost:5002/v1")
+STT_MODEL = os.environ.get("STT_MODEL", "Systran/faster-whisper-small")
+STT_MAX_CONNECTIONS = int(os.environ.get("STT_MAX_CONNECTIONS", "8"))
+
+def create_stt_client():
+    """OpenAI-compatible client for VoxBox with a keep-alive connection pool"""
+    return AsyncOpenAI(
+        base_url=STT_BASE_URL,
+        api_key=os.environ.get("OPENAI_API_KEY", "voxbox"),
+        # The STT plugin retries on its own
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=STT_MAX_CONNECTIONS,
+                max_keepalive_connections=STT_MAX_CONNECTIONS,
+                keepalive_expiry=300
+            )
+        )
+    )
+
+def shared_stt_client(proc):
+    """The process-wide STT client, recreated if a previous job closed it"""
+    client = proc.userdata.get("stt_client")
+    if client is None or client.is_closed():
+        client = proc.userdata["stt_client"] = create_stt_client()
+    return client
+
+async def warm_stt_connection(client):
+    # Open the pooled connection to VoxBox while the room is still connecting
+    try:
+        await client.models.list()
+    except Exception as e:
+        logger.debug("STT warm-up request failed", extra={"error": str(e)})
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model and create the STT client once per worker process
+
+    Runs before the process is handed a job, so rooms do not pay for model
+    loading or a cold HTTP client.
+    """
+    started = time.perf_counter()
+    proc.userdata["vad"] = silero.VAD.load()
+    vad_seconds = time.perf_counter() - started
+    AGENT_PREWARM_SECONDS.observe(vad_seconds, stage="vad")
+
+    started = time.perf_counter()
+    proc.userdata["stt_client"] = create_stt_client()
+    client_seconds = time.perf_counter() - started
+    AGENT_PREWARM_SECONDS.observe(client_seconds, stage="stt_client")
+
+    logger.info("worker prewarmed", extra={
+        "pid": os.getpid(), "vad_ms": round(vad_seconds * 1000), "stt_client_ms": round(client_seconds * 1000)
+    })
 
 class TranscriptionAgent(VoiceAgent):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
 async def entrypoint(ctx: JobContext):
+    job_started = time.perf_counter()
+    warm = "true" if "vad" in ctx.proc.userdata else "false"
+
+    def startup_stage(stage):
+        elapsed = time.perf_counter() - job_started
+        AGENT_JOB_STARTUP_SECONDS.observe(elapsed, stage=stage, warm=warm)
+        return round(elapsed * 1000)
+
+    stt_client = shared_stt_client(ctx.proc)
+    warm_task = asyncio.create_task(warm_stt_connection(stt_client))
+
     await ctx.connect()
+    startup = {"connect_ms": startup_stage("connect")}
     agent_session = AgentSession()
 
-    setup_database_session()
+    if spool_replayer:
+        spool_replayer.start()
+    transcript_writer.start()
 
-    if ctx and hasattr(ctx, 'room') and ctx.room:
-        update_session_room(ctx.room)
+    room_name = ctx.room.name if ctx and hasattr(ctx, 'room') and ctx.room else "console_session"
+    merger = UtteranceMerger() if TRANSCRIPT_MERGE_GAP_MS > 0 else None
+    sink = TranscriptSink(transcript_writer, room_name=room_name, merger=merger)
+    await asyncio.to_thread(sink.open)
+    startup["session_open_ms"] = startup_stage("session_open")
 
-    @agent_session.on("user_input_transcribed")
-    def on_transcript(transcript):
-        if transcript.is_final:
-            save_transcript(
-                text=transcript.transcript,
+    async def flush_paragraphs():
+        # Close a paragraph once the speaker has been quiet for the merge gap
+        while True:
+            await asyncio.sleep(0.5)
+            sink.flush_idle()
+
+    flush_task = asyncio.create_task(flush_paragraphs()) if merger else None
+
+    vad = ctx.proc.userdata.get("vad")
+    if vad is None:
+        # Only without prewarm (e.g. a custom job executor)
+        vad = silero.VAD.load()
+        ctx.proc.userdata["vad"] = vad
+    startup["vad_ms"] = startup_stage("vad")
+
+    # Transcribe one participant, and archive only that participant's audio
+    participant = await ctx.wait_for_participant()
+
+    archive = None
+    if AUDIO_ARCHIVE_ENABLED and sink.session_id:
+        archive = AudioArchive(sink.session_id)
+
+        def archive_track(track, track_participant):
+            if track.kind == rtc.TrackKind.KIND_AUDIO and track_participant.identity == participant.identity:
+                archive.start(track, vad)
+
+        for publication in participant.track_publications.values():
+            if publication.track:
+                archive_track(publication.track, participant)
+
+        ctx.room.on("track_subscribed", lambda track, publication, track_participant: archive_track(track, track_participant))
+
+    # Final transcripts go through one queue so they reach the sink in
+    # utterance order, even while an earlier one waits for its audio encode
+    write_queue = asyncio.Queue()
+
+    async def write_transcripts():
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                return
+            text, start_time, segments = item
+            audio = None
+            if segments:
+                refs = await asyncio.gather(*segments, return_exceptions=True)
+                audio = merge_segment_refs([ref for ref in refs if isinstance(ref, dict)])
+            sink.write(
+                text=text,
                 confidence=None,
                 is_final=True,
-                duration_ms= None
+                duration_ms=audio["duration_ms"] if audio else None,
+                start_time=start_time,
+                audio=audio
             )
 
+    write_task = asyncio.create_task(write_transcripts())
+
+    async def close_sink():
+        if flush_task:
+            flush_task.cancel()
+        if archive:
+            await archive.aclose()
+        write_queue.put_nowait(None)
+        await asyncio.gather(write_task, return_exceptions=True)
+        if archive:
+            logger.info("audio archive closed", extra={
+                "session_id": str(sink.session_id),
+                "segments": archive.segments_written,
+                "bytes": archive.bytes_written
+            })
+        await asyncio.to_thread(sink.close)
+        logger.info("session closed", extra={
+            "room": room_name,
+            "session_id": str(sink.session_id),
+            "transcripts": sink.transcripts_submitted,
+            **transcript_writer.stats(),
+            **(transcript_spool.stats() if transcript_spool else {})
+        })
+
+    ctx.add_shutdown_callback(close_sink)
+
+    speech_ended_at = None
+    first_transcript = True
+    # Wall-clock (start, end) of utterances still waiting for their final
+    # transcript, used to pick out the matching audio segments
+    speech_started_wall = None
+    utterances = collections.deque()
+
+    @agent_session.on("user_state_changed")
+    def on_user_state_changed(event):
+        nonlocal speech_ended_at, speech_started_wall
+        if event.new_state == "speaking" and event.old_state != "speaking":
+            speech_started_wall = time.time()
+        elif event.old_state == "speaking" and event.new_state != "speaking":
+            speech_ended_at = time.perf_counter()
+            if speech_started_wall is not None:
+                utterances.append((speech_started_wall, time.time()))
+                speech_started_wall = None
+
+    @agent_session.on("user_input_transcribed")
+    def on_transcript(transcript):
+        nonlocal speech_ended_at, first_transcript
+        if not transcript.is_final:
+            return
+
+        if first_transcript:
+            first_transcript = False
+            elapsed = time.perf_counter() - job_started
+            AGENT_FIRST_TRANSCRIPT_SECONDS.observe(elapsed, warm=warm)
+            logger.info("first transcript", extra={
+                "room": room_name, "session_id": str(sink.session_id),
+                "warm": warm, "elapsed_ms": round(elapsed * 1000)
+            })
+
+        if speech_ended_at is not None:
+            STT_TURNAROUND_SECONDS.observe(time.perf_counter() - speech_ended_at)
+            speech_ended_at = None
+        logger.debug("final transcript", extra={
+            "room": room_name, "session_id": str(sink.session_id), "chars": len(transcript.transcript)
+        })
+
+        segments = []
+        if archive:
+            if utterances:
+                start, end = utterances.popleft()
+            else:
+                start, end = speech_started_wall or time.time(), time.time()
+            segments = archive.claim_segments(start, end)
+        # The segment encodes are awaited by the writer task, keeping the utterance time
+        write_queue.put_nowait((transcript.transcript, datetime.datetime.now(), segments))
+
     my_agent = TranscriptionAgent(
         instructions="You are a helpful assistant that transcribes user speech to text.",
         stt=openai.STT(
-            base_url="http://localhost:5002/v1",
-            model="Systran/faster-whisper-small"
+            model=STT_MODEL,
+            client=stt_client
         ),
-        vad=silero.VAD.load()
+        vad=vad
     )
 
     await agent_session.start(
         agent=my_agent,
-        room=ctx.room
+        room=ctx.room,
+        room_input_options=RoomInputOptions(participant_identity=participant.identity)
     )
+    startup["agent_start_ms"] = startup_stage("agent_start")
+    await warm_task
+    logger.info("job started", extra={
+        "room": room_name, "session_id": str(sink.session_id), "warm": warm, **startup
+    })
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    worker_options = {}
+    if os.environ.get("AGENT_IDLE_PROCESSES"):
+        worker_options["num_idle_processes"] = int(os.environ["AGENT_IDLE_PROCESSES"])
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm, **worker_options))
@@ -0,0 +1,217 @@
+"""
+Local audio archive for the voice transcript application
+
+The agent taps the audio track of the participant it transcribes, runs it
+through VAD, and encodes every speech segment as a standalone Ogg/Opus stream. Segments are appended
+to chunk files sharded by date and session:
+
+    AUDIO_ARCHIVE_DIR/YYYY/MM/DD/<session_id>/chunk-0000.ogg
+
+Concatenated Ogg streams are still valid Ogg, and any one segment can be cut
+back out by byte range, so a Transcript only needs (audio_path, audio_offset,
+audio_length) to find its audio. Encoding and file writes run on a
+single-thread executor per archive, off the event loop.
+
+Each segment keeps the wall-clock span of its speech, so a final transcript
+claims the segments that overlap its own utterance rather than whichever
+ones happen to have finished.
+"""
+import asyncio
+import datetime
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+AUDIO_ARCHIVE_DIR = os.environ.get("AUDIO_ARCHIVE_DIR", "audio_archive")
+AUDIO_CHUNK_MAX_BYTES = int(os.environ.get("AUDIO_CHUNK_MAX_BYTES", str(16 * 1024 * 1024)))
+OPUS_BITRATE = int(os.environ.get("AUDIO_OPUS_BITRATE", "24000"))
+OPUS_SAMPLE_RATE = 48000
+# Tolerance when matching segments to utterances; the archive's VAD stream
+# and the agent's own VAD do not cut speech at exactly the same moment
+SEGMENT_MATCH_SLACK = 0.5
+
+def encode_opus(frame, bitrate=OPUS_BITRATE):
+    """Encode a livekit AudioFrame as a standalone Ogg/Opus stream - returns bytes"""
+    import av
+    import numpy as np
+
+    layout = "mono" if frame.num_channels == 1 else "stereo"
+    samples = np.frombuffer(frame.data, dtype=np.int16).reshape(1, -1)
+
+    av_frame = av.AudioFrame.from_ndarray(samples, format="s16", layout=layout)
+    av_frame.sample_rate = frame.sample_rate
+
+    buffer = io.BytesIO()
+    with av.open(buffer, mode="w", format="ogg") as container:
+        stream = container.add_stream("libopus", rate=OPUS_SAMPLE_RATE, layout=layout)
+        stream.bit_rate = bitrate
+
+        resampler = av.AudioResampler(format="s16", layout=layout, rate=OPUS_SAMPLE_RATE)
+        for resampled in resampler.resample(av_frame) + resampler.resample(None):
+            for packet in stream.encode(resampled):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+
+    return buffer.getvalue()
+
+def merge_segment_refs(refs):
+    """Combine consecutive segment references into one transcript audio reference
+
+    Segments written back to back in the same chunk file are contiguous, so
+    they collapse into a single byte range. Segments that spilled into a new
+    chunk file are left out of the range but still count towards duration.
+    """
+    refs = [ref for ref in refs if ref]
+    if not refs:
+        return None
+
+    first = refs[0]
+    same_file = [ref for ref in refs if ref["audio_path"] == first["audio_path"]]
+    end = max(ref["audio_offset"] + ref["audio_length"] for ref in same_file)
+
+    return {
+        "audio_path": first["audio_path"],
+        "audio_offset": first["audio_offset"],
+        "audio_length": end - first["audio_offset"],
+        "duration_ms": sum(ref["duration_ms"] for ref in refs),
+    }
+
+def resolve_audio_path(audio_path, base_dir=AUDIO_ARCHIVE_DIR):
+    """Resolve a stored audio path, refusing paths outside the archive directory"""
+    base = Path(base_dir).resolve()
+    path = (base / audio_path).resolve()
+    if base not in path.parents:
+        raise ValueError(f"Audio path {audio_path} is outside the archive")
+    return path
+
+def read_audio_segment(audio_path, offset, length, base_dir=AUDIO_ARCHIVE_DIR):
+    """Read one archived segment back as standalone Ogg/Opus bytes"""
+    with open(resolve_audio_path(audio_path, base_dir), "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+class AudioArchive:
+    """Archives VAD-delimited speech segments for one session"""
+
+    def __init__(self, session_id, base_dir=AUDIO_ARCHIVE_DIR,
+                 max_chunk_bytes=AUDIO_CHUNK_MAX_BYTES):
+        self.session_id = session_id
+        self.base_dir = Path(base_dir)
+        self.max_chunk_bytes = max_chunk_bytes
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-archive")
+        self._chunk_path = None
+        self._chunk_index = 0
+        self._pending = []
+        self._tasks = []
+
+        self.segments_written = 0
+        self.bytes_written = 0
+
+    def start(self, track, vad):
+        """Start archiving an audio track in the background"""
+        self._tasks.append(asyncio.create_task(self._run(track, vad)))
+
+    def claim_segments(self, start, end):
+        """Take the futures for segments overlapping an utterance from start to end
+
+        start and end are time.time() values. Segments that ended before the
+        utterance began produced no transcript; they stay on disk but are no
+        longer offered. Later segments are kept for the next utterance.
+        """
+        claimed = []
+        kept = []
+        for segment_start, segment_end, future in self._pending:
+            if segment_end < start - SEGMENT_MATCH_SLACK:
+                continue
+            if segment_start <= end + SEGMENT_MATCH_SLACK:
+                claimed.append(future)
+            else:
+                kept.append((segment_start, segment_end, future))
+        self._pending = kept
+        return claimed
+
+    async def aclose(self):
+        """Stop reading tracks and wait for queued segments to be written"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*(future for _, _, future in self._pending), return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, track, vad):
+        from livekit import rtc
+        from livekit.agents import vad as agents_vad
+
+        audio_stream = rtc.AudioStream(track)
+        vad_stream = vad.stream()
+
+        async def forward_frames():
+            async for event in audio_stream:
+                vad_stream.push_frame(event.frame)
+            vad_stream.end_input()
+
+        forward_task = asyncio.create_task(forward_frames())
+        loop = asyncio.get_running_loop()
+        try:
+            async for event in vad_stream:
+                if event.type == agents_vad.VADEventType.END_OF_SPEECH and event.frames:
+                    frame = rtc.combine_audio_frames(event.frames)
+                    end = time.time() - event.silence_duration
+                    self._pending.append((
+                        end - event.speech_duration,
+                        end,
+                        loop.run_in_executor(self._executor, self.write_segment, frame)
+                    ))
+        finally:
+            forward_task.cancel()
+            await vad_stream.aclose()
+            await audio_stream.aclose()
+
+    def write_segment(self, frame):
+        """Encode a speech segment and append it to the current chunk file"""
+        try:
+            data = encode_opus(frame)
+            chunk_path = self._current_chunk(len(data))
+            with open(chunk_path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+        except Exception as e:
+            logger.exception("audio segment archive failed", extra={
+                "session_id": str(self.session_id), "error": str(e)
+            })
+            return None
+
+        self.segments_written += 1
+        self.bytes_written += len(data)
+        return {
+            "audio_path": chunk_path.relative_to(self.base_dir).as_posix(),
+            "audio_offset": offset,
+            "audio_length": len(data),
+            "duration_ms": int(frame.duration * 1000),
+        }
+
+    def _current_chunk(self, incoming_bytes):
+        today = datetime.date.today()
+        chunk_dir = self.base_dir / f"{today:%Y}" / f"{today:%m}" / f"{today:%d}" / str(self.session_id)
+
+        if self._chunk_path is not None:
+            rolled_over_day = self._chunk_path.parent != chunk_dir
+            full = self._chunk_path.stat().st_size + incoming_bytes > self.max_chunk_bytes
+            if rolled_over_day:
+                self._chunk_index = 0
+            elif full:
+                self._chunk_index += 1
+            if rolled_over_day or full:
+                self._chunk_path = None
+
+        if self._chunk_path is None:
+            chunk_dir.mkdir(parents=True, exist_ok=True)
+            self._chunk_path = chunk_dir / f"chunk-{self._chunk_index:04d}.ogg"
+        return self._chunk_path
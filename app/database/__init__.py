@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -8,11 +11,75 @@ Base = declarative_base()
 engine = None
 SessionLocal = None
 
-def init_db(connection_string):
+# Connection pool sizing per process role. The agent has a single writer
+# thread plus the occasional job start/end; the web app serves many
+# concurrent readers.
+POOL_SETTINGS = {
+    "agent": {"pool_size": 2, "max_overflow": 4},
+    "web": {"pool_size": 10, "max_overflow": 20},
+    "default": {"pool_size": 5, "max_overflow": 10},
+}
+
+def sqlite_pragmas():
+    """PRAGMA settings applied to every new SQLite connection, from the environment"""
+    return {
+        # Only takes effect on a new database; manage_db.py vacuum converts old ones
+        "auto_vacuum": os.environ.get("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+        "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        # Negative values are KiB rather than pages
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", str(-64 * 1024))),
+        "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+    }
+
+def create_db_engine(connection_string, role="default"):
+    """Create an engine tuned for the database backend and process role
+
+    SQLite connections get WAL journaling and the pragmas from
+    sqlite_pragmas() so the agent (writer) and web app (readers) can share
+    one database file without blocking each other.
+    """
+    url = make_url(connection_string)
+    pool = dict(POOL_SETTINGS.get(role, POOL_SETTINGS["default"]))
+    if "DB_POOL_SIZE" in os.environ:
+        pool["pool_size"] = int(os.environ["DB_POOL_SIZE"])
+    if "DB_MAX_OVERFLOW" in os.environ:
+        pool["max_overflow"] = int(os.environ["DB_MAX_OVERFLOW"])
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(connection_string, pool_pre_ping=True, **pool)
+
+    if url.database in (None, "", ":memory:"):
+        # In-memory databases live in a single connection; no pool sizing
+        return create_engine(connection_string)
+
+    new_engine = create_engine(connection_string, **pool)
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(new_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return new_engine
+
+def init_db(connection_string, role="default"):
     """Initialize the database connection and session factory"""
     global engine, SessionLocal
 
-    engine = create_engine(connection_string)
+    if engine is not None and engine.url == make_url(connection_string):
+        return engine, SessionLocal
+
+    if engine is not None:
+        engine.dispose()
+
+    engine = create_db_engine(connection_string, role)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # Import models to ensure they're registered with Base
@@ -26,4 +93,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
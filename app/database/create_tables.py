@@ -1,11 +1,30 @@
 import os
 import argparse
-from sqlalchemy import create_engine
-from . import Base, init_db
-from . import models
+from pathlib import Path
+from . import init_db
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent.parent / "alembic.ini"
+
+def alembic_config(connection_string):
+    """Alembic config for the migrations/ directory, bound to a database"""
+    from alembic.config import Config
+
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["url"] = connection_string
+    return config
+
+def upgrade_database(connection_string, revision="head"):
+    """Apply schema migrations up to revision"""
+    from alembic import command
+
+    command.upgrade(alembic_config(connection_string), revision)
 
 def create_tables(connection_string=None):
-    """Create all database tables defined in the models"""
+    """Create all database tables defined in the models
+
+    Runs the Alembic migrations, so a new database is stamped with the
+    current revision and an existing one is brought up to date.
+    """
 
     if connection_string is None:
         connection_string = os.environ.get(
@@ -13,9 +32,8 @@ def create_tables(connection_string=None):
             "sqlite:///voice_transcripts.db"
         )
 
-    engine, _ = init_db(connection_string)
-
-    Base.metadata.create_all(bind=engine)
+    init_db(connection_string)
+    upgrade_database(connection_string)
     print(f"Tables created successfully on {connection_string}")
 
 if __name__ == "__main__":
@@ -2,91 +2,266 @@
 Database helpers for the voice transcript application
 """
 import datetime
+import logging
 import os
+import time
+import uuid
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.exc import IntegrityError
 from . import init_db, get_db
 from .models import User, Session as DBSession, Transcript
+from .rollups import ROLLUP_ON_WRITE, update_rollups
+from app.metrics import DB_COMMIT_SECONDS, TRANSCRIPTS_SAVED, TRANSCRIPT_SAVE_ERRORS
+
+logger = logging.getLogger(__name__)
 
 _db_initialized = False
 _global_session_id = None
 _global_user_id = None
 
-def init_database(connection_string=None):
-    """Initialize the database connection"""
+def init_database(connection_string=None, role="default"):
+    """Initialize the database connection for a process role ("agent", "web")"""
     if connection_string is None:
         connection_string = os.environ.get(
             "DATABASE_URL",
             "sqlite:///voice_transcripts.db"
         )
 
-    engine, SessionLocal = init_db(connection_string)
+    engine, SessionLocal = init_db(connection_string, role)
     return engine, SessionLocal
 
-def setup_database_session(room_name="console_session"):
-    """Initialize database session and user - returns (user_id, session_id)"""
-    global _global_user_id, _global_session_id, _db_initialized
+def add_session(db, room_name="console_session", title=None, source="livekit_agent"):
+    """Add a recording session in the caller's transaction - returns (user_id, session_id)"""
+    user = db.query(User).filter(User.username == "agent_user").first()
+    if not user:
+        try:
+            with db.begin_nested():
+                user = User(
+                    username="agent_user",
+                    email="agent@example.com"
+                )
+                db.add(user)
+        except IntegrityError:
+            # Another job created the agent user concurrently
+            user = db.query(User).filter(User.username == "agent_user").one()
 
-    if _db_initialized and _global_session_id and _global_user_id:
-        return _global_user_id, _global_session_id
+    db_session = DBSession(
+        user_id=user.id,
+        title=title or f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        session_metadata={"source": source, "room_name": room_name}
+    )
+    db.add(db_session)
+    db.flush()
+    return user.id, db_session.id
 
+def create_session(room_name="console_session", title=None, source="livekit_agent"):
+    """Create a new recording session for a room - returns (user_id, session_id)"""
     db = next(get_db())
     try:
-        user = db.query(User).filter(User.username == "agent_user").first()
-        if not user:
-            user = User(
-                username="agent_user",
-                email="agent@example.com"
-            )
-            db.add(user)
-            db.flush()
-
-        user_id = user.id
-
-        db_session = DBSession(
-            user_id=user.id,
-            title=f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            session_metadata={"source": "livekit_agent", "room_name": room_name}
-        )
-        db.add(db_session)
+        user_id, session_id = add_session(db, room_name, title, source)
         db.commit()
 
-        _global_user_id = user_id
-        _global_session_id = db_session.id
-        _db_initialized = True
-
-        print(f"Database initialized. Session ID: {_global_session_id}")
-        return user_id, db_session.id
+        logger.info("session created", extra={"room": room_name, "session_id": str(session_id)})
+        return user_id, session_id
 
     except Exception as e:
-        print(f"Database initialization error: {e}")
+        logger.exception("session create failed", extra={"room": room_name, "error": str(e)})
         db.rollback()
         return None, None
     finally:
         db.close()
 
-def update_session_room(room_name):
-    """Update the room name for the current session"""
-    global _global_session_id
+def end_session(session_id):
+    """Mark a session as ended"""
+    db = next(get_db())
+    try:
+        updated = db.query(DBSession).filter(DBSession.id == session_id).update(
+            {DBSession.ended_at: datetime.datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+        return updated > 0
+    except Exception as e:
+        logger.exception("session end failed", extra={"session_id": str(session_id), "error": str(e)})
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def setup_database_session(room_name="console_session"):
+    """Initialize the process-wide session used by save_transcript - returns (user_id, session_id)"""
+    global _global_user_id, _global_session_id, _db_initialized
 
-    if not _global_session_id:
+    if _db_initialized and _global_session_id and _global_user_id:
+        return _global_user_id, _global_session_id
+
+    user_id, session_id = create_session(room_name)
+    if not session_id:
+        return None, None
+
+    _global_user_id = user_id
+    _global_session_id = session_id
+    _db_initialized = True
+    return user_id, session_id
+
+def update_session_room(room_name, session_id=None):
+    """Update the room name for a session (defaults to the process-wide session)"""
+    if session_id is None:
+        session_id = _global_session_id
+
+    if not session_id:
         return False
 
+    # Accept a livekit Room as well as a plain name
+    room_name = getattr(room_name, "name", room_name)
+
     db = next(get_db())
     try:
-        db_session = db.query(DBSession).filter(DBSession.id == _global_session_id).first()
+        db_session = db.query(DBSession).filter(DBSession.id == session_id).first()
         if db_session:
-            if db_session.session_metadata is None:
-                db_session.session_metadata = {}
-            db_session.session_metadata["room_name"] = room_name
+            # Reassign so the JSON column is flagged as modified
+            metadata = dict(db_session.session_metadata or {})
+            metadata["room_name"] = room_name
+            db_session.session_metadata = metadata
             db.commit()
             return True
     except Exception as e:
-        print(f"Error updating room name: {e}")
+        logger.exception("room name update failed", extra={"session_id": str(session_id), "error": str(e)})
         db.rollback()
     finally:
         db.close()
 
     return False
 
+def build_transcript_row(session_id, user_id, text, confidence=None, is_final=True,
+                         duration_ms=None, language="en-US", metadata=None,
+                         start_time=None, audio=None, end_time=None):
+    """Build the column mapping for a single transcript insert
+
+    audio is an optional archived segment reference with audio_path,
+    audio_offset and audio_length keys.
+    """
+    if start_time is None:
+        start_time = datetime.datetime.now()
+
+    if metadata is None:
+        metadata = {
+            "source": "livekit_agent",
+            "type": "user_speech"
+        }
+
+    return {
+        "id": uuid.uuid4(),
+        "session_id": session_id,
+        "user_id": user_id,
+        "text": text,
+        "confidence": confidence,
+        "is_final": is_final,
+        "language": language,
+        "duration_ms": duration_ms,
+        "start_time": start_time,
+        "end_time": end_time or (start_time if is_final else None),
+        "transcript_metadata": metadata,
+        "audio_path": audio.get("audio_path") if audio else None,
+        "audio_offset": audio.get("audio_offset") if audio else None,
+        "audio_length": audio.get("audio_length") if audio else None
+    }
+
+def save_transcripts(rows, skip_existing=False):
+    """Insert a batch of transcript rows in a single transaction
+
+    With skip_existing, rows whose id is already stored are left out (and not
+    counted again), so replaying a batch is idempotent. Returns rows inserted.
+    """
+    if not rows:
+        return 0
+
+    db = next(get_db())
+    started = time.perf_counter()
+    try:
+        if skip_existing:
+            existing = {
+                row_id for (row_id,) in db.query(Transcript.id).filter(
+                    Transcript.id.in_([row["id"] for row in rows])
+                )
+            }
+            rows = [row for row in rows if row["id"] not in existing]
+            if not rows:
+                return 0
+        db.bulk_insert_mappings(Transcript, rows)
+        update_session_counters(db, rows)
+        if ROLLUP_ON_WRITE:
+            update_rollups(db, rows)
+        db.commit()
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+        TRANSCRIPTS_SAVED.inc(len(rows))
+        return len(rows)
+    except Exception:
+        db.rollback()
+        TRANSCRIPT_SAVE_ERRORS.inc(len(rows))
+        raise
+    finally:
+        db.close()
+
+def update_session_counters(db, rows):
+    """Add a batch of new transcript rows to their sessions' denormalized counters
+
+    Runs in the caller's transaction so the counters commit with the rows.
+    """
+    totals = {}
+    for row in rows:
+        count, characters, duration_ms, last_at = totals.get(row["session_id"], (0, 0, 0, None))
+        start_time = row.get("start_time")
+        totals[row["session_id"]] = (
+            count + 1,
+            characters + len(row["text"]),
+            duration_ms + (row.get("duration_ms") or 0),
+            start_time if last_at is None or (start_time and start_time > last_at) else last_at
+        )
+
+    for session_id, (count, characters, duration_ms, last_at) in totals.items():
+        values = {
+            DBSession.transcript_count: DBSession.transcript_count + count,
+            DBSession.total_characters: DBSession.total_characters + characters,
+            DBSession.total_duration_ms: DBSession.total_duration_ms + duration_ms,
+        }
+        if last_at is not None:
+            values[DBSession.last_transcript_at] = case(
+                (DBSession.last_transcript_at.is_(None), last_at),
+                (DBSession.last_transcript_at < last_at, last_at),
+                else_=DBSession.last_transcript_at
+            )
+        db.query(DBSession).filter(DBSession.id == session_id).update(
+            values, synchronize_session=False
+        )
+
+def recount_session_counters(db):
+    """Recompute every session's counters from the transcripts table"""
+    stats = db.query(
+        Transcript.session_id,
+        func.count(Transcript.id),
+        func.coalesce(func.sum(func.length(Transcript.text)), 0),
+        func.coalesce(func.sum(Transcript.duration_ms), 0),
+        func.max(Transcript.start_time)
+    ).group_by(Transcript.session_id).all()
+
+    db.query(DBSession).update({
+        DBSession.transcript_count: 0,
+        DBSession.total_characters: 0,
+        DBSession.total_duration_ms: 0,
+        DBSession.last_transcript_at: None,
+    }, synchronize_session=False)
+
+    for session_id, count, characters, duration_ms, last_at in stats:
+        db.query(DBSession).filter(DBSession.id == session_id).update({
+            DBSession.transcript_count: count,
+            DBSession.total_characters: characters,
+            DBSession.total_duration_ms: duration_ms,
+            DBSession.last_transcript_at: last_at,
+        }, synchronize_session=False)
+
+    return len(stats)
+
 def save_transcript(text, confidence=None, is_final=True, duration_ms=None,
                    language="en-US", metadata=None):
     """Save a transcript to the database"""
@@ -95,44 +270,71 @@ def save_transcript(text, confidence=None, is_final=True, duration_ms=None,
     if not _db_initialized or not _global_session_id or not _global_user_id:
         user_id, session_id = setup_database_session()
         if not session_id:
-            print("ERROR: Could not initialize database session for transcript")
+            logger.error("no database session for transcript")
             return False
 
     try:
-        db = next(get_db())
-        now = datetime.datetime.now()
-
-        if metadata is None:
-            metadata = {
-                "source": "livekit_agent",
-                "type": "user_speech"
-            }
-
-        transcript = Transcript(
+        row = build_transcript_row(
             session_id=_global_session_id,
             user_id=_global_user_id,
             text=text,
             confidence=confidence,
             is_final=is_final,
-            language=language,
             duration_ms=duration_ms,
-            start_time=now,
-            end_time=now if is_final else None,
-            transcript_metadata=metadata
+            language=language,
+            metadata=metadata
         )
-        db.add(transcript)
-        db.commit()
+        save_transcripts([row])
 
-        print(f"Saved transcript to database: {text[:30]}{'...' if len(text) > 30 else ''}")
+        logger.debug("transcript saved", extra={
+            "session_id": str(_global_session_id), "chars": len(text)
+        })
         return True
     except Exception as e:
-        print(f"Error saving transcript to database: {e}")
-        if db:
-            db.rollback()
+        logger.error("transcript save failed", extra={
+            "session_id": str(_global_session_id), "error": str(e)
+        })
         return False
-    finally:
-        if db:
-            db.close()
+
+# Columns returned by transcript listing queries; selecting columns rather than
+# Transcript entities keeps rows out of the session identity map
+TRANSCRIPT_LIST_COLUMNS = (
+    Transcript.id,
+    Transcript.text,
+    Transcript.confidence,
+    Transcript.start_time,
+    Transcript.duration_ms,
+    Transcript.transcript_metadata,
+    Transcript.audio_path,
+)
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) keyset position as an opaque cursor string"""
+    return f"{timestamp.isoformat()}|{row_id.hex}"
+
+def decode_cursor(cursor):
+    """Decode a cursor string into (timestamp, id) - raises ValueError if malformed"""
+    timestamp, _, row_id = cursor.partition("|")
+    return datetime.datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+
+def query_transcript_rows(db, session_id, cursor=None):
+    """Column-only query for a session's transcripts in (start_time, id) order
+
+    When a cursor is given only rows strictly after that position are returned,
+    so the query is a range scan on idx_transcript_session_time.
+    """
+    query = db.query(*TRANSCRIPT_LIST_COLUMNS).filter(
+        Transcript.session_id == session_id
+    )
+
+    if cursor:
+        start_time, transcript_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transcript.start_time > start_time,
+            and_(Transcript.start_time == start_time, Transcript.id > transcript_id)
+        ))
+
+    return query.order_by(Transcript.start_time, Transcript.id)
 
 def get_current_session_id():
     """Get the current session ID"""
@@ -1,17 +1,21 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, ForeignKey, Boolean, Index, JSON, Uuid
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.dialects.sqlite import JSON
+from sqlalchemy.dialects.postgresql import JSONB
 import uuid
 
 from . import Base
 
+# Portable column types: native uuid/jsonb on PostgreSQL, CHAR(32) hex and
+# JSON text on SQLite (the same storage the earlier dialect types used)
+UUID = Uuid(as_uuid=True)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class User(Base):
     """User model for transcript sources"""
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
     username = Column(String(100), unique=True, nullable=False)
     email = Column(String(255), unique=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -26,16 +30,37 @@ class Session(Base):
     """Session model for grouping transcripts"""
     __tablename__ = "sessions"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID, ForeignKey("users.id"), nullable=False)
     title = Column(String(255))
     started_at = Column(DateTime, default=datetime.utcnow)
     ended_at = Column(DateTime, nullable=True)
-    session_metadata = Column(JSON, nullable=True)
+    session_metadata = Column(JSONType, nullable=True)
     summary = Column(Text, nullable=True) # Added field for storing summary
+    # Cache metadata describing what the stored summary covers
+    summary_last_transcript_id = Column(UUID, nullable=True)
+    summary_last_transcript_at = Column(DateTime, nullable=True)
+    summary_model = Column(String(100), nullable=True)
+    summary_prompt_hash = Column(String(64), nullable=True)
+    summary_updated_at = Column(DateTime, nullable=True)
+    # Denormalized counters maintained by the transcript write path
+    transcript_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_characters = Column(Integer, nullable=False, default=0, server_default="0")
+    total_duration_ms = Column(Integer, nullable=False, default=0, server_default="0")
+    last_transcript_at = Column(DateTime, nullable=True)
+    # Set once the transcripts have moved to a compressed monthly archive file
+    archived_at = Column(DateTime, nullable=True)
+    archive_path = Column(String(500), nullable=True)
+    archive_offset = Column(Integer, nullable=True)
+    archive_length = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="sessions")
     transcripts = relationship("Transcript", back_populates="session")
+    summary_chunks = relationship("SummaryChunk", back_populates="session")
+
+    __table_args__ = (
+        Index('idx_session_started_at', started_at, id),
+    )
 
     def __repr__(self):
         return f"<Session {self.id} - {self.title}>"
@@ -44,9 +69,9 @@ class Transcript(Base):
     """Transcript model for storing voice transcriptions"""
     __tablename__ = "transcripts"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID, ForeignKey("sessions.id"), nullable=False)
+    user_id = Column(UUID, ForeignKey("users.id"), nullable=False)
     text = Column(Text, nullable=False)
     confidence = Column(Float, nullable=True)
     is_final = Column(Boolean, default=True)
@@ -56,7 +81,12 @@ class Transcript(Base):
     end_time = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    transcript_metadata = Column(JSON, nullable=True)
+    transcript_metadata = Column(JSONType, nullable=True)
+
+    # Location of the archived audio for this utterance, relative to AUDIO_ARCHIVE_DIR
+    audio_path = Column(String(500), nullable=True)
+    audio_offset = Column(Integer, nullable=True)
+    audio_length = Column(Integer, nullable=True)
 
     session = relationship("Session", back_populates="transcripts")
     user = relationship("User", back_populates="transcripts")
@@ -65,7 +95,116 @@ class Transcript(Base):
         Index('idx_transcript_user_session', user_id, session_id),
         Index('idx_transcript_session_time', session_id, start_time),
         Index('idx_transcript_created_at', created_at),
+        # Live feed polling: a session's rows in commit order
+        Index('idx_transcript_session_created', session_id, created_at, id),
+        # PostgreSQL only: containment queries on metadata, and a tiny
+        # block-range index for time scans over the append-ordered table
+        Index('idx_transcript_metadata_gin', transcript_metadata,
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+        Index('idx_transcript_start_time_brin', start_time,
+              postgresql_using='brin').ddl_if(dialect='postgresql'),
     )
 
     def __repr__(self):
         return f"<Transcript {self.id[:8]} - {self.text[:30]}...>"
+
+class SummaryChunk(Base):
+    """Partial summary of a contiguous range of transcripts within a session"""
+    __tablename__ = "summary_chunks"
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID, ForeignKey("sessions.id"), nullable=False)
+    first_transcript_id = Column(UUID, nullable=False)
+    last_transcript_id = Column(UUID, nullable=False)
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
+    transcript_count = Column(Integer, nullable=False)
+    model = Column(String(100), nullable=False)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    session = relationship("Session", back_populates="summary_chunks")
+
+    __table_args__ = (
+        Index('idx_summary_chunk_range', session_id, model,
+              first_transcript_id, last_transcript_id, unique=True),
+    )
+
+    def __repr__(self):
+        return f"<SummaryChunk {self.session_id} - {self.transcript_count} transcripts>"
+
+class SummaryJob(Base):
+    """Background summarization job for a session"""
+    __tablename__ = "summary_jobs"
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID, ForeignKey("sessions.id"), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # "host:pid" of the web app process running the job, refreshed while it is in flight
+    owner = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    session = relationship("Session")
+
+    __table_args__ = (
+        Index('idx_summary_job_session_status', session_id, status),
+    )
+
+    def __repr__(self):
+        return f"<SummaryJob {self.id} - {self.status}>"
+
+class RetranscriptionJob(Base):
+    """Work item for an offline re-transcription batch, used to resume runs"""
+    __tablename__ = "retranscription_jobs"
+
+    id = Column(UUID, primary_key=True, default=uuid.uuid4)
+    batch = Column(String(255), nullable=False)
+    source_type = Column(String(20), nullable=False) # "file" or "segment"
+    source = Column(String(1000), nullable=False) # File path or archived transcript id
+    source_session_id = Column(UUID, nullable=True)
+    model = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    endpoint = Column(String(255), nullable=True)
+    text = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    start_time = Column(DateTime, nullable=True)
+    transcript_id = Column(UUID, nullable=True) # Set once imported
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_retranscription_job_source', batch, source, model, unique=True),
+        Index('idx_retranscription_job_status', batch, status),
+    )
+
+    def __repr__(self):
+        return f"<RetranscriptionJob {self.source} - {self.status}>"
+
+class ActivityRollup(Base):
+    """Transcript activity pre-aggregated per hour, maintained by app/database/rollups.py"""
+    __tablename__ = "activity_hourly"
+
+    bucket_start = Column(DateTime, primary_key=True)
+    utterances = Column(Integer, nullable=False, default=0)
+    words = Column(Integer, nullable=False, default=0)
+    characters = Column(Integer, nullable=False, default=0)
+    speaking_ms = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ActivityRollup {self.bucket_start} - {self.utterances}>"
+
+class TermRollup(Base):
+    """Word frequencies pre-aggregated per day, maintained by app/database/rollups.py"""
+    __tablename__ = "term_daily"
+
+    day = Column(Date, primary_key=True)
+    term = Column(String(64), primary_key=True)
+    occurrences = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TermRollup {self.day} {self.term} - {self.occurrences}>"
@@ -0,0 +1,185 @@
+"""
+Utterance merging for the transcript write path
+
+VAD-final fragments are often only a few words long. UtteranceMerger
+coalesces consecutive fragments into paragraph-level rows, closing a
+paragraph when the pause before the next fragment exceeds max_gap_ms or the
+text would grow past max_chars. Each merged row keeps its fragment
+boundaries in transcript_metadata["fragments"]:
+
+    {"offset": 0, "length": 23, "start_ms": 0, "duration_ms": 1800,
+     "audio_path": ..., "audio_offset": ..., "audio_length": ...}
+
+offset/length index into the paragraph text, and start_ms is relative to
+the paragraph's start_time. Fragment times are when the final transcript
+arrived, i.e. roughly the end of speech, so the pause is estimated as
+time - duration_ms - previous time when the duration is known.
+"""
+import datetime
+import os
+
+from ..audio_archive import merge_segment_refs
+from .models import Session as DBSession, Transcript
+from .rollups import ROLLUP_ON_WRITE, RollupDelta, apply_rollups
+
+TRANSCRIPT_MERGE_GAP_MS = int(os.environ.get("TRANSCRIPT_MERGE_GAP_MS", "2000"))
+TRANSCRIPT_MERGE_MAX_CHARS = int(os.environ.get("TRANSCRIPT_MERGE_MAX_CHARS", "600"))
+
+AUDIO_KEYS = ("audio_path", "audio_offset", "audio_length")
+
+def _gap_ms(previous, fragment):
+    speech_start = fragment["time"] - datetime.timedelta(milliseconds=fragment.get("duration_ms") or 0)
+    return (speech_start - previous["time"]).total_seconds() * 1000
+
+def starts_paragraph(fragments, fragment, max_gap_ms, max_chars):
+    """Whether fragment should start a new paragraph after the pending fragments"""
+    if not fragments:
+        return False
+    length = sum(len(f["text"]) + 1 for f in fragments) + len(fragment["text"])
+    return _gap_ms(fragments[-1], fragment) > max_gap_ms or length > max_chars
+
+class UtteranceMerger:
+    """Groups consecutive transcript fragments into paragraphs
+
+    Fragments are dicts with text, time and optionally duration_ms,
+    confidence and audio (an archived segment reference).
+    """
+
+    def __init__(self, max_gap_ms=TRANSCRIPT_MERGE_GAP_MS, max_chars=TRANSCRIPT_MERGE_MAX_CHARS):
+        self.max_gap_ms = max_gap_ms
+        self.max_chars = max_chars
+        self.fragments = []
+
+    def add(self, fragment):
+        """Add a fragment - returns the paragraph it closed, if any"""
+        closed = None
+        if starts_paragraph(self.fragments, fragment, self.max_gap_ms, self.max_chars):
+            closed = self.flush()
+        self.fragments.append(fragment)
+        return closed
+
+    def idle_ms(self, now):
+        """Milliseconds since the last fragment, or None when nothing is pending"""
+        if not self.fragments:
+            return None
+        return (now - self.fragments[-1]["time"]).total_seconds() * 1000
+
+    def flush(self):
+        """Close the pending paragraph - returns it, or None when empty"""
+        fragments, self.fragments = self.fragments, []
+        if not fragments:
+            return None
+        return build_paragraph(fragments)
+
+def build_paragraph(fragments):
+    """Combine fragments into one paragraph dict with fragment boundaries"""
+    first = fragments[0]
+    start_time = first["time"]
+    texts = [f["text"].strip() for f in fragments]
+    durations = [f.get("duration_ms") for f in fragments]
+    confidences = [f["confidence"] for f in fragments if f.get("confidence") is not None]
+
+    boundaries = []
+    offset = 0
+    for fragment, text in zip(fragments, texts):
+        boundary = {
+            "offset": offset,
+            "length": len(text),
+            "start_ms": int((fragment["time"] - start_time).total_seconds() * 1000),
+            "duration_ms": fragment.get("duration_ms"),
+        }
+        if fragment.get("audio"):
+            boundary.update({key: fragment["audio"][key] for key in AUDIO_KEYS})
+        boundaries.append(boundary)
+        offset += len(text) + 1
+
+    audio = merge_segment_refs([
+        dict(f["audio"], duration_ms=f["audio"].get("duration_ms") or f.get("duration_ms") or 0)
+        for f in fragments if f.get("audio")
+    ])
+
+    return {
+        "first": first,
+        "text": " ".join(texts),
+        "start_time": start_time,
+        "end_time": fragments[-1]["time"],
+        "duration_ms": sum(durations) if any(d is not None for d in durations) else None,
+        "confidence": sum(confidences) / len(confidences) if confidences else None,
+        "audio": audio,
+        "fragments": boundaries if len(fragments) > 1 else None,
+    }
+
+def compact_session(db, session_id, max_gap_ms=TRANSCRIPT_MERGE_GAP_MS,
+                    max_chars=TRANSCRIPT_MERGE_MAX_CHARS, rewritten=None):
+    """Merge an existing session's fragment rows into paragraphs
+
+    Each paragraph reuses its first fragment's row and the other fragments
+    are deleted. Rows that are already paragraphs are left as they are.
+    The analytics rollups are updated to match (ROLLUP_ON_WRITE), and the
+    ids of the reused rows, whose text changed, are appended to rewritten
+    when given. Runs in the caller's transaction - returns the number of
+    rows removed.
+    """
+    rows = db.query(
+        Transcript.id, Transcript.text, Transcript.start_time, Transcript.duration_ms,
+        Transcript.confidence, Transcript.transcript_metadata,
+        Transcript.audio_path, Transcript.audio_offset, Transcript.audio_length
+    ).filter(
+        Transcript.session_id == session_id,
+        Transcript.is_final.is_(True)
+    ).order_by(Transcript.start_time, Transcript.id).all()
+
+    groups = [[]]
+    for row in rows:
+        if (row.transcript_metadata or {}).get("fragments"):
+            groups.append([])
+            continue
+        fragment = {
+            "id": row.id,
+            "text": row.text,
+            "time": row.start_time,
+            "duration_ms": row.duration_ms,
+            "confidence": row.confidence,
+            "metadata": row.transcript_metadata,
+            "audio": {key: getattr(row, key) for key in AUDIO_KEYS} if row.audio_path else None,
+        }
+        if starts_paragraph(groups[-1], fragment, max_gap_ms, max_chars):
+            groups.append([])
+        groups[-1].append(fragment)
+
+    removed = added_characters = 0
+    delta = RollupDelta()
+    for fragments in groups:
+        if len(fragments) < 2:
+            continue
+        paragraph = build_paragraph(fragments)
+        ids = [f["id"] for f in fragments]
+        metadata = dict(fragments[0]["metadata"] or {}, fragments=paragraph["fragments"])
+        audio = paragraph["audio"] or {}
+        db.query(Transcript).filter(Transcript.id == ids[0]).update({
+            Transcript.text: paragraph["text"],
+            Transcript.end_time: paragraph["end_time"],
+            Transcript.duration_ms: paragraph["duration_ms"],
+            Transcript.confidence: paragraph["confidence"],
+            Transcript.transcript_metadata: metadata,
+            Transcript.audio_path: audio.get("audio_path"),
+            Transcript.audio_offset: audio.get("audio_offset"),
+            Transcript.audio_length: audio.get("audio_length"),
+        }, synchronize_session=False)
+        db.query(Transcript).filter(Transcript.id.in_(ids[1:])).delete(synchronize_session=False)
+        removed += len(ids) - 1
+        if rewritten is not None:
+            rewritten.append(ids[0])
+        added_characters += len(paragraph["text"]) - sum(len(f["text"]) for f in fragments)
+        for fragment in fragments:
+            delta.add(fragment["time"], fragment["text"], fragment["duration_ms"], sign=-1)
+        delta.add(fragments[0]["time"], paragraph["text"], paragraph["duration_ms"])
+
+    if removed:
+        db.query(DBSession).filter(DBSession.id == session_id).update({
+            DBSession.transcript_count: DBSession.transcript_count - removed,
+            DBSession.total_characters: DBSession.total_characters + added_characters,
+        }, synchronize_session=False)
+        if ROLLUP_ON_WRITE:
+            apply_rollups(db, delta)
+    return removed
@@ -0,0 +1,210 @@
+"""
+Retention and tiered archival for the transcript store
+
+Sessions whose last activity is older than RETENTION_DAYS are moved out of
+the transcripts table into compressed NDJSON archive files, one per month:
+
+    TRANSCRIPT_ARCHIVE_DIR/transcripts-YYYY-MM.ndjson.zst   (or .gz)
+
+Each session is appended as its own zstd frame (gzip member without the
+optional zstandard package), so a month file is still one valid stream and
+a single session can be read back by byte range. The sessions row stays as
+a stub with its title, summary and counters plus archive_path,
+archive_offset and archive_length, which is all read_archived_transcripts()
+needs for the web app to open it.
+
+The archive file is written and fsynced before the transcripts are deleted,
+so an interrupted run at worst leaves unreferenced bytes in the archive.
+"""
+import datetime
+import json
+import logging
+import os
+import types
+import uuid
+import zlib
+from pathlib import Path
+
+from sqlalchemy import DateTime, func
+
+from .models import Session as DBSession, SummaryChunk, Transcript
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "90"))
+TRANSCRIPT_ARCHIVE_DIR = os.environ.get("TRANSCRIPT_ARCHIVE_DIR", "transcript_archive")
+ARCHIVE_COMPRESSION = os.environ.get("ARCHIVE_COMPRESSION", "zstd" if zstandard else "gzip")
+VACUUM_PAGES = int(os.environ.get("VACUUM_PAGES", "2000"))
+
+ARCHIVE_BATCH_ROWS = 1000
+ARCHIVE_READ_BYTES = 64 * 1024
+EXTENSIONS = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+
+COLUMNS = list(Transcript.__table__.columns)
+DATETIME_COLUMNS = {column.name for column in COLUMNS if isinstance(column.type, DateTime)}
+UUID_COLUMNS = {"id", "session_id", "user_id"}
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+def _archive_file(archive_path, base_dir):
+    base = Path(base_dir).resolve()
+    path = (base / archive_path).resolve()
+    if base not in path.parents:
+        raise ValueError(f"Archive path {archive_path} is outside the archive")
+    return path
+
+def _compressor(compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ARCHIVE_COMPRESSION=zstd requires: pip install zstandard")
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    if compression == "gzip":
+        return zlib.compressobj(9, zlib.DEFLATED, 31)
+    raise ValueError(f"Unknown ARCHIVE_COMPRESSION: {compression}")
+
+def _decompressor(archive_path):
+    if archive_path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {archive_path} requires: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+def sessions_due(db, older_than_days=RETENTION_DAYS):
+    """Ids of unarchived sessions with no activity for older_than_days"""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    last_activity = func.coalesce(DBSession.last_transcript_at, DBSession.started_at)
+    return [row.id for row in db.query(DBSession.id).filter(
+        DBSession.archived_at.is_(None),
+        last_activity < cutoff
+    ).order_by(DBSession.started_at)]
+
+def archive_session(db, session_id, base_dir=TRANSCRIPT_ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION,
+                    archived=None):
+    """Move one session's transcripts into its month's archive file
+
+    Commits the stub update and the delete together - returns the number of
+    transcripts archived. The ids of the archived rows are appended to
+    archived when given.
+    """
+    session = db.query(DBSession).filter(DBSession.id == session_id).one()
+    started = session.started_at or datetime.datetime.utcnow()
+    archive_path = f"transcripts-{started:%Y-%m}{EXTENSIONS[compression]}"
+    path = _archive_file(archive_path, base_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    query = db.query(*COLUMNS).filter(
+        Transcript.session_id == session_id
+    ).order_by(Transcript.start_time, Transcript.id)
+
+    compressor = _compressor(compression)
+    count = 0
+    with open(path, "ab") as f:
+        offset = f.tell()
+        for row in query.yield_per(ARCHIVE_BATCH_ROWS):
+            line = json.dumps(dict(row._mapping), default=_encode) + "\n"
+            f.write(compressor.compress(line.encode("utf-8")))
+            count += 1
+            if archived is not None:
+                archived.append(row.id)
+        f.write(compressor.flush())
+        f.flush()
+        os.fsync(f.fileno())
+        length = f.tell() - offset
+
+    session.archived_at = datetime.datetime.utcnow()
+    session.archive_path = archive_path
+    session.archive_offset = offset
+    session.archive_length = length
+    db.query(SummaryChunk).filter(SummaryChunk.session_id == session_id).delete(synchronize_session=False)
+    db.query(Transcript).filter(Transcript.session_id == session_id).delete(synchronize_session=False)
+    db.commit()
+
+    logger.info("archived session", extra={
+        "session_id": str(session_id), "transcripts": count,
+        "archive_path": archive_path, "bytes": length
+    })
+    return count
+
+def _decode_row(line):
+    values = json.loads(line)
+    for name in DATETIME_COLUMNS:
+        if values.get(name):
+            values[name] = datetime.datetime.fromisoformat(values[name])
+    for name in UUID_COLUMNS:
+        if values.get(name):
+            values[name] = uuid.UUID(values[name])
+    return types.SimpleNamespace(**values)
+
+def iter_archived_transcripts(session, base_dir=TRANSCRIPT_ARCHIVE_DIR):
+    """Yield an archived session's transcripts as row objects, in time order
+
+    The session's byte range is decompressed a block at a time, so memory
+    stays flat however long the session is.
+    """
+    decompressor = _decompressor(session.archive_path)
+    pending = b""
+    with open(_archive_file(session.archive_path, base_dir), "rb") as f:
+        f.seek(session.archive_offset)
+        remaining = session.archive_length
+        while remaining > 0:
+            block = f.read(min(ARCHIVE_READ_BYTES, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            lines = (pending + decompressor.decompress(block)).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield _decode_row(line)
+    if pending.strip():
+        yield _decode_row(pending)
+
+def read_archived_transcripts(session, base_dir=TRANSCRIPT_ARCHIVE_DIR):
+    """Load an archived session's transcripts as row objects, in time order"""
+    return list(iter_archived_transcripts(session, base_dir))
+
+def vacuum_database(engine, pages=VACUUM_PAGES, full=False):
+    """Return free pages to the filesystem - returns (freelist before, after)
+
+    Incremental vacuum needs auto_vacuum=INCREMENTAL, which an existing
+    database only picks up through one full VACUUM. That rewrite holds an
+    exclusive lock throughout, so it only runs when full is asked for; on a
+    database not yet converted an incremental run does nothing and after is
+    None. A full VACUUM renumbers rowids, so the full-text index is rebuilt
+    afterwards.
+    """
+    from .search import rebuild_search_index
+
+    if engine.dialect.name != "sqlite":
+        return None
+
+    connection = engine.raw_connection()
+    try:
+        # executescript() runs each statement to completion; a plain execute()
+        # of incremental_vacuum frees a single page
+        sqlite = connection.driver_connection
+        before = sqlite.execute("PRAGMA freelist_count").fetchone()[0]
+        if full:
+            sqlite.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+        elif sqlite.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return before, None
+        else:
+            sqlite.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        sqlite.executescript("PRAGMA wal_checkpoint(TRUNCATE);")
+        after = sqlite.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        connection.close()
+
+    if full:
+        rebuild_search_index(engine)
+    return before, after
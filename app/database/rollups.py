@@ -0,0 +1,244 @@
+"""
+Pre-aggregated activity and word-frequency rollups
+
+Two small tables back the analytics page so that no dashboard query reads
+the transcripts table:
+
+    activity_hourly  (bucket_start)  utterances, words, characters, speaking_ms
+    term_daily       (day, term)     occurrences
+
+save_transcripts() adds each batch to the rollups in the same transaction
+as the insert (ROLLUP_ON_WRITE); compaction likewise takes the merged
+fragments out and adds their paragraph. rebuild_rollups() recomputes whole
+days from the transcripts, including archived sessions, for backfilling an
+existing database or reconciling after re-transcription or a period with
+ROLLUP_ON_WRITE off; run it from manage_db.py rollup.
+
+Times are bucketed by the stored start_time, which the agent records in
+local time. Speaking time is the sum of duration_ms, so rows without audio
+count as utterances but add no speaking time.
+"""
+import datetime
+import os
+import re
+from collections import Counter, defaultdict
+
+from sqlalchemy import func, or_
+
+from .models import ActivityRollup, Session as DBSession, TermRollup, Transcript
+from .retention import iter_archived_transcripts
+
+ROLLUP_ON_WRITE = os.environ.get("ROLLUP_ON_WRITE", "true").lower() in ("1", "true", "yes")
+
+ROLLUP_BATCH_ROWS = 1000
+TERM_MIN_LENGTH = 3
+TERM_MAX_LENGTH = 64
+
+WORD_RE = re.compile(r"\S+")
+TERM_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+STOPWORDS = frozenset("""
+about above after again against all also and any are aren't because been before being below
+between both but can can't cannot could couldn't did didn't does doesn't doing don't down during
+each few for from further get got had hadn't has hasn't have haven't having her here hers herself
+him himself his how i'd i'll i'm i've into isn't it's its itself just let's like more most much
+mustn't myself nor not now off once only other ought our ours ourselves out over own really right
+same say said she she'd she'll she's should shouldn't some such than that that's the their theirs
+them themselves then there there's these they they'd they'll they're they've this those through
+too under until very was wasn't we'd we'll we're we've were weren't what what's when when's where
+where's which while who who's whom why why's will with won't would wouldn't yeah yes you you'd
+you'll you're you've your yours yourself yourselves okay gonna wanna thing things know think
+going one two well
+""".split())
+
+def terms(text):
+    """Lower-cased words of a transcript that count towards word frequencies"""
+    return [
+        term[:TERM_MAX_LENGTH] for term in TERM_RE.findall(text.lower())
+        if len(term) >= TERM_MIN_LENGTH and term not in STOPWORDS
+    ]
+
+class RollupDelta:
+    """Hourly and daily increments accumulated from a set of transcripts"""
+
+    def __init__(self):
+        self.hours = defaultdict(lambda: [0, 0, 0, 0])
+        self.terms = Counter()
+        # Days a removal touched, where buckets may have dropped to zero
+        self.removed_days = set()
+
+    def add(self, start_time, text, duration_ms, sign=1):
+        """Count a transcript, or take one back out with sign=-1"""
+        if start_time is None or not text:
+            return
+        hour = start_time.replace(minute=0, second=0, microsecond=0)
+        bucket = self.hours[hour]
+        bucket[0] += sign
+        bucket[1] += sign * len(WORD_RE.findall(text))
+        bucket[2] += sign * len(text)
+        bucket[3] += sign * (duration_ms or 0)
+        day = start_time.date()
+        for term in terms(text):
+            self.terms[(day, term)] += sign
+        if sign < 0:
+            self.removed_days.add(day)
+
+def _insert(db):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def apply_rollups(db, delta):
+    """Add a delta to the rollup tables with upserts, in the caller's transaction"""
+    insert = _insert(db)
+
+    if delta.hours:
+        table = ActivityRollup.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.bucket_start],
+            set_={name: table.c[name] + stmt.excluded[name]
+                  for name in ("utterances", "words", "characters", "speaking_ms")}
+        )
+        db.execute(stmt, [
+            {"bucket_start": hour, "utterances": values[0], "words": values[1],
+             "characters": values[2], "speaking_ms": values[3]}
+            for hour, values in delta.hours.items()
+        ])
+
+    if delta.terms:
+        table = TermRollup.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.term],
+            set_={"occurrences": table.c.occurrences + stmt.excluded.occurrences}
+        )
+        db.execute(stmt, [
+            {"day": day, "term": term, "occurrences": count}
+            for (day, term), count in delta.terms.items()
+        ])
+
+    for day in delta.removed_days:
+        start = datetime.datetime.combine(day, datetime.time())
+        db.query(ActivityRollup).filter(
+            ActivityRollup.bucket_start >= start,
+            ActivityRollup.bucket_start < start + datetime.timedelta(days=1),
+            ActivityRollup.utterances <= 0
+        ).delete(synchronize_session=False)
+        db.query(TermRollup).filter(
+            TermRollup.day == day, TermRollup.occurrences <= 0
+        ).delete(synchronize_session=False)
+
+def update_rollups(db, rows):
+    """Add a batch of new transcript row mappings to the rollups (write path)"""
+    delta = RollupDelta()
+    for row in rows:
+        delta.add(row.get("start_time"), row["text"], row.get("duration_ms"))
+    apply_rollups(db, delta)
+
+def rebuild_rollups(db, start=None, end=None):
+    """Recompute the rollups for the days from start up to end (default all)
+
+    start and end are dates. The range is cleared and re-aggregated from the
+    transcripts and the archive files in one transaction - the caller commits.
+    Returns the number of transcripts read.
+    """
+    start_at = datetime.datetime.combine(start, datetime.time()) if start else None
+    end_at = datetime.datetime.combine(end, datetime.time()) if end else None
+
+    hours = db.query(ActivityRollup)
+    days = db.query(TermRollup)
+    if start:
+        hours = hours.filter(ActivityRollup.bucket_start >= start_at)
+        days = days.filter(TermRollup.day >= start)
+    if end:
+        hours = hours.filter(ActivityRollup.bucket_start < end_at)
+        days = days.filter(TermRollup.day < end)
+    hours.delete(synchronize_session=False)
+    days.delete(synchronize_session=False)
+
+    def in_range(start_time):
+        return start_time is not None and (not start_at or start_time >= start_at) and \
+            (not end_at or start_time < end_at)
+
+    delta = RollupDelta()
+    count = 0
+
+    def flush():
+        nonlocal delta
+        apply_rollups(db, delta)
+        delta = RollupDelta()
+
+    query = db.query(Transcript.start_time, Transcript.text, Transcript.duration_ms)
+    if start:
+        query = query.filter(Transcript.start_time >= start_at)
+    if end:
+        query = query.filter(Transcript.start_time < end_at)
+    for row in query.yield_per(ROLLUP_BATCH_ROWS):
+        delta.add(row.start_time, row.text, row.duration_ms)
+        count += 1
+        if count % ROLLUP_BATCH_ROWS == 0:
+            flush()
+
+    # Archived sessions whose activity overlaps the range
+    archived = db.query(DBSession).filter(DBSession.archived_at.isnot(None))
+    last_activity = func.coalesce(DBSession.last_transcript_at, DBSession.started_at)
+    if start:
+        archived = archived.filter(last_activity >= start_at)
+    if end:
+        archived = archived.filter(or_(DBSession.started_at.is_(None), DBSession.started_at < end_at))
+    for session in archived.all():
+        for row in iter_archived_transcripts(session):
+            if in_range(row.start_time):
+                delta.add(row.start_time, row.text, row.duration_ms)
+                count += 1
+                if count % ROLLUP_BATCH_ROWS == 0:
+                    flush()
+        flush()
+
+    flush()
+    return count
+
+def activity(db, start, end, granularity="day"):
+    """Activity buckets in [start, end) - hourly, or summed per day"""
+    rows = db.query(ActivityRollup).filter(
+        ActivityRollup.bucket_start >= start,
+        ActivityRollup.bucket_start < end
+    ).order_by(ActivityRollup.bucket_start).all()
+
+    buckets = {}
+    for row in rows:
+        key = row.bucket_start if granularity == "hour" else row.bucket_start.date()
+        bucket = buckets.setdefault(key, {
+            "start": key.isoformat(), "utterances": 0, "words": 0, "characters": 0, "speaking_ms": 0
+        })
+        bucket["utterances"] += row.utterances
+        bucket["words"] += row.words
+        bucket["characters"] += row.characters
+        bucket["speaking_ms"] += row.speaking_ms
+
+    for bucket in buckets.values():
+        bucket["speaking_minutes"] = round(bucket["speaking_ms"] / 60000, 1)
+    return list(buckets.values())
+
+def heatmap(db, start, end):
+    """Utterances by weekday (Monday first) and hour of day in [start, end)"""
+    grid = [[0] * 24 for _ in range(7)]
+    rows = db.query(ActivityRollup.bucket_start, ActivityRollup.utterances).filter(
+        ActivityRollup.bucket_start >= start,
+        ActivityRollup.bucket_start < end
+    )
+    for bucket_start, utterances in rows:
+        grid[bucket_start.weekday()][bucket_start.hour] += utterances
+    return grid
+
+def top_terms(db, start, end, limit=50):
+    """Most frequent terms over the days from start up to end"""
+    total = func.sum(TermRollup.occurrences).label("occurrences")
+    rows = db.query(TermRollup.term, total).filter(
+        TermRollup.day >= start,
+        TermRollup.day < end
+    ).group_by(TermRollup.term).order_by(total.desc(), TermRollup.term).limit(limit)
+    return [{"term": term, "occurrences": int(occurrences)} for term, occurrences in rows]
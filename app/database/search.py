@@ -0,0 +1,148 @@
+"""
+Full-text search over transcripts using SQLite FTS5
+
+transcripts_fts is an external-content FTS5 table over transcripts.text, so
+the text is not stored twice. Triggers keep it in sync with every insert,
+update and delete on transcripts, including the agent's batched inserts.
+
+The index is keyed by the implicit rowid of transcripts. A full VACUUM may
+renumber those rowids, so rebuild the index afterwards
+(`python scripts/manage_db.py search-index`).
+"""
+from contextlib import nullcontext
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .models import Transcript
+
+FTS_TABLE = "transcripts_fts"
+
+# Control characters used to mark matches in snippets before HTML escaping
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+_CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text,
+        content='transcripts',
+        content_rowid='rowid',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS transcripts_fts_insert AFTER INSERT ON transcripts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.rowid, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transcripts_fts_delete AFTER DELETE ON transcripts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.rowid, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transcripts_fts_update AFTER UPDATE OF text ON transcripts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.rowid, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.rowid, new.text);
+    END""",
+]
+
+def search_supported(engine):
+    """Check whether an engine's database supports FTS5 search"""
+    return engine.dialect.name == "sqlite"
+
+def _begin(engine):
+    # Migrations pass a connection that is already inside their transaction
+    return nullcontext(engine) if isinstance(engine, Connection) else engine.begin()
+
+def create_search_index(engine):
+    """Create the FTS5 table and sync triggers if they don't exist"""
+    if not search_supported(engine):
+        print(f"Full-text search index skipped: {engine.dialect.name} is not SQLite")
+        return False
+
+    with _begin(engine) as conn:
+        for statement in _CREATE_STATEMENTS:
+            conn.execute(text(statement))
+    return True
+
+def drop_search_index(engine):
+    """Drop the FTS5 table (its triggers go away with the transcripts table)"""
+    if not search_supported(engine):
+        return False
+
+    with _begin(engine) as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    return True
+
+def rebuild_search_index(engine):
+    """Create the FTS5 index if needed and (re)build it from the transcripts table"""
+    if not create_search_index(engine):
+        return False
+
+    with _begin(engine) as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    return True
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query that ANDs quoted terms
+
+    Quoting each term keeps user input from being parsed as FTS5 syntax; a
+    trailing '*' on a term is kept as a prefix match.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return " ".join(terms)
+
+def highlight_snippet(snippet):
+    """HTML-escape a snippet and wrap the matched terms in <mark> tags"""
+    escaped = str(escape(snippet))
+    return Markup(escaped.replace(_MATCH_START, "<mark>").replace(_MATCH_END, "</mark>"))
+
+def search_transcripts(db, query, limit=50, session_id=None):
+    """Search transcript text, best bm25 matches first
+
+    Returns a list of dicts with the transcript id, session, start time, rank
+    and an HTML-safe highlighted snippet.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    sql = f"""
+        SELECT t.id, t.session_id, t.start_time, s.title AS session_title,
+               snippet({FTS_TABLE}, 0, :mark_start, :mark_end, '…', 16) AS snippet,
+               bm25({FTS_TABLE}) AS rank
+        FROM {FTS_TABLE}
+        JOIN transcripts t ON t.rowid = {FTS_TABLE}.rowid
+        JOIN sessions s ON s.id = t.session_id
+        WHERE {FTS_TABLE} MATCH :match
+    """
+    params = {
+        "match": match,
+        "mark_start": _MATCH_START,
+        "mark_end": _MATCH_END,
+        "limit": limit,
+    }
+    if session_id is not None:
+        sql += " AND t.session_id = :session_id"
+        params["session_id"] = session_id.hex
+    sql += " ORDER BY rank LIMIT :limit"
+
+    statement = text(sql).columns(
+        id=Transcript.id.type,
+        session_id=Transcript.session_id.type,
+        start_time=Transcript.start_time.type
+    )
+
+    results = []
+    for row in db.execute(statement, params):
+        results.append({
+            "id": row.id,
+            "session_id": row.session_id,
+            "session_title": row.session_title,
+            "start_time": row.start_time,
+            "snippet": highlight_snippet(row.snippet),
+            "rank": row.rank,
+        })
+    return results
@@ -0,0 +1,114 @@
+"""
+Per-job transcript sink for the voice transcript application
+
+Each LiveKit job gets its own TranscriptSink bound to the room it serves, so
+one worker process can record many rooms at once. The sink touches the
+database when the job starts (to create the session) and when it ends (to
+close it); everything in between goes through the shared TranscriptWriter.
+
+With an UtteranceMerger, final fragments are held back and written as
+paragraph rows once a pause, the length limit or flush_idle() closes them.
+"""
+import datetime
+import logging
+
+from .helpers import create_session, end_session, build_transcript_row
+
+logger = logging.getLogger(__name__)
+
+class TranscriptSink:
+    """Routes transcripts for a single room into its own database session"""
+
+    def __init__(self, writer, room_name="console_session", merger=None):
+        self.writer = writer
+        self.room_name = room_name
+        self.merger = merger
+        self.user_id = None
+        self.session_id = None
+        self.transcripts_submitted = 0
+
+    def open(self):
+        """Create the database session for this job"""
+        if self.session_id:
+            return True
+
+        self.user_id, self.session_id = create_session(self.room_name)
+        return self.session_id is not None
+
+    def write(self, text, confidence=None, is_final=True, duration_ms=None,
+              language="en-US", metadata=None, start_time=None, audio=None):
+        """Queue a transcript for this session on the shared writer"""
+        if not self.session_id:
+            logger.error("no database session, dropping transcript", extra={
+                "room": self.room_name
+            })
+            return False
+
+        if self.merger is None or not is_final:
+            return self._submit(build_transcript_row(
+                session_id=self.session_id,
+                user_id=self.user_id,
+                text=text,
+                confidence=confidence,
+                is_final=is_final,
+                duration_ms=duration_ms,
+                language=language,
+                metadata=metadata,
+                start_time=start_time,
+                audio=audio
+            ))
+
+        paragraph = self.merger.add({
+            "text": text,
+            "time": start_time or datetime.datetime.now(),
+            "duration_ms": duration_ms,
+            "confidence": confidence,
+            "language": language,
+            "metadata": metadata,
+            "audio": audio,
+        })
+        return self._submit_paragraph(paragraph) if paragraph else True
+
+    def flush_idle(self, idle_ms=None):
+        """Write the pending paragraph if no fragment arrived for idle_ms"""
+        if self.merger is None:
+            return False
+        idle = self.merger.idle_ms(datetime.datetime.now())
+        if idle is None or idle < (self.merger.max_gap_ms if idle_ms is None else idle_ms):
+            return False
+        return self._submit_paragraph(self.merger.flush())
+
+    def _submit_paragraph(self, paragraph):
+        first = paragraph["first"]
+        metadata = dict(first["metadata"] or {"source": "livekit_agent", "type": "user_speech"})
+        if paragraph["fragments"]:
+            metadata["fragments"] = paragraph["fragments"]
+
+        return self._submit(build_transcript_row(
+            session_id=self.session_id,
+            user_id=self.user_id,
+            text=paragraph["text"],
+            confidence=paragraph["confidence"],
+            duration_ms=paragraph["duration_ms"],
+            language=first["language"],
+            metadata=metadata,
+            start_time=paragraph["start_time"],
+            end_time=paragraph["end_time"],
+            audio=paragraph["audio"]
+        ))
+
+    def _submit(self, row):
+        if self.writer.submit(row):
+            self.transcripts_submitted += 1
+            return True
+        return False
+
+    def close(self, timeout=10.0):
+        """Flush queued transcripts and mark the session as ended"""
+        if not self.session_id:
+            return False
+
+        if self.merger is not None and self.merger.fragments:
+            self._submit_paragraph(self.merger.flush())
+        self.writer.flush(timeout)
+        return end_session(self.session_id)
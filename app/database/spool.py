@@ -0,0 +1,456 @@
+"""
+Crash-safe local spool for transcript writes
+
+With a spool, the TranscriptWriter appends each batch of rows to a local
+append-only file and fsyncs it (one fsync per batch) instead of inserting
+it, and a SpoolReplayer thread drains the spool into the database. A locked,
+full or restarting database only makes the spool grow - the agent keeps
+accepting transcripts at the same rate - and a crash loses nothing that was
+spooled, because the rows are replayed on the next start.
+
+Each writer process owns a directory under TRANSCRIPT_SPOOL_DIR, holding an
+flock on it for as long as it runs:
+
+    TRANSCRIPT_SPOOL_DIR/<pid>-<random>/
+        lock
+        checkpoint          "<segment> <offset>" of the first unreplayed record
+        000000000001.log    segments, rotated past SPOOL_SEGMENT_BYTES
+
+A record is one line, "<crc32 hex> <json>\\n"; a torn or corrupt record left
+by a crash fails its checksum and is skipped. Replays are idempotent: rows
+whose Transcript.id is already stored are skipped, so a crash between a
+commit and the checkpoint update neither duplicates rows nor their counters.
+Directories left behind by processes that died are adopted by the next
+replayer to start, or drained with manage_db.py spool-replay.
+"""
+import collections
+import datetime
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+from sqlalchemy.exc import IntegrityError
+
+from .helpers import save_transcripts
+from app.metrics import (
+    SPOOL_CORRUPT_RECORDS, SPOOL_FSYNC_SECONDS, SPOOL_REPLAY_ERRORS, SPOOL_ROWS_APPENDED,
+    SPOOL_ROWS_REJECTED, SPOOL_ROWS_REPLAYED
+)
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_SPOOL_ENABLED = os.environ.get("TRANSCRIPT_SPOOL_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSCRIPT_SPOOL_DIR = os.environ.get("TRANSCRIPT_SPOOL_DIR", "transcript_spool")
+SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_REPLAY_BATCH = int(os.environ.get("SPOOL_REPLAY_BATCH", "500"))
+SPOOL_RETRY_MAX_SECONDS = 30.0
+
+REJECTED_FILE = "rejected.log"
+UUID_FIELDS = ("id", "session_id", "user_id")
+TIME_FIELDS = ("start_time", "end_time")
+
+def encode_record(row, spooled_at):
+    """One spool line for a transcript row mapping"""
+    fields = dict(row)
+    for name in UUID_FIELDS:
+        if fields.get(name) is not None:
+            fields[name] = str(fields[name])
+    for name in TIME_FIELDS:
+        if fields.get(name) is not None:
+            fields[name] = fields[name].isoformat()
+    payload = json.dumps({"t": spooled_at, "row": fields}, separators=(",", ":")).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+def decode_record(line):
+    """(row, spooled_at) from a spool line, or None if it is torn or corrupt"""
+    checksum, _, payload = line.rstrip(b"\n").partition(b" ")
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        record = json.loads(payload)
+    except ValueError:
+        return None
+
+    row = record["row"]
+    for name in UUID_FIELDS:
+        if row.get(name) is not None:
+            row[name] = uuid.UUID(row[name])
+    for name in TIME_FIELDS:
+        if row.get(name) is not None:
+            row[name] = datetime.datetime.fromisoformat(row[name])
+    return row, record["t"]
+
+def segment_path(directory, segment):
+    return Path(directory) / f"{segment:012d}.log"
+
+def list_segments(directory):
+    return sorted(int(path.stem) for path in Path(directory).glob("*.log") if path.stem.isdigit())
+
+def read_checkpoint(directory):
+    """Position (segment, offset) of the first unreplayed record"""
+    try:
+        segment, offset = (Path(directory) / "checkpoint").read_text().split()
+        return int(segment), int(offset)
+    except (OSError, ValueError):
+        segments = list_segments(directory)
+        return (segments[0] if segments else 1), 0
+
+def write_checkpoint(directory, position):
+    """Record replay progress and delete the segments before it
+
+    Not fsynced: a checkpoint lost in a crash only replays rows that the
+    idempotent insert then skips.
+    """
+    tmp = Path(directory) / "checkpoint.tmp"
+    tmp.write_text(f"{position[0]} {position[1]}\n")
+    os.replace(tmp, Path(directory) / "checkpoint")
+    for segment in list_segments(directory):
+        if segment < position[0]:
+            segment_path(directory, segment).unlink()
+
+def read_records(directory, position, limit, end=None):
+    """Up to limit spooled records from position - returns (records, position, bytes_read)
+
+    Reading stops at end (the last fsynced position of a live spool) when
+    given, otherwise at the end of the newest segment. A torn record at the
+    end of a segment is left unread; corrupt records are skipped.
+    """
+    records = []
+    bytes_read = 0
+    segment, offset = position
+
+    while len(records) < limit and (end is None or (segment, offset) < end):
+        path = segment_path(directory, segment)
+        if path.exists():
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while len(records) < limit and (end is None or (segment, offset) < end):
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    bytes_read += len(line)
+                    record = decode_record(line)
+                    if record is None:
+                        SPOOL_CORRUPT_RECORDS.inc()
+                        logger.warning("skipping corrupt spool record", extra={
+                            "segment": str(path), "offset": offset - len(line)
+                        })
+                        continue
+                    records.append(record)
+            if len(records) >= limit:
+                break
+
+        later = [n for n in list_segments(directory) if n > segment]
+        if not later:
+            break
+        # A torn tail is followed by a newer segment only if its writer moved on
+        segment, offset = later[0], 0
+
+    return records, (segment, offset), bytes_read
+
+def insert_rows(directory, rows):
+    """Insert spooled rows idempotently - returns rows inserted
+
+    Rows the database refuses outright (an integrity error even on their
+    own) are appended to rejected.log next to the spool directories rather
+    than blocking the spool forever. Any other error propagates so the
+    batch is retried.
+    """
+    try:
+        return save_transcripts(rows, skip_existing=True)
+    except IntegrityError as e:
+        if len(rows) > 1:
+            return sum(insert_rows(directory, [row]) for row in rows)
+        SPOOL_ROWS_REJECTED.inc()
+        logger.error("database rejected spooled transcript", extra={
+            "transcript_id": str(rows[0]["id"]), "error": str(e.orig)
+        })
+        with open(Path(directory).parent / REJECTED_FILE, "ab") as f:
+            f.write(encode_record(rows[0], time.time()))
+        return 0
+
+def replay_batch(directory, position, end=None, batch_size=SPOOL_REPLAY_BATCH):
+    """Insert the next batch of a spool directory - returns (records, position, bytes_read)
+
+    The checkpoint only moves once the batch is committed; if the insert
+    raises, the same records are read again on the next attempt.
+    """
+    records, new_position, bytes_read = read_records(directory, position, batch_size, end)
+    if records:
+        insert_rows(directory, [row for row, _ in records])
+        SPOOL_ROWS_REPLAYED.inc(len(records))
+    if new_position != position:
+        write_checkpoint(directory, new_position)
+    return records, new_position, bytes_read
+
+def lock_directory(directory, blocking=True):
+    """Take the spool directory's flock - returns the open lock file, or None if it is held"""
+    lock_file = open(Path(directory) / "lock", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def remove_directory(directory, position):
+    """Delete a fully replayed spool directory, reporting any torn tail left unread"""
+    torn = sum(path.stat().st_size for path in Path(directory).glob("*.log")) - position[1]
+    if torn > 0:
+        logger.warning("discarding torn spool tail", extra={"directory": str(directory), "bytes": torn})
+    shutil.rmtree(directory)
+
+def drain_directory(directory, batch_size=SPOOL_REPLAY_BATCH):
+    """Replay an abandoned spool directory to the end and remove it - returns rows read
+
+    The caller must hold the directory's lock.
+    """
+    position = read_checkpoint(directory)
+    total = 0
+    while True:
+        records, new_position, _ = replay_batch(directory, position, batch_size=batch_size)
+        total += len(records)
+        if new_position == position:
+            break
+        position = new_position
+    remove_directory(directory, position)
+    return total
+
+def abandoned_directories(root=TRANSCRIPT_SPOOL_DIR, exclude=None):
+    """Spool directories under root whose owner is gone - returns [(directory, lock_file)]
+
+    Each returned directory is locked for the caller; close the lock file
+    to release it.
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    found = []
+    for directory in sorted(root.iterdir()):
+        if not directory.is_dir() or directory == exclude or directory.name.startswith("."):
+            continue
+        lock_file = lock_directory(directory, blocking=False)
+        if lock_file is not None:
+            found.append((directory, lock_file))
+    return found
+
+class TranscriptSpool:
+    """Append-only, fsynced log of transcript rows owned by one process"""
+
+    def __init__(self, root=TRANSCRIPT_SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES):
+        self.root = Path(root)
+        self.segment_bytes = segment_bytes
+        self.directory = None
+
+        self._lock = threading.Lock()
+        self.changed = threading.Condition(self._lock)
+        self._lock_file = None
+        self._file = None
+        self.segment = 1
+        self.end = (1, 0)
+        # (end position, spooled_at) per appended batch not yet replayed
+        self._pending = collections.deque()
+
+        self.rows_appended = 0
+        self.bytes_appended = 0
+        self.bytes_replayed = 0
+
+    def open(self):
+        """Create and lock this process's spool directory"""
+        with self._lock:
+            if self.directory is not None:
+                return self
+            name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            # Locked under a hidden name first so no replayer can adopt it half made
+            hidden = self.root / f".{name}"
+            hidden.mkdir(parents=True)
+            self._lock_file = lock_directory(hidden)
+            directory = hidden.rename(self.root / name)
+            self._file = open(segment_path(directory, self.segment), "ab")
+            self.directory = directory
+        logger.info("transcript spool opened", extra={"directory": str(directory)})
+        return self
+
+    def append(self, rows):
+        """Durably append a batch of transcript rows (one write and one fsync)
+
+        Raises OSError (e.g. disk full) with the spool left as it was.
+        """
+        if self.directory is None:
+            self.open()
+
+        spooled_at = time.time()
+        data = b"".join(encode_record(row, spooled_at) for row in rows)
+        started = time.perf_counter()
+        with self._lock:
+            if self.end[1] and self.end[1] + len(data) > self.segment_bytes:
+                self._file.close()
+                self.segment += 1
+                self._file = open(segment_path(self.directory, self.segment), "ab")
+                self.end = (self.segment, 0)
+                # Make the new segment's directory entry durable too
+                dir_fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+
+            try:
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError:
+                # Drop a partial write so the next record starts at end
+                try:
+                    self._file.truncate(self.end[1])
+                except OSError:
+                    pass
+                raise
+
+            self.end = (self.segment, self.end[1] + len(data))
+            self._pending.append((self.end, spooled_at))
+            self.rows_appended += len(rows)
+            self.bytes_appended += len(data)
+            self.changed.notify_all()
+        SPOOL_FSYNC_SECONDS.observe(time.perf_counter() - started)
+        SPOOL_ROWS_APPENDED.inc(len(rows))
+
+    def replayed(self, position, bytes_read):
+        """Note that everything before position has been replayed"""
+        with self._lock:
+            self.bytes_replayed += bytes_read
+            while self._pending and self._pending[0][0] <= position:
+                self._pending.popleft()
+
+    def stats(self):
+        """Pending bytes and lag (age of the oldest unreplayed row)"""
+        with self._lock:
+            return {
+                "spool_rows_appended": self.rows_appended,
+                "spool_pending_bytes": self.bytes_appended - self.bytes_replayed,
+                "spool_lag_seconds": time.time() - self._pending[0][1] if self._pending else 0.0,
+            }
+
+    def close(self):
+        """Close the spool; its directory is removed if everything was replayed
+
+        Otherwise the directory is unlocked and left for the next replayer.
+        """
+        with self._lock:
+            if self.directory is None:
+                return
+            self._file.close()
+            if not self._pending:
+                shutil.rmtree(self.directory)
+            else:
+                logger.warning("transcript spool closed with unreplayed rows", extra={
+                    "directory": str(self.directory), "bytes": self.bytes_appended - self.bytes_replayed
+                })
+            self._lock_file.close()
+            self.directory = None
+
+class SpoolReplayer:
+    """Drains a TranscriptSpool, and spools abandoned by dead processes, into the database"""
+
+    def __init__(self, spool, batch_size=SPOOL_REPLAY_BATCH, retry_max=SPOOL_RETRY_MAX_SECONDS):
+        self.spool = spool
+        self.batch_size = batch_size
+        self.retry_max = retry_max
+        self._thread = None
+        self._stop = threading.Event()
+        # [directory, lock file, position] of adopted directories
+        self._orphans = []
+
+        self.rows_replayed = 0
+        self.replay_errors = 0
+
+    def start(self):
+        """Open the spool, adopt abandoned spool directories and start the replayer thread"""
+        if self._thread and self._thread.is_alive():
+            return self
+
+        self.spool.open()
+        self._orphans = [
+            [directory, lock_file, read_checkpoint(directory)]
+            for directory, lock_file in abandoned_directories(self.spool.root, exclude=self.spool.directory)
+        ]
+        if self._orphans:
+            logger.info("adopting abandoned transcript spools", extra={
+                "directories": [str(orphan[0]) for orphan in self._orphans]
+            })
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout=10.0):
+        """Replay what the database accepts within timeout, then stop and close the spool"""
+        if not self._thread:
+            return
+        with self.spool.changed:
+            self._stop.set()
+            self.spool.changed.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("spool replayer did not finish", extra={"timeout_s": timeout})
+            return
+        self._thread = None
+        for orphan in self._orphans:
+            orphan[1].close()
+        self._orphans = []
+        self.spool.close()
+
+    def _run(self):
+        position = (self.spool.segment, 0)
+        delay = 0.0
+
+        while True:
+            with self.spool.changed:
+                # Own rows first; adopted directories only while not stopping
+                while True:
+                    end = self.spool.end
+                    if position < end or (self._orphans and not self._stop.is_set()):
+                        break
+                    if self._stop.is_set():
+                        return
+                    self.spool.changed.wait()
+
+            try:
+                if position < end:
+                    records, position, bytes_read = replay_batch(
+                        self.spool.directory, position, end, self.batch_size
+                    )
+                    self.spool.replayed(position, bytes_read)
+                    self.rows_replayed += len(records)
+                else:
+                    self._replay_orphan()
+                delay = 0.0
+            except Exception as e:
+                self.replay_errors += 1
+                SPOOL_REPLAY_ERRORS.inc()
+                if self._stop.is_set():
+                    return
+                delay = min(self.retry_max, delay * 2 or 0.5)
+                logger.error("spool replay failed, retrying", extra={
+                    "error": str(e), "retry_in_s": delay
+                })
+                self._stop.wait(delay)
+
+    def _replay_orphan(self):
+        orphan = self._orphans[0]
+        directory, lock_file, position = orphan
+        records, orphan[2], _ = replay_batch(directory, position, batch_size=self.batch_size)
+        self.rows_replayed += len(records)
+        if orphan[2] == position:
+            remove_directory(directory, position)
+            lock_file.close()
+            self._orphans.pop(0)
+            logger.info("abandoned transcript spool replayed", extra={"directory": str(directory)})
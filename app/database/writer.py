@@ -0,0 +1,209 @@
+"""
+Background transcript writer for the voice transcript application
+
+The agent hands finished utterances to a TranscriptWriter instead of committing
+them on the event loop. A single thread drains a bounded queue and inserts the
+rows in batches, flushing when the batch is full or the oldest row has waited
+longer than the flush interval.
+
+Given a TranscriptSpool, the writer appends each batch to the spool instead
+and a SpoolReplayer inserts it (app/database/spool.py), so a slow or
+unavailable database never holds up or loses transcripts. A row that finds
+the queue full is then appended to the spool directly; without a spool the
+caller waits up to submit_timeout for room before the row is dropped.
+"""
+import logging
+import queue
+import threading
+import time
+
+from .helpers import save_transcripts
+from app.metrics import WRITER_DIVERTED, WRITER_DROPPED, WRITER_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class TranscriptWriter:
+    """Batches transcript rows from a bounded queue into bulk inserts"""
+
+    def __init__(self, max_queue_size=1000, batch_size=50, flush_interval=0.5, spool=None,
+                 submit_timeout=0.1):
+        self.batch_size = batch_size
+        self.spool = spool
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_diverted = 0
+        self.rows_dropped = 0
+        self.batches_flushed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        """Start the writer thread"""
+        if self._thread and self._thread.is_alive():
+            return self
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="transcript-writer",
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def submit(self, row):
+        """Queue a transcript row - returns False if it had to be dropped
+
+        Called on the agent's event loop. When the queue is full the row is
+        spooled directly (one fsync), or without a spool the call waits at
+        most submit_timeout for room; only then is the row dropped and counted.
+        """
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            pass
+
+        if self.spool is not None:
+            try:
+                self.spool.append([row])
+                with self._lock:
+                    self.rows_diverted += 1
+                WRITER_DIVERTED.inc()
+                logger.warning("transcript queue full, spooling transcript directly", extra={
+                    "queue_capacity": self._queue.maxsize
+                })
+                return True
+            except OSError as e:
+                logger.error("transcript spool append failed", extra={"rows": 1, "error": str(e)})
+
+        try:
+            self._queue.put(row, timeout=self.submit_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rows_dropped += 1
+            WRITER_DROPPED.inc()
+            logger.warning("transcript queue full, dropping transcript", extra={
+                "queue_capacity": self._queue.maxsize, "waited_s": self.submit_timeout
+            })
+            return False
+
+    def flush(self, timeout=10.0):
+        """Block until every row queued before this call has been written (or spooled)"""
+        if not self._thread:
+            return False
+
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Flush everything still queued and stop the writer thread"""
+        if not self._thread:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("transcript writer did not finish", extra={
+                "timeout_s": timeout, "queued": self._queue.qsize()
+            })
+        self._thread = None
+
+    def stats(self):
+        """Return counters for queue depth, throughput and flush latency"""
+        with self._lock:
+            avg_flush_ms = (self.total_flush_ms / self.batches_flushed
+                            if self.batches_flushed else 0.0)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "rows_written": self.rows_written,
+                "rows_failed": self.rows_failed,
+                "rows_diverted": self.rows_diverted,
+                "rows_dropped": self.rows_dropped,
+                "batches_flushed": self.batches_flushed,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": avg_flush_ms,
+                "max_flush_ms": self.max_flush_ms,
+            }
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+
+            if isinstance(item, threading.Event):
+                self._flush(batch)
+                batch = []
+                item.set()
+                continue
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch):
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            if self.spool is None:
+                save_transcripts(batch)
+            else:
+                try:
+                    self.spool.append(batch)
+                except OSError as e:
+                    logger.error("transcript spool append failed, writing to the database", extra={
+                        "rows": len(batch), "error": str(e)
+                    })
+                    save_transcripts(batch, skip_existing=True)
+            failed = 0
+        except Exception as e:
+            logger.error("transcript batch write failed", extra={
+                "rows": len(batch), "error": str(e)
+            })
+            failed = len(batch)
+        elapsed = time.perf_counter() - started
+        elapsed_ms = elapsed * 1000
+        WRITER_FLUSH_SECONDS.observe(elapsed)
+        logger.debug("transcript batch flushed", extra={
+            "rows": len(batch), "failed": failed, "flush_ms": round(elapsed_ms, 2)
+        })
+
+        with self._lock:
+            self.batches_flushed += 1
+            self.rows_written += len(batch) - failed
+            self.rows_failed += failed
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
@@ -0,0 +1,232 @@
+"""
+Bulk export of sessions to NDJSON, SRT/VTT subtitles and Parquet
+
+Rows are read per session in (start_time, id) order through yield_per, which
+uses a server-side cursor where the backend supports one, so memory stays
+constant regardless of session length. Archived sessions are read back from
+their archive file. scripts/manage_db.py export writes one file per session
+and can fan sessions out over a process pool; the web app streams the same
+writers through /api/export.
+
+Subtitle cue times are relative to the session's first transcript. Parquet needs the
+optional pyarrow package.
+"""
+import datetime
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from app.database.models import Session as DBSession, Transcript
+from app.database.retention import iter_archived_transcripts
+
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "1000"))
+FORMATS = ("ndjson", "srt", "vtt", "parquet")
+SUBTITLE_FORMATS = ("srt", "vtt")
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Cue length when a transcript has no duration
+DEFAULT_CUE_MS = 2000
+
+EXPORT_COLUMNS = (
+    Transcript.id,
+    Transcript.session_id,
+    Transcript.start_time,
+    Transcript.end_time,
+    Transcript.duration_ms,
+    Transcript.text,
+    Transcript.confidence,
+    Transcript.language,
+    Transcript.transcript_metadata,
+)
+
+def select_sessions(db, session_ids=None, start=None, end=None):
+    """Sessions to export, by id and/or started_at in [start, end), oldest first"""
+    query = db.query(DBSession.id, DBSession.title, DBSession.started_at)
+    if session_ids:
+        query = query.filter(DBSession.id.in_(session_ids))
+    if start:
+        query = query.filter(DBSession.started_at >= start)
+    if end:
+        query = query.filter(DBSession.started_at < end)
+    return query.order_by(DBSession.started_at, DBSession.id).all()
+
+def iter_session_rows(db, session_id):
+    """Yield one session's transcripts in time order with constant memory"""
+    session = db.query(DBSession).filter(DBSession.id == session_id).one()
+    if session.archived_at:
+        yield from iter_archived_transcripts(session)
+        return
+
+    query = db.query(*EXPORT_COLUMNS).filter(
+        Transcript.session_id == session_id
+    ).order_by(Transcript.start_time, Transcript.id)
+    yield from query.yield_per(EXPORT_BATCH_ROWS)
+
+def row_to_record(row):
+    """Plain dict for one exported transcript"""
+    return {
+        "id": str(row.id),
+        "session_id": str(row.session_id),
+        "start_time": row.start_time.isoformat() if row.start_time else None,
+        "end_time": row.end_time.isoformat() if row.end_time else None,
+        "duration_ms": row.duration_ms,
+        "text": row.text,
+        "confidence": row.confidence,
+        "language": row.language,
+        "metadata": row.transcript_metadata,
+    }
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row_to_record(row)) + "\n"
+
+def _cue_bounds(row, origin):
+    start = row.start_time
+    if row.end_time and row.end_time > start:
+        end = row.end_time
+    else:
+        end = start + datetime.timedelta(milliseconds=row.duration_ms or DEFAULT_CUE_MS)
+    return start - origin, end - origin
+
+def _timestamp(offset, separator):
+    ms = int(offset.total_seconds() * 1000)
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+def subtitle_lines(rows, fmt):
+    """Yield an SRT or WebVTT document, one cue per transcript
+
+    Cue times are offsets from the first transcript. Session.started_at is
+    not used: it is stored in UTC while start_time is the agent's local time.
+    """
+    origin = None
+    separator = "," if fmt == "srt" else "."
+    if fmt == "vtt":
+        yield "WEBVTT\n\n"
+
+    for index, row in enumerate(rows, start=1):
+        if origin is None:
+            origin = row.start_time
+        start, end = _cue_bounds(row, origin)
+        # A blank line ends a cue, so collapse any inside the text
+        text = "\n".join(line for line in row.text.strip().splitlines() if line.strip())
+        timing = f"{_timestamp(start, separator)} --> {_timestamp(end, separator)}"
+        if fmt == "srt":
+            yield f"{index}\n{timing}\n{text}\n\n"
+        else:
+            yield f"{timing}\n{text}\n\n"
+
+def write_parquet(rows, destination):
+    """Write rows to a Parquet file (path or binary file object) in row groups"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires: pip install pyarrow")
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("session_id", pa.string()),
+        ("start_time", pa.timestamp("us")),
+        ("end_time", pa.timestamp("us")),
+        ("duration_ms", pa.int64()),
+        ("text", pa.string()),
+        ("confidence", pa.float64()),
+        ("language", pa.string()),
+        ("metadata", pa.string()),
+    ])
+
+    def flush(writer, batch):
+        columns = {name: [record[name] for record in batch] for name in schema.names}
+        writer.write_table(pa.table(columns, schema=schema))
+
+    count = 0
+    with pq.ParquetWriter(destination, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            batch.append({
+                "id": str(row.id),
+                "session_id": str(row.session_id),
+                "start_time": row.start_time,
+                "end_time": row.end_time,
+                "duration_ms": row.duration_ms,
+                "text": row.text,
+                "confidence": row.confidence,
+                "language": row.language,
+                "metadata": json.dumps(row.transcript_metadata) if row.transcript_metadata is not None else None,
+            })
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                flush(writer, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            flush(writer, batch)
+            count += len(batch)
+    return count
+
+def export_session(db, session_id, fmt, path):
+    """Write one session to path - returns the number of transcripts
+
+    The file is written under a .part name and renamed when complete.
+    """
+    rows = iter_session_rows(db, session_id)
+    partial = f"{path}.part"
+    if fmt == "parquet":
+        count = write_parquet(rows, partial)
+        os.replace(partial, path)
+        return count
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    lines = ndjson_lines(counted()) if fmt == "ndjson" else subtitle_lines(counted(), fmt)
+    with open(partial, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(partial, path)
+    return count
+
+def _export_worker(connection_string, session_id, fmt, path):
+    # Runs in a worker process with its own engine
+    from app.database import init_db
+
+    _, SessionLocal = init_db(connection_string)
+    with SessionLocal() as db:
+        return export_session(db, session_id, fmt, path)
+
+def export_sessions(connection_string, sessions, fmt, output_dir, workers=1):
+    """Export each session to output_dir/<session_id>.<fmt> - yields (session_id, path, count)"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(session.id, output_dir / f"{session.id}.{fmt}") for session in sessions]
+
+    if workers <= 1:
+        for session_id, path in jobs:
+            yield session_id, path, _export_worker(connection_string, session_id, fmt, path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_export_worker, connection_string, session_id, fmt, path): (session_id, path)
+            for session_id, path in jobs
+        }
+        for future in as_completed(futures):
+            session_id, path = futures[future]
+            yield session_id, path, future.result()
+
+def parse_session_ids(values):
+    """Parse session id strings, raising ValueError on a bad one"""
+    return [uuid.UUID(value) for value in values]
@@ -0,0 +1,256 @@
+"""
+Background summarization jobs for the web app
+
+Summaries are generated on a small in-process thread pool so that no request
+thread waits on the LLM. Jobs are recorded in the summary_jobs table; a
+session only ever has one pending or running job, so concurrent page loads
+share the same generation.
+
+Several web app processes can share the database, so every job records the
+process that owns it and a heartbeat the owner refreshes while the job is in
+flight. Only jobs whose owner has stopped heartbeating (a crashed or
+restarted process) are failed as interrupted.
+
+A summary streamed to a viewer (/api/analyze/<id>/stream) is recorded as the
+session's running job too, so a summary POST waits on it instead of
+generating again, and later viewers in the same process attach to it.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_
+
+from app.database import get_db
+from app.database.models import SummaryJob
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+IN_FLIGHT = (JOB_PENDING, JOB_RUNNING)
+
+SUMMARY_JOB_HEARTBEAT = float(os.environ.get("SUMMARY_JOB_HEARTBEAT_SECONDS", "15"))
+# An in-flight job whose owner has been silent this long is abandoned
+SUMMARY_JOB_STALE = datetime.timedelta(seconds=SUMMARY_JOB_HEARTBEAT * 4)
+
+def job_to_dict(job):
+    """Serialize a SummaryJob for the JSON APIs and templates"""
+    if job is None:
+        return None
+
+    return {
+        'id': str(job.id),
+        'session_id': str(job.session_id),
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+class SummaryJobQueue:
+    """Runs session summarization jobs on a background thread pool"""
+
+    def __init__(self, handler, workers=1):
+        self.handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary-job")
+        self._lock = threading.Lock()
+        # The random suffix keeps a restarted process that reuses the pid apart
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heartbeat = None
+        # session_id -> [job id, attached viewers, finished] for streamed summaries
+        self._streams = {}
+
+    def submit(self, session_id):
+        """Queue a summary job for a session, reusing one already in flight"""
+        with self._lock:
+            db = next(get_db())
+            try:
+                self._fail_abandoned(db)
+                job = db.query(SummaryJob).filter(
+                    SummaryJob.session_id == session_id,
+                    SummaryJob.status.in_(IN_FLIGHT)
+                ).order_by(SummaryJob.created_at.desc()).first()
+                if job:
+                    return job_to_dict(job)
+
+                job = SummaryJob(
+                    session_id=session_id, status=JOB_PENDING,
+                    owner=self.owner, heartbeat_at=datetime.datetime.utcnow()
+                )
+                db.add(job)
+                db.commit()
+                data = job_to_dict(job)
+            finally:
+                db.close()
+
+            self._start_heartbeat()
+
+        self._executor.submit(self._run, job.id, session_id)
+        logger.info("queued summary job", extra={"job_id": data['id'], "session_id": str(session_id)})
+        return data
+
+    def attach_stream(self, session_id):
+        """Record a streamed summary as the session's running job
+
+        Returns the job, shared with every viewer already streaming the
+        session in this process, or None when another job is in flight.
+        Every successful call must be paired with detach_stream().
+        """
+        with self._lock:
+            stream = self._streams.get(session_id)
+            if stream:
+                stream[1] += 1
+                return self.latest(session_id)
+
+            db = next(get_db())
+            try:
+                self._fail_abandoned(db)
+                if db.query(SummaryJob.id).filter(
+                    SummaryJob.session_id == session_id,
+                    SummaryJob.status.in_(IN_FLIGHT)
+                ).first():
+                    db.commit()
+                    return None
+
+                now = datetime.datetime.utcnow()
+                job = SummaryJob(
+                    session_id=session_id, status=JOB_RUNNING, started_at=now,
+                    owner=self.owner, heartbeat_at=now
+                )
+                db.add(job)
+                db.commit()
+                data = job_to_dict(job)
+            finally:
+                db.close()
+
+            self._streams[session_id] = [job.id, 1, False]
+            self._start_heartbeat()
+        logger.info("streaming summary job", extra={"job_id": data['id'], "session_id": str(session_id)})
+        return data
+
+    def is_streaming(self, session_id):
+        """Whether a viewer in this process is streaming the session's summary"""
+        with self._lock:
+            return session_id in self._streams
+
+    def detach_stream(self, session_id, finished=False, error=None):
+        """Release a viewer's hold on a streamed summary job
+
+        The job is done once any viewer has seen the summary saved; when the
+        last viewer leaves before that it is failed.
+        """
+        with self._lock:
+            stream = self._streams[session_id]
+            stream[1] -= 1
+            stream[2] = stream[2] or finished
+            if stream[1]:
+                return
+            del self._streams[session_id]
+
+        job_id, _, finished = stream
+        if finished:
+            self._update(job_id, status=JOB_DONE, finished_at=datetime.datetime.utcnow())
+        else:
+            self._update(job_id, status=JOB_FAILED, finished_at=datetime.datetime.utcnow(),
+                         error=error or "The summary stream was closed before it finished")
+
+    def latest(self, session_id):
+        """Return the most recent job for a session, or None"""
+        db = next(get_db())
+        try:
+            job = db.query(SummaryJob).filter(
+                SummaryJob.session_id == session_id
+            ).order_by(SummaryJob.created_at.desc()).first()
+            return job_to_dict(job)
+        finally:
+            db.close()
+
+    def fail_interrupted(self):
+        """Mark in-flight jobs whose owning process has stopped as failed
+
+        Jobs owned by other live processes keep their heartbeat fresh and are
+        left alone.
+        """
+        db = next(get_db())
+        try:
+            count = self._fail_abandoned(db)
+            db.commit()
+            if count:
+                logger.info("failed interrupted summary jobs", extra={"jobs": count})
+            return count
+        except Exception as e:
+            logger.exception("summary job recovery failed", extra={"error": str(e)})
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+    def _fail_abandoned(self, db):
+        now = datetime.datetime.utcnow()
+        return db.query(SummaryJob).filter(
+            SummaryJob.status.in_(IN_FLIGHT),
+            or_(SummaryJob.heartbeat_at.is_(None), SummaryJob.heartbeat_at < now - SUMMARY_JOB_STALE)
+        ).update({
+            SummaryJob.status: JOB_FAILED,
+            SummaryJob.error: "Interrupted by a server restart",
+            SummaryJob.finished_at: now
+        }, synchronize_session=False)
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._beat, name="summary-job-heartbeat", daemon=True
+            )
+            self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(SUMMARY_JOB_HEARTBEAT)
+            db = next(get_db())
+            try:
+                db.query(SummaryJob).filter(
+                    SummaryJob.owner == self.owner,
+                    SummaryJob.status.in_(IN_FLIGHT)
+                ).update({SummaryJob.heartbeat_at: datetime.datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                logger.exception("summary job heartbeat failed", extra={"owner": self.owner, "error": str(e)})
+                db.rollback()
+            finally:
+                db.close()
+
+    def _run(self, job_id, session_id):
+        self._update(job_id, status=JOB_RUNNING, started_at=datetime.datetime.utcnow())
+        try:
+            self.handler(session_id)
+            self._update(job_id, status=JOB_DONE, finished_at=datetime.datetime.utcnow())
+        except Exception as e:
+            logger.exception("summary job failed", extra={
+                "job_id": str(job_id), "session_id": str(session_id), "error": str(e)
+            })
+            self._update(job_id, status=JOB_FAILED, error=str(e),
+                         finished_at=datetime.datetime.utcnow())
+
+    def _update(self, job_id, **fields):
+        db = next(get_db())
+        try:
+            db.query(SummaryJob).filter(SummaryJob.id == job_id).update(
+                {getattr(SummaryJob, name): value for name, value in fields.items()},
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            logger.exception("summary job update failed", extra={"job_id": str(job_id), "error": str(e)})
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,198 @@
+"""
+Live transcript feed for the web app
+
+The agent writes transcripts from another process, so the web app learns about
+them by polling. One poller thread runs per watched session, however many
+viewers it has, and fans new rows out to each subscriber's queue.
+
+Rows do not commit in (start_time, id) order: rows with audio wait for their
+segment to be encoded, and spooled rows are replayed later still. The poller
+therefore follows commit order (created_at) and re-scans a trailing
+LIVE_RESCAN_SECONDS window on every poll, skipping rows it has already
+delivered, so a row committed late by another writer is still picked up.
+idx_transcript_session_created (session_id, created_at, id) serves that
+window as a range read, so a poll costs in proportion to the rows in it.
+"""
+import datetime
+import logging
+import os
+import queue
+import threading
+import uuid
+
+from sqlalchemy import func
+
+from app.database import get_db
+from app.database.helpers import TRANSCRIPT_LIST_COLUMNS, query_transcript_rows, encode_cursor, decode_cursor
+from app.database.models import Transcript
+
+logger = logging.getLogger(__name__)
+
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", "1.0"))
+LIVE_RESCAN = datetime.timedelta(seconds=float(os.environ.get("LIVE_RESCAN_SECONDS", "10")))
+LIVE_BATCH_LIMIT = 500
+
+class Subscription:
+    """One viewer's queue of new transcript rows"""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.queue = queue.Queue(maxsize=10000)
+        # Ids already queued; the catch-up query and the poller can overlap
+        self.sent = set()
+        self.overflowed = False
+        self._lock = threading.Lock()
+
+    def deliver(self, rows):
+        with self._lock:
+            for row in rows:
+                if self.overflowed or row.id in self.sent:
+                    continue
+                try:
+                    self.queue.put_nowait(row)
+                except queue.Full:
+                    # Stop here; the stream ends once the queue is drained and
+                    # the client reconnects from the last row it received
+                    logger.warning("live feed subscriber queue full", extra={
+                        "session_id": str(self.feed.session_id)
+                    })
+                    self.overflowed = True
+                    return
+                self.sent.add(row.id)
+
+    def get(self, timeout):
+        """Next new row, or None after timeout (at once when overflowed and drained)"""
+        try:
+            return self.queue.get(timeout=0 if self.overflowed else timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+class SessionFeed:
+    """Polls one session for newly committed transcripts while it has subscribers"""
+
+    def __init__(self, hub, session_id):
+        self.hub = hub
+        self.session_id = session_id
+        self.subscribers = set()
+        # Newest created_at seen, and the ids delivered inside the rescan window
+        self.since = None
+        self.recent = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"live-feed-{session_id}", daemon=True
+        )
+
+    def subscribe(self, cursor):
+        subscription = Subscription(self)
+        # Register before catching up so no row committed in between is missed;
+        # deliver() drops rows the poller already queued
+        with self._lock:
+            self.subscribers.add(subscription)
+        for rows in self._catch_up(cursor):
+            subscription.deliver(rows)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+            empty = not self.subscribers
+        if empty:
+            self.hub.remove_if_idle(self)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _catch_up(self, cursor):
+        """Pages of the rows after a viewer's (start_time, id) cursor
+
+        The cursor is moved back by the rescan window so rows committed late
+        with an earlier start_time are resent; the page drops duplicates.
+        """
+        if cursor:
+            start_time, _ = decode_cursor(cursor)
+            cursor = encode_cursor(start_time - LIVE_RESCAN, uuid.UUID(int=0))
+        db = next(get_db())
+        try:
+            while True:
+                rows = query_transcript_rows(db, self.session_id, cursor).limit(LIVE_BATCH_LIMIT).all()
+                if rows:
+                    yield rows
+                if len(rows) < LIVE_BATCH_LIMIT:
+                    return
+                cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+        finally:
+            db.close()
+
+    def _poll(self):
+        db = next(get_db())
+        try:
+            if self.since is None:
+                self.since = db.query(func.max(Transcript.created_at)).filter(
+                    Transcript.session_id == self.session_id
+                ).scalar() or datetime.datetime.min + LIVE_RESCAN
+            return db.query(*TRANSCRIPT_LIST_COLUMNS, Transcript.created_at).filter(
+                Transcript.session_id == self.session_id,
+                Transcript.created_at >= self.since - LIVE_RESCAN
+            ).order_by(Transcript.created_at, Transcript.id).all()
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(LIVE_POLL_INTERVAL):
+            try:
+                rows = self._poll()
+            except Exception as e:
+                logger.error("live feed poll failed", extra={
+                    "session_id": str(self.session_id), "error": str(e)
+                })
+                continue
+
+            rows = [row for row in rows if row.id not in self.recent]
+            if rows:
+                for row in rows:
+                    self.recent[row.id] = row.created_at
+                self.since = max(self.since, rows[-1].created_at)
+            horizon = self.since - LIVE_RESCAN
+            self.recent = {row_id: at for row_id, at in self.recent.items() if at >= horizon}
+            if not rows:
+                continue
+
+            # Viewers see rows in (start_time, id) order within a poll
+            rows.sort(key=lambda row: (row.start_time, row.id))
+            with self._lock:
+                subscribers = list(self.subscribers)
+            for subscription in subscribers:
+                subscription.deliver(rows)
+
+class LiveFeedHub:
+    """Shares one SessionFeed per session between all of its viewers"""
+
+    def __init__(self):
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id, cursor=None):
+        """Subscribe to new transcripts after cursor (or from the start)"""
+        with self._lock:
+            feed = self._feeds.get(session_id)
+            if feed is None:
+                feed = self._feeds[session_id] = SessionFeed(self, session_id)
+                feed.start()
+            return feed.subscribe(cursor)
+
+    def remove_if_idle(self, feed):
+        with self._lock:
+            if not feed.subscribers and self._feeds.get(feed.session_id) is feed:
+                del self._feeds[feed.session_id]
+                feed.stop()
+
+    def stats(self):
+        with self._lock:
+            return {str(sid): len(feed.subscribers) for sid, feed in self._feeds.items()}
@@ -0,0 +1,346 @@
+"""
+LLM call layer with a persistent, content-addressed response cache
+
+Every chat completion goes through complete(). Responses are stored under a
+key derived from the model, the prompt template's name and version, a hash
+of the template inputs and the sampling parameters, so any feature asking
+for a generation that was already made - a chunk summary, a reduce step, a
+future analysis prompt - gets the stored text instead of calling the model.
+
+The cache is an SQLite file (LLM_CACHE_PATH) that every process on the host
+can share, capped at LLM_CACHE_MAX_BYTES; past the cap the least recently
+used entries are evicted. Identical requests running at the same time in one
+process are collapsed into a single call. LLM_CACHE_MAX_BYTES=0 disables the
+cache.
+
+stream_complete() is the streaming variant for text a user is waiting on: it
+yields the response as the model generates it and caches the full text only
+once the stream has finished. Concurrent streams of the same request share
+one upstream generation; a reader joining late first gets the text so far.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from app.metrics import (
+    Gauge, LLM_CACHE_EVICTIONS, LLM_CACHE_REQUESTS, LLM_COMPLETION_TOKENS,
+    LLM_FIRST_TOKEN_SECONDS, LLM_REQUEST_SECONDS, LLM_TOKENS_PER_SECOND
+)
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+class PromptTemplate:
+    """A named system/user prompt pair; its version is a hash of the text
+
+    Editing a template changes its version, so responses cached for the old
+    wording are never returned for the new one.
+    """
+
+    def __init__(self, name, system, user):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.version = hashlib.sha256(f"{system}\0{user}".encode("utf-8")).hexdigest()[:16]
+
+    def messages(self, **fields):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**fields)},
+        ]
+
+def cache_key(model, template, fields, params):
+    """Content address of one generation"""
+    inputs = hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+    material = json.dumps([model, template.name, template.version, inputs, params], sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """LLM responses in an SQLite file with size-bounded LRU eviction"""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                template TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at)")
+
+    def get(self, key):
+        """Cached response text, or None - a hit marks the entry recently used"""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, model, template, response):
+        """Store a response, then evict least recently used entries past max_bytes"""
+        now = time.time()
+        size = len(key) + len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, template, response, size, now, now)
+            )
+            # Keep the newest entries whose sizes add up to max_bytes
+            evicted = self._conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, sum(size) OVER (ORDER BY last_used_at DESC, key) AS running
+                        FROM responses
+                    ) WHERE running > ?
+                )
+            """, (self.max_bytes,)).rowcount
+        if evicted:
+            LLM_CACHE_EVICTIONS.inc(evicted)
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """The process-wide response cache, or None when caching is disabled"""
+    global _cache
+    if LLM_CACHE_MAX_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+Gauge("llm_cache_bytes", "Size of the cached LLM responses",
+      callback=lambda: _cache.stats()["bytes"] if _cache else 0)
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _single_flight(key, generate):
+    """Run generate() once per key at a time - returns (result, shared)
+
+    Callers arriving while the same key is being generated wait for that
+    result instead of starting their own call.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        return future.result(), True
+
+    try:
+        result = generate()
+        future.set_result(result)
+        return result, False
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _chat(client, model, messages, params, kind):
+    started = time.perf_counter()
+    chat_completion = client.chat.completions.create(messages=messages, model=model, **params)
+    elapsed = time.perf_counter() - started
+    LLM_REQUEST_SECONDS.observe(elapsed, kind=kind)
+
+    usage = getattr(chat_completion, "usage", None)
+    if usage is not None and usage.completion_tokens:
+        LLM_COMPLETION_TOKENS.inc(usage.completion_tokens, kind=kind)
+        LLM_TOKENS_PER_SECOND.observe(usage.completion_tokens / elapsed, kind=kind)
+
+    if not chat_completion.choices:
+        raise RuntimeError(f"LLM returned no choices for {kind}.")
+    return chat_completion.choices[0].message.content.strip()
+
+def complete(client, model, template, kind="summary", temperature=0.3, cache=None, **fields):
+    """Run a prompt template against the LLM, answering from the cache when possible
+
+    kind labels the call in the metrics; fields fill the template's user
+    prompt. cache defaults to the process-wide ResponseCache.
+    """
+    if cache is None:
+        cache = get_cache()
+    params = {"temperature": temperature}
+    key = cache_key(model, template, fields, params)
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            LLM_CACHE_REQUESTS.inc(kind=kind, result="hit")
+            return cached
+
+    def generate():
+        # A call for this key may have finished between the lookup and here
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            return cached
+        text = _chat(client, model, template.messages(**fields), params, kind)
+        if cache is not None:
+            cache.put(key, model, template.name, text)
+        return text
+
+    text, shared = _single_flight(key, generate)
+    LLM_CACHE_REQUESTS.inc(kind=kind, result="shared" if shared else "miss")
+    return text
+
+class _SharedStream:
+    """One upstream streamed generation, read by every stream_complete() of its key"""
+
+    def __init__(self):
+        self.parts = []
+        self.finished = False
+        self.error = None
+        self.readers = 1
+        self.changed = threading.Condition()
+
+    def read(self):
+        index = 0
+        try:
+            while True:
+                with self.changed:
+                    while index == len(self.parts) and not self.finished:
+                        self.changed.wait()
+                    parts = self.parts[index:]
+                    index = len(self.parts)
+                    finished, error = self.finished, self.error
+                yield from parts
+                if finished and index == len(self.parts):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self.changed:
+                self.readers -= 1
+
+_streams = {}
+
+def _produce(key, shared, client, model, template, fields, params, kind, cache):
+    """Run the upstream stream for a _SharedStream until it ends or every reader leaves"""
+    started = time.perf_counter()
+    completed = False
+    completion_tokens = None
+    try:
+        stream = client.chat.completions.create(
+            messages=template.messages(**fields), model=model, stream=True, **params
+        )
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None and usage.completion_tokens:
+                    completion_tokens = usage.completion_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                with shared.changed:
+                    if not shared.readers:
+                        # Every reader disconnected; stop paying for the generation
+                        return
+                    if not shared.parts:
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, kind=kind)
+                    shared.parts.append(delta)
+                    shared.changed.notify_all()
+        finally:
+            stream.close()
+
+        elapsed = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(elapsed, kind=kind)
+        # Without a usage chunk, count one token per streamed delta
+        completion_tokens = completion_tokens or len(shared.parts)
+        if completion_tokens:
+            LLM_COMPLETION_TOKENS.inc(completion_tokens, kind=kind)
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed, kind=kind)
+
+        text = "".join(shared.parts).strip()
+        if not text:
+            raise RuntimeError(f"LLM returned no content for {kind}.")
+        if cache is not None:
+            cache.put(key, model, template.name, text)
+        completed = True
+    except Exception as e:
+        shared.error = e
+    finally:
+        with _inflight_lock:
+            _streams.pop(key, None)
+        with shared.changed:
+            if not completed and shared.error is None:
+                shared.error = RuntimeError(f"LLM stream for {kind} was abandoned.")
+            shared.finished = True
+            shared.changed.notify_all()
+
+def stream_complete(client, model, template, kind="summary", temperature=0.3, cache=None, **fields):
+    """Like complete(), but yields the response text in pieces as it is generated
+
+    A cached response is yielded in one piece. The upstream request runs on
+    its own thread and is shared by every concurrent stream of the same
+    request; the full text is cached only when it runs to the end. Once every
+    reader has closed its generator the upstream request is closed and
+    nothing is cached.
+    """
+    if cache is None:
+        cache = get_cache()
+    params = {"temperature": temperature}
+    key = cache_key(model, template, fields, params)
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            LLM_CACHE_REQUESTS.inc(kind=kind, result="hit")
+            yield cached
+            return
+    with _inflight_lock:
+        shared = _streams.get(key)
+        if shared is not None:
+            with shared.changed:
+                shared.readers += 1
+            leader = False
+        else:
+            # A stream for this key may have finished since the lookup above
+            cached = cache.get(key) if cache is not None else None
+            if cached is None:
+                shared = _streams[key] = _SharedStream()
+            leader = True
+
+    if shared is None:
+        LLM_CACHE_REQUESTS.inc(kind=kind, result="hit")
+        yield cached
+        return
+    LLM_CACHE_REQUESTS.inc(kind=kind, result="miss" if leader else "shared")
+    if leader:
+        threading.Thread(
+            target=_produce, name="llm-stream", daemon=True,
+            args=(key, shared, client, model, template, fields, params, kind, cache)
+        ).start()
+    yield from shared.read()
@@ -0,0 +1,207 @@
+"""
+Minimal Prometheus-style metrics for the agent and web app
+
+Counters, gauges and histograms live in a process-wide registry and are
+rendered in the Prometheus text exposition format by render(). The web app
+serves them on /metrics; the agent can serve them on METRICS_PORT with
+start_metrics_server().
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+STARTUP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    """Value that can go up and down, or is read from a callback at render time"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                self._values[()] = self.callback()
+            except Exception:
+                pass
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed time of its block"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+        return False
+
+def render():
+    """Render every registered metric in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics on a background thread - returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+# Shared metrics for the transcript pipeline
+TRANSCRIPTS_SAVED = Counter("transcripts_saved_total", "Transcripts committed to the database")
+TRANSCRIPT_SAVE_ERRORS = Counter("transcript_save_errors_total", "Transcript rows that failed to commit")
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Latency of transcript insert transactions")
+STT_TURNAROUND_SECONDS = Histogram(
+    "stt_turnaround_seconds", "Time from end of user speech to its final transcript"
+)
+AGENT_PREWARM_SECONDS = Histogram(
+    "agent_prewarm_seconds", "Worker process prewarm time per stage", ("stage",), buckets=STARTUP_BUCKETS
+)
+AGENT_JOB_STARTUP_SECONDS = Histogram(
+    "agent_job_startup_seconds", "Time from job start to each startup stage", ("stage", "warm"),
+    buckets=STARTUP_BUCKETS
+)
+AGENT_FIRST_TRANSCRIPT_SECONDS = Histogram(
+    "agent_first_transcript_seconds", "Time from job start to the room's first final transcript", ("warm",),
+    buckets=STARTUP_BUCKETS
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Latency of LLM completion calls", ("kind",), buckets=LLM_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_first_token_seconds", "Time to the first token of streamed LLM calls", ("kind",), buckets=LLM_BUCKETS
+)
+LLM_CACHE_REQUESTS = Counter(
+    "llm_cache_requests_total", "LLM calls by cache outcome (hit, miss, shared)", ("kind", "result")
+)
+LLM_CACHE_EVICTIONS = Counter("llm_cache_evictions_total", "LLM responses evicted from the cache")
+LLM_COMPLETION_TOKENS = Counter("llm_completion_tokens_total", "Tokens generated by the LLM", ("kind",))
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "LLM generation throughput", ("kind",), buckets=RATE_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Web app request latency", ("endpoint", "method", "status")
+)
+WRITER_FLUSH_SECONDS = Histogram("transcript_writer_flush_seconds", "Latency of batched transcript writer flushes")
+SPOOL_ROWS_APPENDED = Counter("transcript_spool_rows_appended_total", "Transcripts appended to the local spool")
+SPOOL_ROWS_REPLAYED = Counter("transcript_spool_rows_replayed_total", "Spooled transcripts inserted into the database")
+SPOOL_ROWS_REJECTED = Counter("transcript_spool_rows_rejected_total", "Spooled transcripts the database refused")
+SPOOL_CORRUPT_RECORDS = Counter("transcript_spool_corrupt_records_total", "Spool records that failed their checksum")
+SPOOL_REPLAY_ERRORS = Counter("transcript_spool_replay_errors_total", "Spool replay batches that failed and were retried")
+SPOOL_FSYNC_SECONDS = Histogram("transcript_spool_fsync_seconds", "Latency of spool appends including fsync")
+WRITER_DIVERTED = Counter("transcript_writer_diverted_total", "Transcripts spooled directly because the writer queue was full")
+WRITER_DROPPED = Counter("transcript_writer_dropped_total", "Transcripts dropped because the writer queue was full")
@@ -0,0 +1,452 @@
+"""
+Semantic search over transcripts with local embeddings
+
+Transcripts are embedded in batches, either through the Ollama embeddings
+endpoint (EMBEDDING_BACKEND=ollama) or a CPU sentence-transformers model
+(EMBEDDING_BACKEND=local), and stored in an on-disk index:
+
+    SEMANTIC_INDEX_DIR/meta.json          model, dim, row count, indexer cursor
+    SEMANTIC_INDEX_DIR/vectors.f32        row-major float32 matrix, L2-normalized
+    SEMANTIC_INDEX_DIR/ids.bin            16-byte transcript UUID per row
+    SEMANTIC_INDEX_DIR/centroids-N.npy    IVF coarse quantizer (generation N)
+    SEMANTIC_INDEX_DIR/assign-N.i32       IVF list of each row
+
+The data files are append-only and memory-mapped for reading; meta.json is
+replaced atomically after every append, so readers only ever see rows up to
+its count and a crashed indexer run leaves nothing half-visible. Small
+indexes are searched exhaustively; past SEMANTIC_IVF_MIN_ROWS a k-means
+inverted file is trained and only the SEMANTIC_NPROBE closest lists are
+scanned. A search within one session scans exactly that session's rows.
+
+Rows whose text changes after they were embedded (compaction rewrites the
+first row of each paragraph) are listed under "stale" in meta.json; the next
+indexer run re-embeds them and overwrites their vectors in place. Rows that
+leave the database (archived sessions) are tombstoned in place: their id is
+blanked, their vector zeroed and their IVF list set to -1, so no search
+scores them.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import and_, or_
+
+from app.database.models import Session as DBSession, Transcript
+from app.metrics import LLM_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "ollama")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+SEMANTIC_INDEX_DIR = os.environ.get("SEMANTIC_INDEX_DIR", "semantic_index")
+SEMANTIC_IVF_MIN_ROWS = int(os.environ.get("SEMANTIC_IVF_MIN_ROWS", "20000"))
+SEMANTIC_NPROBE = int(os.environ.get("SEMANTIC_NPROBE", "8"))
+
+# Rows younger than this are left for the next run, so a batch committed
+# late by another writer cannot slip in behind the cursor
+INDEX_LAG = datetime.timedelta(seconds=30)
+MAX_EMBED_CHARS = 2000
+SCAN_BLOCK_ROWS = 65536
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def get_embedder(backend=EMBEDDING_BACKEND, model=EMBEDDING_MODEL):
+    """Return a function mapping a list of texts to normalized float32 vectors"""
+    if backend == "local":
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=local requires: pip install sentence-transformers")
+        encoder = SentenceTransformer(model, device="cpu")
+
+        def embed(texts):
+            with LLM_REQUEST_SECONDS.time(kind="embedding"):
+                return _normalize(encoder.encode(texts, batch_size=EMBEDDING_BATCH_SIZE))
+        return embed
+
+    if backend != "ollama":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+    from openai import OpenAI
+    client = OpenAI(
+        base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434/v1"),
+        api_key=os.environ.get("OLLAMA_API_KEY", "ollama"),
+    )
+
+    def embed(texts):
+        with LLM_REQUEST_SECONDS.time(kind="embedding"):
+            response = client.embeddings.create(model=model, input=texts)
+        return _normalize([item.embedding for item in sorted(response.data, key=lambda item: item.index)])
+    return embed
+
+def train_ivf(vectors, nlist, iterations=10, sample_size=50000, seed=0):
+    """Spherical k-means over a sample of the vectors - returns (nlist, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))])
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(nlist):
+            members = sample[labels == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+class VectorIndex:
+    """Memory-mapped embedding matrix with an id map and optional IVF index"""
+
+    def __init__(self, directory=SEMANTIC_INDEX_DIR):
+        self.directory = Path(directory)
+        self.meta = None
+        self._meta_mtime = None
+        self._vectors = None
+        self._ids = None
+        self._centroids = None
+        self._assign = None
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self.meta["count"] if self.meta else 0
+
+    def _path(self, name):
+        return self.directory / name
+
+    def refresh(self):
+        """Re-map the index if another process has written to it - returns True if it exists"""
+        with self._lock:
+            try:
+                mtime = self._path("meta.json").stat().st_mtime_ns
+            except FileNotFoundError:
+                self.meta = None
+                return False
+            if mtime == self._meta_mtime:
+                return True
+
+            meta = json.loads(self._path("meta.json").read_text())
+            count, dim, generation = meta["count"], meta["dim"], meta["generation"]
+            self._vectors = self._ids = self._centroids = self._assign = None
+            if count:
+                self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+                self._ids = np.memmap(self._path("ids.bin"), dtype=np.uint8, mode="r", shape=(count, 16))
+            if generation:
+                self._centroids = np.load(self._path(f"centroids-{generation}.npy"))
+                self._assign = np.memmap(self._path(f"assign-{generation}.i32"), dtype=np.int32, mode="r", shape=(count,))
+            self.meta = meta
+            self._meta_mtime = mtime
+            return True
+
+    def search(self, query_vector, k=20, nprobe=SEMANTIC_NPROBE):
+        """Nearest rows by cosine similarity - returns [(transcript_id, score)]"""
+        if not self.count:
+            return []
+        query_vector = _normalize(np.reshape(query_vector, (1, -1)))[0]
+
+        if self._centroids is not None:
+            probe = np.argsort(self._centroids @ query_vector)[::-1][:nprobe]
+            candidates = np.flatnonzero(np.isin(self._assign, probe))
+            blocks = [(candidates, self._vectors[candidates] @ query_vector)]
+        else:
+            blocks = []
+            for start in range(0, self.count, SCAN_BLOCK_ROWS):
+                end = min(start + SCAN_BLOCK_ROWS, self.count)
+                live = np.asarray(self._ids[start:end]).any(axis=1)
+                rows = np.arange(start, end)[live]
+                blocks.append((rows, (self._vectors[start:end] @ query_vector)[live]))
+
+        rows = np.concatenate([block[0] for block in blocks])
+        scores = np.concatenate([block[1] for block in blocks])
+        return self._top(rows, scores, k)
+
+    def search_ids(self, query_vector, transcript_ids, k=20):
+        """Exact nearest rows among the given transcript ids - returns [(transcript_id, score)]"""
+        if not self.count or not transcript_ids:
+            return []
+        query_vector = _normalize(np.reshape(query_vector, (1, -1)))[0]
+
+        rows = self._rows_for(transcript_ids)
+        return self._top(rows, self._vectors[rows] @ query_vector, k)
+
+    def _rows_for(self, transcript_ids, ids=None):
+        # Index rows holding any of the transcript ids, in row order
+        ids = self._ids if ids is None else ids
+        wanted = np.array([transcript_id.bytes for transcript_id in transcript_ids], dtype="S16")
+        rows = [np.empty(0, dtype=np.int64)]
+        for start in range(0, len(ids), SCAN_BLOCK_ROWS):
+            block = np.asarray(ids[start:start + SCAN_BLOCK_ROWS]).view("S16").ravel()
+            rows.append(start + np.flatnonzero(np.isin(block, wanted)))
+        return np.concatenate(rows)
+
+    def _top(self, rows, scores, k):
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [(uuid.UUID(bytes=bytes(self._ids[rows[i]])), float(scores[i])) for i in order]
+
+    # Writing - used by the indexer, one process at a time
+
+    def reset(self, model, dim):
+        """Start an empty index for a model"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in self.directory.iterdir():
+            if path.name.startswith(("vectors", "ids", "centroids", "assign", "meta")):
+                path.unlink()
+        self._write_meta({
+            "model": model, "dim": dim, "count": 0, "generation": 0,
+            "trained_count": 0, "cursor": None, "updated_at": None,
+        })
+
+    def append(self, ids, vectors, cursor):
+        """Append normalized vectors for transcript ids and advance the cursor"""
+        meta = dict(self.meta)
+        generation = meta["generation"]
+        self._truncate(meta)
+
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._path("ids.bin"), "ab") as f:
+            f.write(b"".join(transcript_id.bytes for transcript_id in ids))
+        if generation:
+            centroids = np.load(self._path(f"centroids-{generation}.npy"))
+            with open(self._path(f"assign-{generation}.i32"), "ab") as f:
+                f.write(np.argmax(vectors @ centroids.T, axis=1).astype(np.int32).tobytes())
+
+        meta["count"] += len(ids)
+        meta["cursor"] = cursor
+        self._write_meta(meta)
+
+    def mark_stale(self, ids):
+        """Record transcript ids whose text changed, for the indexer to re-embed"""
+        self.refresh()
+        meta = dict(self.meta)
+        meta["stale"] = sorted(set(meta.get("stale", [])) | {transcript_id.hex for transcript_id in ids})
+        self._write_meta(meta)
+
+    def replace(self, ids, vectors):
+        """Overwrite the vectors of rows already in the index for transcript ids"""
+        meta = dict(self.meta)
+        count, dim, generation = meta["count"], meta["dim"], meta["generation"]
+        stored = np.memmap(self._path("ids.bin"), dtype=np.uint8, mode="r", shape=(count, 16))
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        by_id = {transcript_id.bytes: vector for transcript_id, vector in zip(ids, vectors)}
+        rows = self._rows_for(ids, stored)
+        centroids = np.load(self._path(f"centroids-{generation}.npy")) if generation else None
+
+        with open(self._path("vectors.f32"), "r+b") as f:
+            for row in rows:
+                f.seek(int(row) * dim * 4)
+                f.write(by_id[bytes(stored[row])].tobytes())
+        if centroids is not None:
+            with open(self._path(f"assign-{generation}.i32"), "r+b") as f:
+                for row in rows:
+                    f.seek(int(row) * 4)
+                    f.write(np.int32(np.argmax(centroids @ by_id[bytes(stored[row])])).tobytes())
+        return len(rows)
+
+    def remove(self, ids):
+        """Tombstone the rows of transcript ids - returns the number of rows removed"""
+        if not ids or not self.refresh() or not self.count:
+            return 0
+        meta = dict(self.meta)
+        count, dim, generation = meta["count"], meta["dim"], meta["generation"]
+        stored = np.memmap(self._path("ids.bin"), dtype=np.uint8, mode="r", shape=(count, 16))
+        rows = self._rows_for(ids, stored)
+        del stored
+
+        blank = np.zeros(dim, dtype=np.float32).tobytes()
+        with open(self._path("ids.bin"), "r+b") as f:
+            for row in rows:
+                f.seek(int(row) * 16)
+                f.write(bytes(16))
+        with open(self._path("vectors.f32"), "r+b") as f:
+            for row in rows:
+                f.seek(int(row) * dim * 4)
+                f.write(blank)
+        if generation:
+            with open(self._path(f"assign-{generation}.i32"), "r+b") as f:
+                for row in rows:
+                    f.seek(int(row) * 4)
+                    f.write(np.int32(-1).tobytes())
+
+        # Rewriting meta.json makes open readers re-map the files
+        meta["removed"] = meta.get("removed", 0) + len(rows)
+        self._write_meta(meta)
+        return len(rows)
+
+    def clear_stale(self, ids):
+        meta = dict(self.meta)
+        done = {transcript_id.hex for transcript_id in ids}
+        meta["stale"] = [value for value in meta.get("stale", []) if value not in done]
+        self._write_meta(meta)
+
+    def train(self):
+        """(Re)train the IVF quantizer over every row and reassign all rows"""
+        meta = dict(self.meta)
+        count, dim = meta["count"], meta["dim"]
+        vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+        nlist = max(1, min(4096, int(4 * np.sqrt(count))))
+        centroids = train_ivf(vectors, nlist)
+        nlist = len(centroids)
+
+        ids = np.memmap(self._path("ids.bin"), dtype=np.uint8, mode="r", shape=(count, 16))
+        generation = meta["generation"] + 1
+        np.save(self._path(f"centroids-{generation}.npy"), centroids)
+        with open(self._path(f"assign-{generation}.i32"), "wb") as f:
+            for start in range(0, count, SCAN_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS])
+                assign = np.argmax(block @ centroids.T, axis=1).astype(np.int32)
+                # Tombstoned rows stay out of every list
+                assign[~np.asarray(ids[start:start + SCAN_BLOCK_ROWS]).any(axis=1)] = -1
+                f.write(assign.tobytes())
+
+        previous = meta["generation"]
+        meta.update(generation=generation, trained_count=count, nlist=nlist)
+        self._write_meta(meta)
+        if previous:
+            self._path(f"centroids-{previous}.npy").unlink(missing_ok=True)
+            self._path(f"assign-{previous}.i32").unlink(missing_ok=True)
+        return nlist
+
+    def _truncate(self, meta):
+        # Drop anything a crashed run appended past the committed count
+        sizes = {"vectors.f32": meta["count"] * meta["dim"] * 4, "ids.bin": meta["count"] * 16}
+        if meta["generation"]:
+            sizes[f"assign-{meta['generation']}.i32"] = meta["count"] * 4
+        for name, size in sizes.items():
+            path = self._path(name)
+            with open(path, "ab") as f:
+                if f.tell() != size:
+                    f.truncate(size)
+
+    def _write_meta(self, meta):
+        meta["updated_at"] = datetime.datetime.utcnow().isoformat()
+        tmp = self._path("meta.json.tmp")
+        tmp.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp, self._path("meta.json"))
+        self.meta = meta
+
+def index_new_transcripts(db, index, embed, model=EMBEDDING_MODEL,
+                          batch_size=EMBEDDING_BATCH_SIZE, rebuild=False):
+    """Embed transcripts created since the last run - returns the number indexed
+
+    Rows are read in (created_at, id) order after the cursor stored in the
+    index, so every run only embeds new rows.
+    """
+    exists = index.refresh()
+    if exists and index.meta["model"] != model and not rebuild:
+        raise ValueError(
+            f"Index was built with {index.meta['model']}, not {model}; rebuild it to switch models"
+        )
+    if rebuild or not exists:
+        index.reset(model, dim=len(embed(["dimension probe"])[0]))
+
+    cursor = index.meta["cursor"]
+    horizon = datetime.datetime.utcnow() - INDEX_LAG
+    indexed = 0
+
+    while True:
+        query = db.query(Transcript.id, Transcript.text, Transcript.created_at).filter(
+            Transcript.created_at < horizon
+        )
+        if cursor:
+            created_at, last_id = datetime.datetime.fromisoformat(cursor[0]), uuid.UUID(cursor[1])
+            query = query.filter(or_(
+                Transcript.created_at > created_at,
+                and_(Transcript.created_at == created_at, Transcript.id > last_id)
+            ))
+        rows = query.order_by(Transcript.created_at, Transcript.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        cursor = [rows[-1].created_at.isoformat(), rows[-1].id.hex]
+        rows = [row for row in rows if row.text and row.text.strip()]
+        if rows:
+            started = time.perf_counter()
+            vectors = embed([row.text[:MAX_EMBED_CHARS] for row in rows])
+            logger.debug("embedded batch", extra={
+                "rows": len(rows), "seconds": round(time.perf_counter() - started, 3)
+            })
+            index.append([row.id for row in rows], vectors, cursor)
+            indexed += len(rows)
+        else:
+            index.append([], np.empty((0, index.meta["dim"]), dtype=np.float32), cursor)
+
+    stale = [uuid.UUID(value) for value in index.meta.get("stale", [])]
+    for start in range(0, len(stale), batch_size):
+        batch = stale[start:start + batch_size]
+        rows = db.query(Transcript.id, Transcript.text).filter(Transcript.id.in_(batch)).all()
+        rows = [row for row in rows if row.text and row.text.strip()]
+        if rows:
+            index.replace([row.id for row in rows], embed([row.text[:MAX_EMBED_CHARS] for row in rows]))
+        # Ids gone from the database are simply dropped from search results
+        index.clear_stale(batch)
+
+    count = index.meta["count"]
+    if count >= SEMANTIC_IVF_MIN_ROWS and count >= 2 * index.meta["trained_count"]:
+        nlist = index.train()
+        logger.info("trained IVF index", extra={"rows": count, "nlist": nlist})
+    return indexed
+
+def semantic_search(db, index, embed, query, limit=20, session_id=None):
+    """Transcripts closest in meaning to a free-text query, best first"""
+    if not index.refresh() or not index.count:
+        return []
+
+    query_vector = embed([query])[0]
+    if session_id:
+        # The global top hits may hold none of this session's rows, so scan them all
+        session_ids = [row.id for row in db.query(Transcript.id).filter(Transcript.session_id == session_id)]
+        return _live_results(db, index.search_ids(query_vector, session_ids, k=limit), limit, session_id)
+
+    # Rows deleted since indexing (compaction merges) are still in the index,
+    # so widen the search until enough hits are left or every row was scored
+    k = limit * 2
+    while True:
+        hits = index.search(query_vector, k=k)
+        results = _live_results(db, hits, limit)
+        if len(results) >= limit or len(hits) < k or k >= index.count:
+            return results
+        k *= 4
+
+def _live_results(db, hits, limit, session_id=None):
+    if not hits:
+        return []
+    scores = dict(hits)
+
+    rows = db.query(
+        Transcript.id,
+        Transcript.session_id,
+        Transcript.start_time,
+        Transcript.text,
+        DBSession.title.label("session_title")
+    ).join(
+        DBSession, DBSession.id == Transcript.session_id
+    ).filter(Transcript.id.in_(list(scores)))
+    if session_id:
+        rows = rows.filter(Transcript.session_id == session_id)
+
+    results = [{
+        "id": row.id,
+        "session_id": row.session_id,
+        "session_title": row.session_title,
+        "start_time": row.start_time,
+        "snippet": row.text,
+        "score": round(scores[row.id], 4),
+    } for row in rows]
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results[:limit]
@@ -0,0 +1,338 @@
+"""
+Hierarchical map-reduce summarization for long sessions
+
+Transcripts are packed greedily, in order, into token-bounded chunks. Each
+chunk is summarized on its own (concurrently, with a bounded worker pool) and
+persisted as a SummaryChunk keyed by its first and last transcript id. The
+partial summaries are then reduced, in groups that fit the context window,
+until a single summary remains.
+
+Because chunks are packed from the start of the session, every chunk except
+the last one is unchanged when new transcripts arrive, so re-analyzing a
+session that has grown only summarizes the new tail.
+
+The stored Session.summary records the last transcript it covers along with
+the model and a hash of the prompts. When a session grows, the existing
+summary is extended with just the new transcripts; a change of model or
+prompts triggers a full regeneration. Every prompt goes through the shared
+response cache in app/llm.py, so an identical chunk, reduce or extend
+request is never generated twice.
+
+plan_summary() runs every call but the last, which generate_session_summary()
+makes as a plain completion and stream_session_summary() streams to a
+waiting page.
+"""
+import datetime
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from sqlalchemy import func
+
+from app.database import get_db
+from app.database.helpers import query_transcript_rows, encode_cursor
+from app.llm import PromptTemplate, complete, stream_complete
+from app.database.models import Session as DBSession, SummaryChunk, Transcript
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "2"))
+
+SYSTEM_PROMPT = "You are a helpful assistant that summarizes text concisely."
+CHUNK_PROMPT = "Please summarize the following transcript:\n\n{text}"
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of one transcript, "
+    "in order. Combine them into a single concise summary of the whole "
+    "transcript:\n\n{text}"
+)
+EXTEND_PROMPT = (
+    "Here is a summary of the earlier part of a transcript:\n\n{summary}\n\n"
+    "Update it so it also covers the following continuation of the transcript. "
+    "Reply with only the updated summary:\n\n{text}"
+)
+
+PROMPT_HASH = hashlib.sha256("\0".join([
+    SYSTEM_PROMPT, CHUNK_PROMPT, REDUCE_PROMPT, EXTEND_PROMPT
+]).encode("utf-8")).hexdigest()
+
+# Responses to these go through the shared LLM response cache (app/llm.py)
+CHUNK_TEMPLATE = PromptTemplate("summary-chunk", SYSTEM_PROMPT, CHUNK_PROMPT)
+REDUCE_TEMPLATE = PromptTemplate("summary-reduce", SYSTEM_PROMPT, REDUCE_PROMPT)
+EXTEND_TEMPLATE = PromptTemplate("summary-extend", SYSTEM_PROMPT, EXTEND_PROMPT)
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token for English)"""
+    return len(text) // 4 + 1
+
+def chunk_transcripts(rows, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """Split ordered transcript rows into windows of at most max_tokens each"""
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for row in rows:
+        tokens = estimate_tokens(row.text)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(row)
+        current_tokens += tokens
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+def group_summaries(summaries, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """Pack summaries, in order, into groups that fit one context window"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(summary)
+        current_tokens += tokens
+    groups.append(current)
+
+    if len(summaries) > 1 and len(groups) == len(summaries):
+        # Every summary fills a window on its own; merge pairs so we converge
+        groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+    return groups
+
+def reduce_to_window(client, model, summaries, max_tokens=SUMMARY_CHUNK_TOKENS,
+                     workers=SUMMARY_WORKERS):
+    """Reduce partial summaries level by level until they fit one window
+
+    Returns that last group; combining it is the final reduce call.
+    """
+    while True:
+        groups = group_summaries(summaries, max_tokens)
+        if len(groups) == 1:
+            return groups[0]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            summaries = list(pool.map(
+                lambda group: complete(client, model, REDUCE_TEMPLATE, kind="reduce", text="\n\n".join(group)),
+                groups
+            ))
+
+def reduce_summaries(client, model, summaries, max_tokens=SUMMARY_CHUNK_TOKENS,
+                     workers=SUMMARY_WORKERS):
+    """Combine partial summaries level by level until one remains"""
+    group = reduce_to_window(client, model, summaries, max_tokens, workers)
+    if len(group) == 1:
+        return group[0]
+    return complete(client, model, REDUCE_TEMPLATE, kind="reduce", text="\n\n".join(group))
+
+def summarize_chunks(db, session_id, chunks, client, model, workers=SUMMARY_WORKERS):
+    """Summaries of a session's chunks, in order
+
+    Chunk summaries already stored for this session and model are reused;
+    only missing chunks are sent to the LLM. Stored chunks that no longer
+    match a current window (e.g. an old, shorter tail) are removed.
+    """
+    stored = {
+        (c.first_transcript_id, c.last_transcript_id): c
+        for c in db.query(SummaryChunk).filter(
+            SummaryChunk.session_id == session_id,
+            SummaryChunk.model == model
+        )
+    }
+
+    keys = [(chunk[0].id, chunk[-1].id) for chunk in chunks]
+    missing = [i for i, key in enumerate(keys) if key not in stored]
+    logger.info("summarizing chunks", extra={
+        "session_id": str(session_id), "chunks": len(chunks), "missing": len(missing)
+    })
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        new_summaries = list(pool.map(
+            lambda i: complete(client, model, CHUNK_TEMPLATE, kind="chunk", text="\n".join(r.text for r in chunks[i])),
+            missing
+        ))
+
+    for i, summary in zip(missing, new_summaries):
+        chunk = chunks[i]
+        stored[keys[i]] = SummaryChunk(
+            session_id=session_id,
+            first_transcript_id=chunk[0].id,
+            last_transcript_id=chunk[-1].id,
+            start_time=chunk[0].start_time,
+            end_time=chunk[-1].start_time,
+            transcript_count=len(chunk),
+            model=model,
+            summary=summary
+        )
+        db.add(stored[keys[i]])
+
+    current = set(keys)
+    for key, chunk in stored.items():
+        if key not in current:
+            db.delete(chunk)
+    db.commit()
+
+    return [stored[key].summary for key in keys]
+
+def plan_summary(db, session, client, model, max_tokens=SUMMARY_CHUNK_TOKENS,
+                 workers=SUMMARY_WORKERS):
+    """Make every LLM call of a summary update except the last one
+
+    Returns (rows, final): rows are the transcripts the new summary covers,
+    or None when the summary is already current. final is either the
+    finished summary text or the (template, kind, fields) of the call that
+    produces it, so the caller can run that call plain or streamed. A
+    current summary from the same model and prompts is extended with only
+    the transcripts recorded since it was made; otherwise the session is
+    summarized from the start.
+    """
+    incremental = (
+        session.summary
+        and session.summary_model == model
+        and session.summary_prompt_hash == PROMPT_HASH
+        and session.summary_last_transcript_id is not None
+    )
+
+    if incremental:
+        cursor = encode_cursor(session.summary_last_transcript_at, session.summary_last_transcript_id)
+        rows = query_transcript_rows(db, session.id, cursor).all()
+        if not rows:
+            return None, session.summary
+
+        logger.info("extending summary", extra={"session_id": str(session.id), "transcripts": len(rows)})
+        delta = "\n".join(r.text for r in rows)
+        if estimate_tokens(delta) > max_tokens:
+            # Condense a large delta first so the update prompt fits the context
+            chunks = chunk_transcripts(rows, max_tokens)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                partials = list(pool.map(
+                    lambda chunk: complete(client, model, CHUNK_TEMPLATE, kind="chunk",
+                                           text="\n".join(r.text for r in chunk)),
+                    chunks
+                ))
+            delta = reduce_summaries(client, model, partials, max_tokens, workers)
+        return rows, (EXTEND_TEMPLATE, "extend", {"summary": session.summary, "text": delta})
+
+    rows = query_transcript_rows(db, session.id).all()
+    if not rows:
+        raise ValueError("No text to summarize.")
+
+    logger.info("summarizing session", extra={
+        "session_id": str(session.id), "model": model, "base_url": str(client.base_url)
+    })
+    chunks = chunk_transcripts(rows, max_tokens)
+    if len(chunks) == 1:
+        # A single chunk's summary is the session summary
+        return rows, (CHUNK_TEMPLATE, "chunk", {"text": "\n".join(r.text for r in rows)})
+
+    partials = summarize_chunks(db, session.id, chunks, client, model, workers)
+    group = reduce_to_window(client, model, partials, max_tokens, workers)
+    if len(group) == 1:
+        return rows, group[0]
+    return rows, (REDUCE_TEMPLATE, "reduce", {"text": "\n\n".join(group)})
+
+def save_summary(db, session, summary, rows, model):
+    """Store a summary covering rows on the session and commit"""
+    session.summary = summary
+    session.summary_last_transcript_id = rows[-1].id
+    session.summary_last_transcript_at = rows[-1].start_time
+    session.summary_model = model
+    session.summary_prompt_hash = PROMPT_HASH
+    session.summary_updated_at = datetime.datetime.utcnow()
+    db.commit()
+    logger.info("summary saved", extra={"session_id": str(session.id), "model": model})
+
+def summary_is_stale(db, session, model):
+    """Check whether a session's stored summary misses transcripts or settings
+
+    The newest transcript time comes from a max() over
+    idx_transcript_session_time, so this is cheap even for large sessions.
+    """
+    if not session.summary:
+        return True
+    if session.archived_at is not None:
+        # The transcripts are no longer in the database to re-summarize
+        return False
+    if session.summary_model != model or session.summary_prompt_hash != PROMPT_HASH:
+        return True
+
+    latest = db.query(func.max(Transcript.start_time)).filter(
+        Transcript.session_id == session.id
+    ).scalar()
+    if latest is None:
+        return False
+    return session.summary_last_transcript_at is None or latest > session.summary_last_transcript_at
+
+def _load_session(db, session_id):
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if not session:
+        raise ValueError(f"Session {session_id} not found")
+    return session
+
+def generate_session_summary(session_id, client, model):
+    """Bring a session's stored summary up to date (see plan_summary)"""
+    if client is None:
+        raise RuntimeError("LLM client not initialized. Cannot generate summary.")
+
+    db = next(get_db())
+    try:
+        session = _load_session(db, session_id)
+        rows, final = plan_summary(db, session, client, model)
+        if rows is None:
+            return final
+        if isinstance(final, tuple):
+            template, kind, fields = final
+            final = complete(client, model, template, kind=kind, **fields)
+        save_summary(db, session, final, rows, model)
+        return final
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def stream_session_summary(session_id, client, model):
+    """Bring a session's stored summary up to date, yielding the text as it is written
+
+    Yields ("status", message) while the earlier map and reduce calls run,
+    then ("token", text) pieces of the final call, then ("done", summary)
+    once the summary has been saved. If the consumer stops early (a client
+    disconnect closes the generator) the LLM stream is closed and nothing is
+    saved; the partial response is not cached either.
+    """
+    if client is None:
+        raise RuntimeError("LLM client not initialized. Cannot generate summary.")
+
+    db = next(get_db())
+    try:
+        session = _load_session(db, session_id)
+        yield "status", "Reading transcripts"
+        rows, final = plan_summary(db, session, client, model)
+        if rows is None or not isinstance(final, tuple):
+            if rows is not None:
+                save_summary(db, session, final, rows, model)
+            yield "token", final
+            yield "done", final
+            return
+
+        template, kind, fields = final
+        yield "status", "Writing summary"
+        parts = []
+        with closing(stream_complete(client, model, template, kind=kind, **fields)) as pieces:
+            for piece in pieces:
+                parts.append(piece)
+                yield "token", piece
+
+        summary = "".join(parts).strip()
+        save_summary(db, session, summary, rows, model)
+        yield "done", summary
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,20 +1,62 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context, url_for
 import datetime
-from sqlalchemy import desc, func
+import gzip
+import hashlib
+import itertools
+import json
+import tempfile
+import time
+import uuid
+from sqlalchemy import and_, desc, func, or_
+from sqlalchemy.exc import OperationalError
 from pathlib import Path
 import os
 from openai import OpenAI # Added import
 
-from app.database.helpers import init_database
+from app.database.helpers import (
+    init_database,
+    query_transcript_rows,
+    encode_cursor,
+    decode_cursor
+)
 from app.database import get_db
 from app.database.models import User, Session as DBSession, Transcript
+from app.database.retention import iter_archived_transcripts
+from app.database.rollups import activity as rollup_activity, heatmap as rollup_heatmap, top_terms
+from app.database.search import search_supported, search_transcripts
+from app.export import (
+    CONTENT_TYPES as EXPORT_CONTENT_TYPES, FORMATS as EXPORT_FORMATS, SUBTITLE_FORMATS,
+    iter_session_rows, ndjson_lines, parse_session_ids, select_sessions, subtitle_lines, write_parquet
+)
+from app.semantic_search import VectorIndex, get_embedder, semantic_search
+from app.audio_archive import read_audio_segment
+from app.jobs import IN_FLIGHT, SummaryJobQueue
+from app.live_feed import LiveFeedHub
+from app.logging_config import configure_logging
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS, render as render_metrics
+from app.summarizer import generate_session_summary, stream_session_summary, summary_is_stale
 
 app = Flask(__name__,
     template_folder=str(Path(__file__).parent / "templates"),
     static_folder=str(Path(__file__).parent / "static")
 )
 
-init_database()
+configure_logging()
+init_database(role="web")
+
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", "500"))
+API_MAX_PAGE_SIZE = 5000
+API_STREAM_BATCH_SIZE = 1000
+SEARCH_PAGE_SIZE = 50
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_TERMS = 200
+ANALYTICS_MAX_DAYS = 3660
+INDEX_PAGE_SIZE = int(os.environ.get("INDEX_PAGE_SIZE", "50"))
+LIVE_KEEPALIVE_SECONDS = 15
+SESSION_WINDOW_SIZE = int(os.environ.get("SESSION_WINDOW_SIZE", "200"))
+SUMMARY_STREAMING = os.environ.get("SUMMARY_STREAMING", "true").lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = 1024
+GZIP_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript')
 
 try:
     client = OpenAI(
@@ -25,34 +67,111 @@ except Exception as e:
     print(f"Failed to initialize OpenAI client for Ollama: {e}")
     client = None
 
+summary_jobs = SummaryJobQueue(
+    lambda session_id: generate_session_summary(
+        session_id, client, os.environ.get("OLLAMA_MODEL", "gemma3:4b")
+    ),
+    workers=int(os.environ.get("SUMMARY_JOB_WORKERS", "1"))
+)
+summary_jobs.fail_interrupted()
+
+live_feeds = LiveFeedHub()
+
+semantic_index = VectorIndex()
+_embedder = None
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unknown',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip buffered text and JSON responses for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in GZIP_MIMETYPES or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for the web app"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/')
 def index():
-    """Main page showing all sessions"""
+    """Main page showing sessions, newest first, one page at a time"""
+    before = request.args.get('before')
+    try:
+        before_position = decode_cursor(before) if before else None
+    except ValueError:
+        return "Invalid cursor", 400
+
     db = next(get_db())
     try:
-        sessions = db.query(
-            DBSession,
-            func.count(Transcript.id).label('transcript_count')
-        ).outerjoin(
-            Transcript, DBSession.id == Transcript.session_id
-        ).group_by(
-            DBSession.id
-        ).order_by(
-            desc(DBSession.started_at)
-        ).all()
+        query = db.query(
+            DBSession.id,
+            DBSession.title,
+            DBSession.started_at,
+            DBSession.ended_at,
+            DBSession.transcript_count,
+            DBSession.last_transcript_at,
+            DBSession.session_metadata
+        )
+        if before_position:
+            started_at, session_id = before_position
+            query = query.filter(or_(
+                DBSession.started_at < started_at,
+                and_(DBSession.started_at == started_at, DBSession.id < session_id)
+            ))
+
+        sessions = query.order_by(
+            desc(DBSession.started_at), desc(DBSession.id)
+        ).limit(INDEX_PAGE_SIZE + 1).all()
+
+        next_cursor = None
+        if len(sessions) > INDEX_PAGE_SIZE:
+            last = sessions[INDEX_PAGE_SIZE - 1]
+            next_cursor = encode_cursor(last.started_at, last.id)
 
         session_data = []
-        for session, count in sessions:
+        for session in sessions[:INDEX_PAGE_SIZE]:
             session_data.append({
                 'id': session.id,
                 'title': session.title,
                 'started_at': session.started_at,
                 'ended_at': session.ended_at,
-                'transcript_count': count,
+                'transcript_count': session.transcript_count,
+                'last_transcript_at': session.last_transcript_at,
                 'room_name': session.session_metadata.get('room_name', 'N/A') if session.session_metadata else 'N/A'
             })
 
-        return render_template('index.html', sessions=session_data)
+        return render_template(
+            'index.html',
+            sessions=session_data,
+            next_cursor=next_cursor,
+            is_first_page=before is None
+        )
     finally:
         db.close()
 
@@ -65,11 +184,26 @@ def session_detail(session_id):
         if not session:
             return "Session not found", 404
 
-        transcripts = db.query(Transcript).filter(
-            Transcript.session_id == session_id
-        ).order_by(
-            Transcript.start_time
-        ).all()
+        # Only the first window is rendered here; the page fetches the rest
+        # from /api/transcripts as it is scrolled
+        if session.archived_at:
+            # Archived sessions have no live feed, so the last row is not needed
+            rows = iter_archived_transcripts(session)
+            transcripts = list(itertools.islice(rows, SESSION_WINDOW_SIZE + 1))
+            rows.close()
+            last = None
+            transcript_count = session.transcript_count
+        else:
+            transcripts = query_transcript_rows(db, session_id).limit(SESSION_WINDOW_SIZE + 1).all()
+            last = db.query(Transcript.start_time, Transcript.id).filter(
+                Transcript.session_id == session_id
+            ).order_by(desc(Transcript.start_time), desc(Transcript.id)).first()
+            transcript_count = session.transcript_count
+
+        next_cursor = None
+        if len(transcripts) > SESSION_WINDOW_SIZE:
+            transcripts = transcripts[:SESSION_WINDOW_SIZE]
+            next_cursor = encode_cursor(transcripts[-1].start_time, transcripts[-1].id)
 
         transcript_data = []
         for t in transcripts:
@@ -79,13 +213,22 @@ def session_detail(session_id):
                 'confidence': t.confidence,
                 'start_time': t.start_time,
                 'duration_ms': t.duration_ms,
-                'metadata': t.transcript_metadata
+                'metadata': t.transcript_metadata,
+                # Archived sessions keep audio paths but /audio only serves live rows
+                'has_audio': t.audio_path is not None and not session.archived_at
             })
 
+        live_cursor = encode_cursor(last.start_time, last.id) if last else None
+
         return render_template(
             'session.html',
             session=session,
-            transcripts=transcript_data
+            transcripts=transcript_data,
+            transcript_count=transcript_count,
+            window_size=SESSION_WINDOW_SIZE,
+            next_cursor=next_cursor,
+            live_cursor=live_cursor,
+            live=not session.archived_at
         )
     finally:
         db.close()
@@ -99,97 +242,662 @@ def analyze_session(session_id):
         if not session:
             return "Session not found", 404
 
-        transcripts = db.query(Transcript).filter(
-            Transcript.session_id == session_id
-        ).order_by(
-            Transcript.start_time
-        ).all()
-
-        combined_text = "\n".join([t.text for t in transcripts])
+        # The page previews the first window of text; the summary covers it all
+        preview = query_transcript_rows(db, session_id).limit(SESSION_WINDOW_SIZE + 1).all()
+        preview_truncated = len(preview) > SESSION_WINDOW_SIZE
+        combined_text = "\n".join(t.text for t in preview[:SESSION_WINDOW_SIZE])
+        # Archived sessions keep their counters but no longer have rows to summarize
+        has_text = bool(session.transcript_count) and not session.archived_at
         summary = session.summary # Attempt to get existing summary
+        job = None
+        stream = False
+        ollama_model = os.environ.get("OLLAMA_MODEL", "gemma3:4b")
 
-        if summary:
+        if summary and client and summary_is_stale(db, session, ollama_model):
+            # Keep showing the cached summary while the new transcripts are folded in
+            print(f"Cached summary for session {session_id} is stale. Queueing refresh.")
+            job = summary_jobs.submit(session_id)
+        elif summary:
             print(f"Using cached summary for session {session_id}")
-        elif client and combined_text:
-            print(f"No cached summary found for session {session_id}. Generating new summary.")
-            try:
-                ollama_model = os.environ.get("OLLAMA_MODEL", "gemma3:4b")
-                print(f"Attempting to summarize with Ollama model: {ollama_model} using base_url: {client.base_url}")
-
-                chat_completion = client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a helpful assistant that summarizes text concisely.",
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Please summarize the following transcript:\n\n{combined_text}",
-                        },
-                    ],
-                    model=ollama_model,
-                    temperature=0.3,
-                )
-                if chat_completion.choices:
-                    summary = chat_completion.choices[0].message.content.strip()
-                    session.summary = summary # Save the new summary
-                    db.commit() # Commit the change to the database
-                    print(f"New summary saved for session {session_id}")
-                else:
-                    summary = "LLM returned no choices for summary."
-                    print("LLM returned no choices.")
-            except Exception as e:
-                print(f"Error during LLM summarization: {e}")
-                summary = f"Error generating summary: {str(e)}"
+        elif client and has_text:
+            latest_job = summary_jobs.latest(session_id)
+            idle = not (latest_job and latest_job['status'] in IN_FLIGHT)
+            if SUMMARY_STREAMING and (idle or summary_jobs.is_streaming(session_id)):
+                # The page streams the summary from /api/analyze/<id>/stream as it is
+                # written, attaching to a stream another viewer already started
+                print(f"No cached summary found for session {session_id}. Streaming summary.")
+                stream = True
+            else:
+                # Generate in the background; the page polls the status endpoint
+                print(f"No cached summary found for session {session_id}. Queueing summary job.")
+                job = summary_jobs.submit(session_id)
         elif not client:
             summary = "LLM client not initialized. Cannot generate summary."
             print("LLM client not initialized, cannot generate summary.")
-        elif not combined_text:
+        elif not has_text:
             summary = "No text to summarize."
             print("No text provided for summarization.")
 
-        if summary is None: # Ensure summary is not None if it wasn't generated or cached
+        if summary is None and job is None and not stream: # Ensure summary is not None if it wasn't generated or cached
             summary = "Summary could not be generated or retrieved."
 
         analysis_result = {
             "session_id": str(session_id),
-            "transcript_count": len(transcripts),
-            "total_characters": len(combined_text),
+            "transcript_count": session.transcript_count,
+            "total_characters": session.total_characters,
             "summary": summary,
+            "job": job,
+            "stream": stream,
         }
 
         return render_template(
             'analyze.html',
             session=session,
             combined_text=combined_text,
+            preview_truncated=preview_truncated,
+            window_size=SESSION_WINDOW_SIZE,
             analysis=analysis_result
         )
     finally:
         db.close()
 
+def analytics_range():
+    """(start, end) dates from ?from=/?to=, or the last ?days= days - raises ValueError
+
+    The range is at most ANALYTICS_MAX_DAYS long.
+    """
+    end = request.args.get('to')
+    end = datetime.date.fromisoformat(end) if end else datetime.date.today() + datetime.timedelta(days=1)
+    start = request.args.get('from')
+    if start:
+        start = datetime.date.fromisoformat(start)
+    else:
+        days = int(request.args.get('days', ANALYTICS_DEFAULT_DAYS))
+        if not 1 <= days <= ANALYTICS_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {ANALYTICS_MAX_DAYS}")
+        start = end - datetime.timedelta(days=days)
+    if start >= end:
+        raise ValueError("from must be before to")
+    if (end - start).days > ANALYTICS_MAX_DAYS:
+        raise ValueError(f"the range is longer than {ANALYTICS_MAX_DAYS} days")
+    return start, end
+
+def as_datetime(day):
+    return datetime.datetime.combine(day, datetime.time())
+
+@app.route('/analytics')
+def analytics():
+    """Activity and word-frequency dashboard, read from the rollup tables"""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return "Invalid date range", 400
+
+    db = next(get_db())
+    try:
+        days = rollup_activity(db, as_datetime(start), as_datetime(end), 'day')
+        grid = rollup_heatmap(db, as_datetime(start), as_datetime(end))
+        terms = top_terms(db, start, end, limit=50)
+    finally:
+        db.close()
+
+    totals = {
+        'utterances': sum(day['utterances'] for day in days),
+        'words': sum(day['words'] for day in days),
+        'speaking_minutes': round(sum(day['speaking_ms'] for day in days) / 60000, 1),
+        'active_days': len(days),
+    }
+    return render_template(
+        'analytics.html',
+        start=start,
+        last_day=end - datetime.timedelta(days=1),
+        range_days=(end - start).days,
+        days=days,
+        max_minutes=max([day['speaking_minutes'] for day in days] or [0]),
+        heatmap=grid,
+        heatmap_max=max(max(row) for row in grid),
+        terms=terms,
+        totals=totals
+    )
+
+@app.route('/api/analytics/activity')
+def api_analytics_activity():
+    """Utterances, words, characters and speaking time per ?granularity=hour|day"""
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    db = next(get_db())
+    try:
+        return jsonify(rollup_activity(db, as_datetime(start), as_datetime(end), granularity))
+    finally:
+        db.close()
+
+@app.route('/api/analytics/heatmap')
+def api_analytics_heatmap():
+    """7 x 24 utterance counts by weekday (Monday first) and hour"""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    db = next(get_db())
+    try:
+        return jsonify(rollup_heatmap(db, as_datetime(start), as_datetime(end)))
+    finally:
+        db.close()
+
+@app.route('/api/analytics/terms')
+def api_analytics_terms():
+    """Most frequent terms in the period"""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+    limit = request.args.get('limit', 50, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, ANALYTICS_MAX_TERMS)
+
+    db = next(get_db())
+    try:
+        return jsonify(top_terms(db, start, end, limit=limit))
+    finally:
+        db.close()
+
+def run_search(query, limit, session_id=None):
+    """Run a full-text search - returns (results, took_ms, error)"""
+    db = next(get_db())
+    try:
+        if not search_supported(db.get_bind()):
+            return [], 0.0, "Full-text search requires SQLite FTS5"
+
+        started = time.perf_counter()
+        try:
+            results = search_transcripts(db, query, limit=limit, session_id=session_id)
+        except OperationalError as e:
+            print(f"Search error: {e}")
+            return [], 0.0, "Search index unavailable. Run: python scripts/manage_db.py search-index"
+        return results, (time.perf_counter() - started) * 1000, None
+    finally:
+        db.close()
+
+@app.route('/search')
+def search():
+    """Full-text search across all transcripts"""
+    query = request.args.get('q', '').strip()
+    results, took_ms, error = [], 0.0, None
+    if query:
+        results, took_ms, error = run_search(query, SEARCH_PAGE_SIZE)
+
+    return render_template(
+        'search.html',
+        query=query,
+        results=results,
+        took_ms=took_ms,
+        error=error
+    )
+
+@app.route('/api/search')
+def api_search():
+    """API endpoint for full-text search, ranked by bm25"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+
+    session_id = request.args.get('session_id')
+    if session_id:
+        try:
+            session_id = uuid.UUID(session_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid session_id'}), 400
+
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, API_MAX_PAGE_SIZE)
+    results, took_ms, error = run_search(query, limit, session_id)
+    if error:
+        return jsonify({'error': error}), 503
+
+    return jsonify({
+        'query': query,
+        'took_ms': round(took_ms, 2),
+        'results': [{
+            'id': str(r['id']),
+            'session_id': str(r['session_id']),
+            'session_title': r['session_title'],
+            'start_time': r['start_time'].isoformat() if r['start_time'] else None,
+            'snippet': str(r['snippet']),
+            'rank': r['rank']
+        } for r in results]
+    })
+
+def run_semantic_search(query, limit, session_id=None):
+    """Run a semantic search - returns (results, took_ms, error)"""
+    global _embedder
+    if not semantic_index.refresh():
+        return [], 0.0, "Semantic index not built. Run: python scripts/manage_db.py semantic-index"
+
+    db = next(get_db())
+    try:
+        started = time.perf_counter()
+        try:
+            if _embedder is None:
+                _embedder = get_embedder(model=semantic_index.meta["model"])
+            results = semantic_search(db, semantic_index, _embedder, query, limit=limit, session_id=session_id)
+        except Exception as e:
+            print(f"Semantic search error: {e}")
+            return [], 0.0, "Embedding model unavailable"
+        return results, (time.perf_counter() - started) * 1000, None
+    finally:
+        db.close()
+
+@app.route('/search/semantic')
+def search_semantic():
+    """Search transcripts by meaning using the embedding index"""
+    query = request.args.get('q', '').strip()
+    results, took_ms, error = [], 0.0, None
+    if query:
+        results, took_ms, error = run_semantic_search(query, SEARCH_PAGE_SIZE)
+
+    return render_template(
+        'search.html',
+        query=query,
+        results=results,
+        took_ms=took_ms,
+        error=error,
+        semantic=True
+    )
+
+@app.route('/api/search/semantic')
+def api_search_semantic():
+    """API endpoint for semantic search, ranked by cosine similarity"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+
+    session_id = request.args.get('session_id')
+    if session_id:
+        try:
+            session_id = uuid.UUID(session_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid session_id'}), 400
+
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, API_MAX_PAGE_SIZE)
+    results, took_ms, error = run_semantic_search(query, limit, session_id)
+    if error:
+        return jsonify({'error': error}), 503
+
+    return jsonify({
+        'query': query,
+        'took_ms': round(took_ms, 2),
+        'results': [{
+            'id': str(r['id']),
+            'session_id': str(r['session_id']),
+            'session_title': r['session_title'],
+            'start_time': r['start_time'].isoformat() if r['start_time'] else None,
+            'text': r['snippet'],
+            'score': r['score']
+        } for r in results]
+    })
+
+@app.route('/api/analyze/<uuid:session_id>', methods=['GET', 'POST'])
+def api_analyze(session_id):
+    """Summary status for a session; POST queues a job if the summary is missing or stale"""
+    db = next(get_db())
+    try:
+        session = db.query(DBSession).filter(DBSession.id == session_id).first()
+        if not session:
+            return jsonify({'error': 'Session not found'}), 404
+        summary = session.summary
+        stale = summary_is_stale(db, session, os.environ.get("OLLAMA_MODEL", "gemma3:4b"))
+    finally:
+        db.close()
+
+    if request.method == 'POST' and stale:
+        if not client:
+            return jsonify({'error': 'LLM client not initialized'}), 503
+        job = summary_jobs.submit(session_id)
+        return jsonify({'session_id': str(session_id), 'summary': summary, 'stale': True, 'job': job}), 202
+
+    return jsonify({
+        'session_id': str(session_id),
+        'summary': summary,
+        'stale': stale,
+        'job': summary_jobs.latest(session_id)
+    })
+
+@app.route('/api/analyze/<uuid:session_id>/stream')
+def api_analyze_stream(session_id):
+    """Server-sent events stream of a session's summary as the LLM writes it
+
+    Sends status events while earlier chunks are summarized, token events
+    with each piece of the final summary, then done (the summary has been
+    saved) or error. The stream is the session's running summary job:
+    viewers arriving meanwhile attach to the same generation, and the LLM
+    request is closed (nothing saved) only once every viewer has
+    disconnected. Answers 409 while a queued summary job owns the session.
+    """
+    if not client:
+        return jsonify({'error': 'LLM client not initialized'}), 503
+    db = next(get_db())
+    try:
+        if not db.query(DBSession.id).filter(DBSession.id == session_id).first():
+            return jsonify({'error': 'Session not found'}), 404
+    finally:
+        db.close()
+    if not summary_jobs.attach_stream(session_id):
+        # Let the job finish rather than writing the same chunks twice
+        return jsonify({
+            'error': 'A summary job is already running', 'job': summary_jobs.latest(session_id)
+        }), 409
+
+    summary = stream_session_summary(session_id, client, os.environ.get("OLLAMA_MODEL", "gemma3:4b"))
+
+    outcome = {'finished': False, 'error': None}
+
+    def events():
+        try:
+            for event, value in summary:
+                key = 'summary' if event == 'done' else 'text' if event == 'token' else 'message'
+                outcome['finished'] = outcome['finished'] or event == 'done'
+                yield f"event: {event}\ndata: {json.dumps({key: value})}\n\n"
+        except Exception as e:
+            print(f"Error streaming summary for session {session_id}: {e}")
+            outcome['error'] = str(e)
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            summary.close()
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    # Runs even when the client goes away before the first event
+    response.call_on_close(lambda: summary_jobs.detach_stream(session_id, **outcome))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/audio/<uuid:transcript_id>')
+def transcript_audio(transcript_id):
+    """Serve the archived Ogg/Opus audio for a single transcript"""
+    db = next(get_db())
+    try:
+        audio = db.query(
+            Transcript.audio_path, Transcript.audio_offset, Transcript.audio_length
+        ).filter(Transcript.id == transcript_id).first()
+    finally:
+        db.close()
+
+    if not audio or not audio.audio_path:
+        return "Audio not found", 404
+
+    try:
+        data = read_audio_segment(audio.audio_path, audio.audio_offset, audio.audio_length)
+    except (OSError, ValueError) as e:
+        print(f"Error reading audio for transcript {transcript_id}: {e}")
+        return "Audio not found", 404
+
+    response = Response(data, mimetype='audio/ogg')
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@app.route('/api/transcripts/<uuid:session_id>/live')
+def api_transcripts_live(session_id):
+    """Server-sent events stream of new transcripts for a session
+
+    Starts after ?cursor= (or the Last-Event-ID header on reconnect); each
+    event's id is the cursor of the row it carries.
+    """
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    subscription = live_feeds.subscribe(session_id, cursor)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                row = subscription.get(timeout=LIVE_KEEPALIVE_SECONDS)
+                if row is None and subscription.overflowed:
+                    # The viewer fell too far behind; end the stream so the
+                    # browser reconnects from its Last-Event-ID
+                    return
+                if row is None:
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(transcript_row_to_dict(row))
+                yield f"id: {encode_cursor(row.start_time, row.id)}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def transcript_row_to_dict(row):
+    """Serialize a transcript listing row for the JSON APIs"""
+    return {
+        'id': str(row.id),
+        'text': row.text,
+        'confidence': row.confidence,
+        'start_time': row.start_time.isoformat(),
+        'duration_ms': row.duration_ms,
+        'metadata': row.transcript_metadata,
+        'audio_url': url_for('transcript_audio', transcript_id=row.id) if row.audio_path else None
+    }
+
+def stream_transcripts_ndjson(session_id, cursor, limit):
+    """Yield a session's transcripts as NDJSON lines from a server-side cursor"""
+    db = next(get_db())
+    try:
+        query = query_transcript_rows(db, session_id, cursor)
+        if limit:
+            query = query.limit(limit)
+
+        for row in query.yield_per(API_STREAM_BATCH_SIZE):
+            yield json.dumps(transcript_row_to_dict(row)) + "\n"
+    finally:
+        db.close()
+
+def transcript_window_etag(session_id, cursor, limit):
+    """Weak ETag for one page of a session's transcripts, or None if there is no session
+
+    Built from the session's counters rather than the rows, so a matching
+    If-None-Match is answered without running the page query. Any insert,
+    compaction or archival changes the counters or archived_at.
+    """
+    db = next(get_db())
+    try:
+        session = db.query(
+            DBSession.transcript_count, DBSession.total_characters,
+            DBSession.last_transcript_at, DBSession.archived_at
+        ).filter(DBSession.id == session_id).first()
+    finally:
+        db.close()
+    if session is None:
+        return None
+
+    parts = [session_id, cursor, limit, *session]
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+def archived_transcript_rows(session_id, cursor):
+    """Iterator over the rows after cursor of an archived session, or None if it is not archived
+
+    The archive is read lazily, so taking a page stops decompressing once the
+    page is full.
+    """
+    db = next(get_db())
+    try:
+        session = db.query(DBSession).filter(
+            DBSession.id == session_id, DBSession.archived_at.isnot(None)
+        ).first()
+        if session is None:
+            return None
+    finally:
+        db.close()
+
+    def rows():
+        archived = iter_archived_transcripts(session)
+        if cursor:
+            # The archive is in (start_time, id) order
+            after = decode_cursor(cursor)
+            archived = itertools.dropwhile(lambda row: (row.start_time, row.id) <= after, archived)
+        for row in archived:
+            row.audio_path = None
+            yield row
+
+    return rows()
+
 @app.route('/api/transcripts/<uuid:session_id>')
 def api_transcripts(session_id):
-    """API endpoint to get transcripts for a session"""
+    """API endpoint to get transcripts for a session
+
+    Results are keyset-paginated on (start_time, id). The cursor for the next
+    page is returned in the X-Next-Cursor header; pass it back as ?cursor=.
+    With ?format=ndjson every remaining row is streamed instead.
+    """
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    etag = None
+    if request.args.get('format') != 'ndjson':
+        etag = transcript_window_etag(session_id, cursor, limit)
+        if etag and request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+    def cacheable(response):
+        # Revalidate every time; an unchanged page then costs one small 304
+        if etag:
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    archived = archived_transcript_rows(session_id, cursor)
+    if archived is not None:
+        if request.args.get('format') == 'ndjson':
+            rows = itertools.islice(archived, limit) if limit else archived
+            return Response(
+                stream_with_context(json.dumps(transcript_row_to_dict(row)) + "\n" for row in rows),
+                mimetype='application/x-ndjson'
+            )
+        limit = min(limit or API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+        rows = list(itertools.islice(archived, limit + 1))
+        archived.close()
+        response = jsonify([transcript_row_to_dict(row) for row in rows[:limit]])
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.start_time, last.id)
+        return cacheable(response)
+
+    if request.args.get('format') == 'ndjson':
+        return Response(
+            stream_with_context(stream_transcripts_ndjson(session_id, cursor, limit)),
+            mimetype='application/x-ndjson'
+        )
+
+    limit = min(limit or API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+
     db = next(get_db())
     try:
-        transcripts = db.query(Transcript).filter(
-            Transcript.session_id == session_id
-        ).order_by(
-            Transcript.start_time
-        ).all()
+        rows = query_transcript_rows(db, session_id, cursor).limit(limit + 1).all()
+
+        response = jsonify([transcript_row_to_dict(row) for row in rows[:limit]])
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.start_time, last.id)
+        return cacheable(response)
+    finally:
+        db.close()
+
+@app.route('/api/export')
+def api_export():
+    """Download transcripts as NDJSON, SRT, WebVTT or Parquet
 
-        data = [{
-            'id': str(t.id),
-            'text': t.text,
-            'confidence': t.confidence,
-            'start_time': t.start_time.isoformat(),
-            'duration_ms': t.duration_ms,
-            'metadata': t.transcript_metadata
-        } for t in transcripts]
+    Sessions are chosen with ?session= (repeatable) and/or a ?from=/?to=
+    date range on their start time. NDJSON and subtitles are streamed
+    session by session; Parquet is built in a temporary file first because
+    its footer is written last. Subtitles cover exactly one session.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
 
-        return jsonify(data)
+    try:
+        session_ids = parse_session_ids(request.args.getlist('session'))
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = datetime.datetime.fromisoformat(start) if start else None
+        end = datetime.datetime.fromisoformat(end) if end else None
+    except ValueError:
+        return jsonify({'error': 'Invalid session id or date'}), 400
+    if not session_ids and not (start or end):
+        return jsonify({'error': 'Pass session= or a from=/to= range'}), 400
+
+    db = next(get_db())
+    try:
+        sessions = select_sessions(db, session_ids, start, end)
     finally:
         db.close()
+    if not sessions:
+        return jsonify({'error': 'No matching sessions'}), 404
+    if fmt in SUBTITLE_FORMATS and len(sessions) != 1:
+        return jsonify({'error': 'Subtitle export covers exactly one session'}), 400
+
+    def rows():
+        db = next(get_db())
+        try:
+            for session in sessions:
+                yield from iter_session_rows(db, session.id)
+                db.expunge_all()
+        finally:
+            db.close()
+
+    filename = f"{sessions[0].id}.{fmt}" if len(sessions) == 1 else f"transcripts.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+    if fmt == 'parquet':
+        spool = tempfile.TemporaryFile()
+        try:
+            write_parquet(rows(), spool)
+        except RuntimeError as e:
+            spool.close()
+            return jsonify({'error': str(e)}), 501
+        spool.seek(0)
+
+        def chunks():
+            with spool:
+                while chunk := spool.read(64 * 1024):
+                    yield chunk
+
+        return Response(chunks(), mimetype=EXPORT_CONTENT_TYPES[fmt], headers=headers)
+
+    if fmt == 'ndjson':
+        body = ndjson_lines(rows())
+    else:
+        body = subtitle_lines(rows(), fmt)
+    return Response(stream_with_context(body), mimetype=EXPORT_CONTENT_TYPES[fmt], headers=headers)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
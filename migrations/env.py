@@ -0,0 +1,66 @@
+"""
+Alembic environment for the voice transcript database
+
+Uses the URL passed by app/database/create_tables.py, then DATABASE_URL,
+then sqlalchemy.url from alembic.ini.
+SQLite migrations run in batch mode, since SQLite cannot ALTER most
+column and constraint changes in place.
+"""
+import os
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database import Base, create_db_engine
+from app.database import models  # noqa: F401 - registers the tables on Base.metadata
+from app.database.search import FTS_TABLE
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+def database_url():
+    # manage_db.py passes its --connection through config.attributes
+    return (config.attributes.get("url") or os.environ.get("DATABASE_URL")
+            or config.get_main_option("sqlalchemy.url"))
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # The FTS5 table and its shadow tables are managed by app/database/search.py
+    if type_ == "table" and name.startswith(FTS_TABLE):
+        return False
+    return True
+
+def run_migrations_offline():
+    """Emit the migration SQL without connecting to a database"""
+    url = database_url()
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=url.startswith("sqlite"),
+        include_object=include_object,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Run migrations against the database"""
+    engine = create_db_engine(database_url())
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
+            compare_type=True,
+            include_object=include_object,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
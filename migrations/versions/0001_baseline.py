@@ -0,0 +1,183 @@
+"""Baseline schema
+
+Creates every table on an empty database. Databases created before Alembic
+(by create_all at some earlier version of the models) are adopted instead:
+missing tables, columns and indexes are added, and the session counters are
+backfilled if they were just added.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-06-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.database.search import create_search_index, rebuild_search_index
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+UUID = sa.Uuid(as_uuid=True)
+JSONType = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+def tables():
+    """(name, columns, indexes) for the baseline schema, in dependency order"""
+    return [
+        ("users", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("username", sa.String(100), nullable=False, unique=True),
+            sa.Column("email", sa.String(255), nullable=True, unique=True),
+            sa.Column("created_at", sa.DateTime()),
+        ], []),
+        ("sessions", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("user_id", UUID, sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("title", sa.String(255)),
+            sa.Column("started_at", sa.DateTime()),
+            sa.Column("ended_at", sa.DateTime(), nullable=True),
+            sa.Column("session_metadata", JSONType, nullable=True),
+            sa.Column("summary", sa.Text(), nullable=True),
+            sa.Column("summary_last_transcript_id", UUID, nullable=True),
+            sa.Column("summary_last_transcript_at", sa.DateTime(), nullable=True),
+            sa.Column("summary_model", sa.String(100), nullable=True),
+            sa.Column("summary_prompt_hash", sa.String(64), nullable=True),
+            sa.Column("summary_updated_at", sa.DateTime(), nullable=True),
+            sa.Column("transcript_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("total_characters", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("total_duration_ms", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("last_transcript_at", sa.DateTime(), nullable=True),
+            sa.Column("archived_at", sa.DateTime(), nullable=True),
+            sa.Column("archive_path", sa.String(500), nullable=True),
+            sa.Column("archive_offset", sa.Integer(), nullable=True),
+            sa.Column("archive_length", sa.Integer(), nullable=True),
+        ], [
+            ("idx_session_started_at", ["started_at", "id"], {}),
+        ]),
+        ("transcripts", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("session_id", UUID, sa.ForeignKey("sessions.id"), nullable=False),
+            sa.Column("user_id", UUID, sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.Column("confidence", sa.Float(), nullable=True),
+            sa.Column("is_final", sa.Boolean()),
+            sa.Column("language", sa.String(10)),
+            sa.Column("duration_ms", sa.Integer(), nullable=True),
+            sa.Column("start_time", sa.DateTime()),
+            sa.Column("end_time", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("transcript_metadata", JSONType, nullable=True),
+            sa.Column("audio_path", sa.String(500), nullable=True),
+            sa.Column("audio_offset", sa.Integer(), nullable=True),
+            sa.Column("audio_length", sa.Integer(), nullable=True),
+        ], [
+            ("idx_transcript_user_session", ["user_id", "session_id"], {}),
+            ("idx_transcript_session_time", ["session_id", "start_time"], {}),
+            ("idx_transcript_created_at", ["created_at"], {}),
+            ("idx_transcript_metadata_gin", ["transcript_metadata"], {"postgresql_using": "gin", "only": "postgresql"}),
+            ("idx_transcript_start_time_brin", ["start_time"], {"postgresql_using": "brin", "only": "postgresql"}),
+        ]),
+        ("summary_chunks", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("session_id", UUID, sa.ForeignKey("sessions.id"), nullable=False),
+            sa.Column("first_transcript_id", UUID, nullable=False),
+            sa.Column("last_transcript_id", UUID, nullable=False),
+            sa.Column("start_time", sa.DateTime(), nullable=True),
+            sa.Column("end_time", sa.DateTime(), nullable=True),
+            sa.Column("transcript_count", sa.Integer(), nullable=False),
+            sa.Column("model", sa.String(100), nullable=False),
+            sa.Column("summary", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        ], [
+            ("idx_summary_chunk_range", ["session_id", "model", "first_transcript_id", "last_transcript_id"], {"unique": True}),
+        ]),
+        ("summary_jobs", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("session_id", UUID, sa.ForeignKey("sessions.id"), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+        ], [
+            ("idx_summary_job_session_status", ["session_id", "status"], {}),
+        ]),
+        ("retranscription_jobs", [
+            sa.Column("id", UUID, primary_key=True),
+            sa.Column("batch", sa.String(255), nullable=False),
+            sa.Column("source_type", sa.String(20), nullable=False),
+            sa.Column("source", sa.String(1000), nullable=False),
+            sa.Column("source_session_id", UUID, nullable=True),
+            sa.Column("model", sa.String(100), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("endpoint", sa.String(255), nullable=True),
+            sa.Column("text", sa.Text(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("start_time", sa.DateTime(), nullable=True),
+            sa.Column("transcript_id", UUID, nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+        ], [
+            ("idx_retranscription_job_source", ["batch", "source", "model"], {"unique": True}),
+            ("idx_retranscription_job_status", ["batch", "status"], {}),
+        ]),
+    ]
+
+COUNTER_BACKFILL = """
+UPDATE sessions SET
+    transcript_count = (SELECT count(*) FROM transcripts t WHERE t.session_id = sessions.id),
+    total_characters = (SELECT coalesce(sum(length(t.text)), 0) FROM transcripts t WHERE t.session_id = sessions.id),
+    total_duration_ms = (SELECT coalesce(sum(t.duration_ms), 0) FROM transcripts t WHERE t.session_id = sessions.id),
+    last_transcript_at = (SELECT max(t.start_time) FROM transcripts t WHERE t.session_id = sessions.id)
+"""
+
+def upgrade():
+    bind = op.get_bind()
+    # Offline (--sql) runs cannot inspect, and describe a fresh database
+    offline = op.get_context().as_sql
+    inspector = None if offline else sa.inspect(bind)
+    existing_tables = set() if offline else set(inspector.get_table_names())
+    transcripts_existed = "transcripts" in existing_tables
+    added_counters = False
+
+    for name, columns, indexes in tables():
+        if name not in existing_tables:
+            op.create_table(name, *columns)
+            existing_indexes = set()
+        else:
+            present = {column["name"] for column in inspector.get_columns(name)}
+            missing = [column for column in columns if column.name not in present]
+            if missing:
+                with op.batch_alter_table(name) as batch:
+                    for column in missing:
+                        # Foreign keys and uniqueness only come with a freshly created table
+                        batch.add_column(sa.Column(column.name, column.type, nullable=column.nullable,
+                                                   server_default=column.server_default))
+                added_counters |= name == "sessions" and any(c.name == "transcript_count" for c in missing)
+            existing_indexes = {index["name"] for index in inspector.get_indexes(name)}
+
+        for index_name, index_columns, options in indexes:
+            options = dict(options)
+            only = options.pop("only", None)
+            if index_name in existing_indexes or (only and bind.dialect.name != only):
+                continue
+            op.create_index(index_name, name, index_columns, **options)
+
+    if added_counters:
+        op.execute(COUNTER_BACKFILL)
+
+    if bind.dialect.name == "sqlite" and not offline:
+        if transcripts_existed:
+            rebuild_search_index(bind)
+        else:
+            create_search_index(bind)
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS transcripts_fts")
+    for name, _, _ in reversed(tables()):
+        op.drop_table(name)
@@ -0,0 +1,46 @@
+"""Analytics rollup tables
+
+Adds activity_hourly and term_daily (app/database/rollups.py) and backfills
+them from the existing transcripts and archives.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-07-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.database.rollups import rebuild_rollups
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "activity_hourly",
+        sa.Column("bucket_start", sa.DateTime(), primary_key=True),
+        sa.Column("utterances", sa.Integer(), nullable=False),
+        sa.Column("words", sa.Integer(), nullable=False),
+        sa.Column("characters", sa.Integer(), nullable=False),
+        sa.Column("speaking_ms", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "term_daily",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("term", sa.String(64), primary_key=True),
+        sa.Column("occurrences", sa.Integer(), nullable=False),
+    )
+
+    if not op.get_context().as_sql:
+        # Runs inside the migration transaction; commit() only flushes here
+        db = Session(bind=op.get_bind())
+        rebuild_rollups(db)
+        db.commit()
+        db.close()
+
+def downgrade():
+    op.drop_table("term_daily")
+    op.drop_table("activity_hourly")
@@ -0,0 +1,26 @@
+"""Summary job ownership
+
+Adds owner and heartbeat_at to summary_jobs (app/jobs.py), so a web app
+process only fails in-flight jobs whose owner has stopped heartbeating.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-07-15 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table("summary_jobs") as batch:
+        batch.add_column(sa.Column("owner", sa.String(100), nullable=True))
+        batch.add_column(sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table("summary_jobs") as batch:
+        batch.drop_column("heartbeat_at")
+        batch.drop_column("owner")
@@ -0,0 +1,24 @@
+"""Index for the live feed poll
+
+Adds idx_transcript_session_created on transcripts (session_id, created_at,
+id), so app/live_feed.py reads a session's newly committed rows by range
+instead of scanning and sorting the whole session.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-07-20 00:00:00
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(
+        "idx_transcript_session_created", "transcripts", ["session_id", "created_at", "id"]
+    )
+
+def downgrade():
+    op.drop_index("idx_transcript_session_created", table_name="transcripts")
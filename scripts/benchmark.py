@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Benchmark the transcript write and read paths
+
+Builds a throwaway database (unless --connection is given), synthesizes
+sessions and transcripts with realistic utterance lengths, then measures:
+
+  - write: single-row commits (the save_transcript path) and the batched
+    TranscriptWriter, driven at a fixed rate or as fast as possible
+  - read: index, session_detail and api_transcripts (paged and NDJSON)
+    through the Flask test client, for sessions of increasing size
+
+Results are printed as JSON (p50/p95/p99 latency in ms, rows/s, peak RSS)
+so runs can be diffed between commits:
+
+    python scripts/benchmark.py --sizes 100,1000,10000 --output bench.json
+"""
+import os
+import sys
+import argparse
+import datetime
+import json
+import random
+import resource
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+WORDS = (
+    "the a and to of I you it that is was we so like just yeah okay think know "
+    "really about meeting budget quarter project team call tomorrow today email "
+    "deadline review plan numbers report client update week design launch idea "
+    "maybe right well actually need want going get make time good thing people"
+).split()
+
+def synth_text(rng):
+    """Utterance text with a log-normal word count (median around 10 words)"""
+    count = max(1, min(120, int(rng.lognormvariate(2.3, 0.7))))
+    return " ".join(rng.choice(WORDS) for _ in range(count)).capitalize() + "."
+
+def percentiles(samples):
+    """Summarize latency samples (seconds) as milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(usage / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def seed_session(helpers, rng, size, title, batch_size=1000):
+    """Create a session with `size` synthetic transcripts one second apart"""
+    user_id, session_id = helpers.create_session(room_name="benchmark", title=title, source="benchmark")
+    started = datetime.datetime(2025, 1, 1)
+    for offset in range(0, size, batch_size):
+        helpers.save_transcripts([
+            helpers.build_transcript_row(
+                session_id, user_id, synth_text(rng),
+                duration_ms=rng.randint(500, 8000),
+                start_time=started + datetime.timedelta(seconds=i)
+            )
+            for i in range(offset, min(size, offset + batch_size))
+        ])
+    return session_id
+
+def paced(count, rate):
+    """Yield indexes at `rate` per second (or as fast as possible when rate is 0)"""
+    started = time.perf_counter()
+    for i in range(count):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield i
+
+def bench_writes(helpers, writer_cls, rng, count, rate, batch_size):
+    """Measure single-row commits and the batched writer"""
+    results = {}
+    user_id, session_id = helpers.create_session(room_name="benchmark", title="write-bench", source="benchmark")
+
+    samples = []
+    started = time.perf_counter()
+    for _ in paced(count, rate):
+        row = helpers.build_transcript_row(session_id, user_id, synth_text(rng))
+        t0 = time.perf_counter()
+        helpers.save_transcripts([row])
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    results["single_commit"] = {
+        "latency": percentiles(samples),
+        "rows_per_s": round(count / elapsed, 1),
+    }
+
+    writer = writer_cls(batch_size=batch_size, max_queue_size=max(1000, count)).start()
+    samples = []
+    started = time.perf_counter()
+    for _ in paced(count, rate):
+        row = helpers.build_transcript_row(session_id, user_id, synth_text(rng))
+        t0 = time.perf_counter()
+        writer.submit(row)
+        samples.append(time.perf_counter() - t0)
+    writer.flush(timeout=300)
+    elapsed = time.perf_counter() - started
+    stats = writer.stats()
+    writer.close()
+    results["batched_writer"] = {
+        "submit_latency": percentiles(samples),
+        "rows_per_s": round(count / elapsed, 1),
+        "writer": stats,
+    }
+    return results
+
+def bench_route(client, url, requests):
+    """Time repeated GETs of one URL, consuming streamed bodies fully"""
+    samples = []
+    size = 0
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        samples.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+        size = len(body)
+    result = percentiles(samples)
+    result["response_bytes"] = size
+    return result
+
+def bench_reads(client, sessions, requests):
+    """Measure read routes for each seeded session size"""
+    results = {"index": bench_route(client, "/", requests)}
+    for size, session_id in sessions.items():
+        results[f"session_{size}"] = {
+            "session_detail": bench_route(client, f"/session/{session_id}", requests),
+            "api_transcripts_page": bench_route(client, f"/api/transcripts/{session_id}", requests),
+            "api_transcripts_ndjson": bench_route(client, f"/api/transcripts/{session_id}?format=ndjson", requests),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript write and read paths")
+    parser.add_argument("--connection", type=str, help="Database to benchmark (default: a temporary SQLite file)")
+    parser.add_argument("--sessions", type=int, default=20, help="Background sessions to seed")
+    parser.add_argument("--transcripts", type=int, default=200, help="Transcripts per background session")
+    parser.add_argument("--sizes", type=str, default="100,1000,10000", help="Session sizes for read benchmarks")
+    parser.add_argument("--write-count", type=int, default=2000, help="Utterances per write benchmark")
+    parser.add_argument("--rate", type=float, default=0, help="Utterances per second (0 = unthrottled)")
+    parser.add_argument("--batch-size", type=int, default=50, help="TranscriptWriter batch size")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per read route")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed")
+    parser.add_argument("--output", type=str, help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.connection is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix="transcript-bench-")
+        args.connection = f"sqlite:///{tmpdir.name}/bench.db"
+    # The web app reads DATABASE_URL when it is imported
+    os.environ["DATABASE_URL"] = args.connection
+
+    from app.database.create_tables import create_tables
+    from app.database import helpers
+    from app.database.writer import TranscriptWriter
+
+    create_tables(args.connection)
+    rng = random.Random(args.seed)
+
+    t0 = time.perf_counter()
+    for i in range(args.sessions):
+        seed_session(helpers, rng, args.transcripts, f"background-{i}")
+    sessions = {}
+    for size in [int(value) for value in args.sizes.split(",") if value]:
+        sessions[size] = seed_session(helpers, rng, size, f"size-{size}")
+    seed_seconds = time.perf_counter() - t0
+
+    writes = bench_writes(helpers, TranscriptWriter, rng, args.write_count, args.rate, args.batch_size)
+
+    from app.web_app import app
+    reads = bench_reads(app.test_client(), sessions, args.requests)
+
+    report = {
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "connection": args.connection if tmpdir is None else "temporary sqlite",
+        "params": {key: value for key, value in vars(args).items() if key not in ("connection", "output")},
+        "seed_seconds": round(seed_seconds, 3),
+        "write": writes,
+        "read": reads,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"Benchmark results written to {args.output}")
+    else:
+        print(output)
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,12 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from sqlalchemy import text
+
 from app.database import Base, init_db
 from app.database import models
-from app.database.create_tables import create_tables
+from app.database.create_tables import create_tables, upgrade_database
+from app.database.search import drop_search_index, rebuild_search_index
 
 def reset_database(connection_string):
     """Drop all tables and recreate them"""
@@ -19,10 +22,13 @@ def reset_database(connection_string):
     engine, _ = init_db(connection_string)
 
     print("Dropping all tables...")
+    drop_search_index(engine)
     Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
 
     print("Creating all tables...")
-    Base.metadata.create_all(bind=engine)
+    upgrade_database(connection_string)
 
     print("Database reset successfully!")
 
@@ -65,10 +71,212 @@ def seed_database(connection_string):
         )
         session.add(transcript)
 
+        transcript_session.transcript_count = 1
+        transcript_session.total_characters = len(transcript.text)
+        transcript_session.total_duration_ms = transcript.duration_ms
+        transcript_session.last_transcript_at = transcript.start_time
+
         session.commit()
 
     print("Database seeded successfully!")
 
+def build_search_index(connection_string):
+    """Create the full-text search index and backfill it from existing transcripts"""
+    print(f"Connecting to database: {connection_string}")
+    engine, _ = init_db(connection_string)
+
+    print("Rebuilding full-text search index...")
+    if rebuild_search_index(engine):
+        print("Search index rebuilt successfully!")
+
+def build_semantic_index(connection_string, rebuild=False):
+    """Embed transcripts added since the last run into the semantic search index"""
+    from app.semantic_search import EMBEDDING_MODEL, VectorIndex, get_embedder, index_new_transcripts
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+
+    index = VectorIndex()
+    print(f"{'Rebuilding' if rebuild else 'Updating'} semantic index in {index.directory} with {EMBEDDING_MODEL}...")
+    with SessionLocal() as session:
+        try:
+            count = index_new_transcripts(session, index, get_embedder(), rebuild=rebuild)
+        except ValueError as e:
+            print(f"Error: {e} (use --rebuild)")
+            return
+
+    print(f"Embedded {count} transcripts; index holds {index.count}.")
+
+def recount_sessions(connection_string):
+    """Recompute the denormalized per-session counters from the transcripts"""
+    from app.database.helpers import recount_session_counters
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+
+    with SessionLocal() as session:
+        count = recount_session_counters(session)
+        session.commit()
+
+    print(f"Recounted transcripts for {count} sessions.")
+
+def compact_sessions(connection_string, session_ids=None, max_gap_ms=None, max_chars=None):
+    """Merge fragment rows of existing sessions into paragraph rows"""
+    import uuid
+    from app.database.paragraphs import (
+        compact_session, TRANSCRIPT_MERGE_GAP_MS, TRANSCRIPT_MERGE_MAX_CHARS
+    )
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+
+    with SessionLocal() as session:
+        if session_ids:
+            targets = [uuid.UUID(value) for value in session_ids]
+        else:
+            # Sessions still recording are left to the live merger
+            targets = [row.id for row in session.query(models.Session.id).filter(
+                models.Session.ended_at.isnot(None)
+            ).order_by(models.Session.started_at)]
+
+        total = 0
+        rewritten = []
+        for session_id in targets:
+            removed = compact_session(
+                session, session_id,
+                max_gap_ms=max_gap_ms or TRANSCRIPT_MERGE_GAP_MS,
+                max_chars=max_chars or TRANSCRIPT_MERGE_MAX_CHARS,
+                rewritten=rewritten
+            )
+            session.commit()
+            if removed:
+                print(f"Session {session_id}: merged away {removed} rows")
+            total += removed
+
+    print(f"Compacted {len(targets)} sessions, {total} rows removed.")
+
+    if rewritten:
+        from app.semantic_search import VectorIndex
+
+        index = VectorIndex()
+        if index.refresh():
+            # Their embeddings still describe the first fragment only
+            index.mark_stale(rewritten)
+            print(f"{len(rewritten)} paragraph rows will be re-embedded by the next semantic-index run.")
+
+def archive_sessions(connection_string, older_than_days=None, dry_run=False):
+    """Move old sessions' transcripts into compressed monthly archive files"""
+    from app.database.retention import RETENTION_DAYS, archive_session, sessions_due
+    from app.semantic_search import VectorIndex
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+
+    with SessionLocal() as session:
+        due = sessions_due(session, days)
+        print(f"{len(due)} sessions inactive for more than {days} days")
+        if dry_run:
+            return
+
+        index = VectorIndex()
+        total = removed = 0
+        for session_id in due:
+            archived = []
+            total += archive_session(session, session_id, archived=archived)
+            session.expunge_all()
+            # Their vectors would otherwise crowd live rows out of global searches
+            removed += index.remove(archived)
+
+    print(f"Archived {total} transcripts from {len(due)} sessions.")
+    if removed:
+        print(f"Removed {removed} archived rows from the semantic index.")
+    if due:
+        vacuum(connection_string)
+
+def vacuum(connection_string, pages=None, full=False):
+    """Release free pages back to the filesystem"""
+    from app.database.retention import VACUUM_PAGES, vacuum_database
+
+    engine, _ = init_db(connection_string)
+    result = vacuum_database(engine, pages or VACUUM_PAGES, full)
+    if result is None:
+        print("Vacuum is left to the database server for this backend.")
+    elif result[1] is None:
+        print(f"Free pages: {result[0]}. The database is not in auto_vacuum=INCREMENTAL mode; "
+              "run 'vacuum --full' once, while the agent is stopped, to convert it.")
+    else:
+        print(f"Free pages: {result[0]} before, {result[1]} after vacuum.")
+
+def export_transcripts(connection_string, fmt, output_dir, session_ids=None, start=None, end=None, workers=1):
+    """Export sessions to one file per session in output_dir"""
+    import datetime
+    from app.export import export_sessions, parse_session_ids, select_sessions
+
+    try:
+        session_ids = parse_session_ids(session_ids or [])
+        start = datetime.datetime.fromisoformat(start) if start else None
+        end = datetime.datetime.fromisoformat(end) if end else None
+    except ValueError as e:
+        print(f"Error: {e} (expected --session UUID, --from/--to YYYY-MM-DD)")
+        return
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+
+    with SessionLocal() as session:
+        sessions = select_sessions(session, session_ids, start, end)
+
+    print(f"Exporting {len(sessions)} sessions as {fmt} to {output_dir} with {workers} workers...")
+    total = 0
+    try:
+        for session_id, path, count in export_sessions(connection_string, sessions, fmt, output_dir, workers):
+            print(f"Session {session_id}: {count} transcripts -> {path}")
+            total += count
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return
+
+    print(f"Exported {total} transcripts from {len(sessions)} sessions.")
+
+def rebuild_rollups(connection_string, since=None, until=None):
+    """Recompute the analytics rollups from the transcripts and archives"""
+    import datetime
+    from app.database.rollups import rebuild_rollups as rebuild
+
+    print(f"Connecting to database: {connection_string}")
+    engine, SessionLocal = init_db(connection_string)
+
+    start = datetime.date.fromisoformat(since) if since else None
+    end = datetime.date.fromisoformat(until) if until else None
+    with SessionLocal() as session:
+        count = rebuild(session, start, end)
+        session.commit()
+
+    print(f"Rolled up {count} transcripts.")
+
+def replay_spool(connection_string, spool_dir=None):
+    """Insert transcripts left in the spool directories of agents that are no longer running"""
+    from app.database.spool import TRANSCRIPT_SPOOL_DIR, abandoned_directories, drain_directory
+
+    print(f"Connecting to database: {connection_string}")
+    init_db(connection_string)
+
+    directories = abandoned_directories(spool_dir or TRANSCRIPT_SPOOL_DIR)
+    total = 0
+    for directory, lock_file in directories:
+        try:
+            count = drain_directory(directory)
+        except Exception as e:
+            print(f"{directory}: replay failed, left in place: {e}")
+            continue
+        finally:
+            lock_file.close()
+        print(f"{directory}: {count} transcripts replayed")
+        total += count
+
+    print(f"Replayed {total} transcripts from {len(directories)} spool directories.")
+
 def main():
     parser = argparse.ArgumentParser(description="Manage the voice transcript database")
     parser.add_argument(
@@ -83,17 +291,66 @@ def main():
 
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
     create_parser = subparsers.add_parser("create", help="Create all database tables")
+    migrate_parser = subparsers.add_parser("migrate", help="Apply schema migrations")
+    migrate_parser.add_argument("revision", nargs="?", default="head", help="Target revision (default head)")
     reset_parser = subparsers.add_parser("reset", help="Drop and recreate all tables")
     seed_parser = subparsers.add_parser("seed", help="Seed the database with sample data")
+    search_parser = subparsers.add_parser("search-index", help="Build or rebuild the full-text search index")
+    recount_parser = subparsers.add_parser("recount", help="Recompute per-session transcript counters")
+    compact_parser = subparsers.add_parser("compact", help="Merge short transcript fragments into paragraphs")
+    compact_parser.add_argument("--session", action="append", help="Session id (repeatable, default all ended sessions)")
+    compact_parser.add_argument("--gap-ms", type=int, help="Pause that starts a new paragraph")
+    compact_parser.add_argument("--max-chars", type=int, help="Maximum paragraph length")
+    archive_parser = subparsers.add_parser("archive", help="Move old sessions into compressed monthly archives")
+    archive_parser.add_argument("--older-than-days", type=int, help="Inactivity threshold (default RETENTION_DAYS)")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only report how many sessions are due")
+    vacuum_parser = subparsers.add_parser("vacuum", help="Incrementally vacuum the database")
+    vacuum_parser.add_argument("--pages", type=int, help="Pages to free per run (default VACUUM_PAGES)")
+    vacuum_parser.add_argument("--full", action="store_true", help="Run a full VACUUM and rebuild the search index")
+    export_parser = subparsers.add_parser("export", help="Export sessions to NDJSON, SRT, VTT or Parquet files")
+    export_parser.add_argument("--format", choices=["ndjson", "srt", "vtt", "parquet"], default="ndjson", help="Output format")
+    export_parser.add_argument("--output", default="exports", help="Output directory (default exports)")
+    export_parser.add_argument("--session", action="append", help="Session id (repeatable)")
+    export_parser.add_argument("--from", dest="start", help="Sessions started on or after this ISO date")
+    export_parser.add_argument("--to", dest="end", help="Sessions started before this ISO date")
+    export_parser.add_argument("--workers", type=int, default=1, help="Export sessions in parallel processes")
+    rollup_parser = subparsers.add_parser("rollup", help="Rebuild the analytics rollups")
+    rollup_parser.add_argument("--since", help="First day to rebuild (ISO date, default all)")
+    rollup_parser.add_argument("--until", help="Day to stop before (ISO date)")
+    spool_parser = subparsers.add_parser("spool-replay", help="Insert transcripts left in abandoned agent spools")
+    spool_parser.add_argument("--dir", help="Spool directory (default TRANSCRIPT_SPOOL_DIR)")
+    semantic_parser = subparsers.add_parser("semantic-index", help="Embed new transcripts into the semantic search index")
+    semantic_parser.add_argument("--rebuild", action="store_true", help="Discard the index and embed every transcript")
 
     args = parser.parse_args()
 
     if args.command == "create":
         create_tables(args.connection)
+    elif args.command == "migrate":
+        upgrade_database(args.connection, args.revision)
     elif args.command == "reset":
         reset_database(args.connection)
     elif args.command == "seed":
         seed_database(args.connection)
+    elif args.command == "search-index":
+        build_search_index(args.connection)
+    elif args.command == "recount":
+        recount_sessions(args.connection)
+    elif args.command == "compact":
+        compact_sessions(args.connection, args.session, args.gap_ms, args.max_chars)
+    elif args.command == "archive":
+        archive_sessions(args.connection, args.older_than_days, args.dry_run)
+    elif args.command == "vacuum":
+        vacuum(args.connection, args.pages, args.full)
+    elif args.command == "export":
+        export_transcripts(args.connection, args.format, args.output, args.session,
+                           args.start, args.end, args.workers)
+    elif args.command == "rollup":
+        rebuild_rollups(args.connection, args.since, args.until)
+    elif args.command == "spool-replay":
+        replay_spool(args.connection, args.dir)
+    elif args.command == "semantic-index":
+        build_semantic_index(args.connection, args.rebuild)
     else:
         parser.print_help()
 
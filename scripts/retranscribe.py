@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""
+Offline batch re-transcription for the voice transcript application
+
+Takes a directory of recordings, or the archived audio segments of existing
+sessions, and transcribes them on a process pool against one or more
+OpenAI-compatible STT endpoints (VoxBox, or the stub in stub_stt_server.py).
+
+Every input becomes a row in retranscription_jobs, so an interrupted run can
+simply be started again with the same arguments: finished items are skipped
+and failed ones retried. Results are bulk-inserted into sessions/transcripts:
+one session per batch for files, one per source session for archived audio.
+
+Examples:
+    python scripts/retranscribe.py files ./recordings --endpoint http://localhost:5002/v1@4
+    python scripts/retranscribe.py archive --session <session_id> \\
+        --endpoint http://gpu-box:5002/v1@8 --endpoint http://localhost:5002/v1@2 \\
+        --model Systran/faster-whisper-large-v3
+"""
+import os
+import sys
+import argparse
+import datetime
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import Base, init_db, get_db
+from app.database.helpers import add_session, build_transcript_row, update_session_counters
+from app.database.rollups import ROLLUP_ON_WRITE, update_rollups
+from app.database.models import RetranscriptionJob, Session as DBSession, Transcript
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".ogg", ".opus", ".flac", ".m4a", ".webm"}
+DEFAULT_MODEL = "Systran/faster-whisper-small"
+
+# Clients are created once per worker process and endpoint
+_clients = {}
+
+def parse_endpoint(value):
+    """Parse 'URL' or 'URL@CONCURRENCY' into (url, concurrency)"""
+    url, _, limit = value.rpartition("@")
+    if not url or not limit.isdigit():
+        return value, 1
+    return url, max(1, int(limit))
+
+def transcribe(endpoint, api_key, model, name, source_type, payload):
+    """Transcribe one file or archived segment - runs in a worker process"""
+    from openai import OpenAI
+
+    client = _clients.get(endpoint)
+    if client is None:
+        client = _clients[endpoint] = OpenAI(base_url=endpoint, api_key=api_key)
+
+    if source_type == "file":
+        data = Path(payload).read_bytes()
+    else:
+        from app.audio_archive import read_audio_segment
+        data = read_audio_segment(*payload)
+
+    result = client.audio.transcriptions.create(model=model, file=(name, data))
+    return result.text.strip()
+
+def register_file_jobs(db, batch, model, directory):
+    """Create pending jobs for every audio file under a directory"""
+    existing = {
+        source for (source,) in db.query(RetranscriptionJob.source).filter(
+            RetranscriptionJob.batch == batch,
+            RetranscriptionJob.model == model
+        )
+    }
+
+    jobs = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.suffix.lower() not in AUDIO_EXTENSIONS or not path.is_file():
+            continue
+        source = str(path.resolve())
+        if source in existing:
+            continue
+        jobs.append({
+            "id": uuid.uuid4(),
+            "batch": batch,
+            "source_type": "file",
+            "source": source,
+            "model": model,
+            "status": "pending",
+            "attempts": 0,
+            "start_time": datetime.datetime.fromtimestamp(path.stat().st_mtime),
+        })
+
+    db.bulk_insert_mappings(RetranscriptionJob, jobs)
+    db.commit()
+    return len(jobs)
+
+def register_segment_jobs(db, batch, model, session_ids):
+    """Create pending jobs for archived audio segments of the given sessions (or all)"""
+    existing = {
+        source for (source,) in db.query(RetranscriptionJob.source).filter(
+            RetranscriptionJob.batch == batch,
+            RetranscriptionJob.model == model
+        )
+    }
+
+    query = db.query(
+        Transcript.id, Transcript.session_id, Transcript.start_time
+    ).filter(Transcript.audio_path.isnot(None))
+    if session_ids:
+        query = query.filter(Transcript.session_id.in_(session_ids))
+
+    jobs = []
+    for transcript_id, session_id, start_time in query.order_by(Transcript.start_time):
+        if str(transcript_id) in existing:
+            continue
+        jobs.append({
+            "id": uuid.uuid4(),
+            "batch": batch,
+            "source_type": "segment",
+            "source": str(transcript_id),
+            "source_session_id": session_id,
+            "model": model,
+            "status": "pending",
+            "attempts": 0,
+            "start_time": start_time,
+        })
+
+    db.bulk_insert_mappings(RetranscriptionJob, jobs)
+    db.commit()
+    return len(jobs)
+
+def load_runnable_jobs(db, batch, model, max_attempts):
+    """Jobs still to run: pending, or failed with attempts left"""
+    jobs = db.query(RetranscriptionJob).filter(
+        RetranscriptionJob.batch == batch,
+        RetranscriptionJob.model == model,
+        RetranscriptionJob.status != "done",
+        RetranscriptionJob.attempts < max_attempts
+    ).order_by(RetranscriptionJob.start_time).all()
+
+    audio = {}
+    segment_ids = [uuid.UUID(job.source) for job in jobs if job.source_type == "segment"]
+    if segment_ids:
+        audio = {
+            str(row.id): (row.audio_path, row.audio_offset, row.audio_length)
+            for row in db.query(
+                Transcript.id, Transcript.audio_path, Transcript.audio_offset, Transcript.audio_length
+            ).filter(Transcript.id.in_(segment_ids))
+        }
+
+    runnable = []
+    for job in jobs:
+        if job.source_type == "file":
+            name, payload = Path(job.source).name, job.source
+        elif job.source in audio:
+            name, payload = "segment.ogg", audio[job.source]
+        else:
+            continue
+        runnable.append({"id": job.id, "name": name, "source_type": job.source_type, "payload": payload})
+    return runnable
+
+def run_jobs(db, jobs, endpoints, model, api_key):
+    """Fan jobs out over a process pool, honouring per-endpoint concurrency"""
+    queue = deque(jobs)
+    in_use = {url: 0 for url, _ in endpoints}
+    inflight = {}
+    completed = failed = 0
+
+    with ProcessPoolExecutor(max_workers=sum(limit for _, limit in endpoints)) as pool:
+        while queue or inflight:
+            for url, limit in endpoints:
+                while queue and in_use[url] < limit:
+                    job = queue.popleft()
+                    future = pool.submit(transcribe, url, api_key, model, job["name"],
+                                         job["source_type"], job["payload"])
+                    inflight[future] = (job, url)
+                    in_use[url] += 1
+
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, url = inflight.pop(future)
+                in_use[url] -= 1
+
+                values = {
+                    RetranscriptionJob.endpoint: url,
+                    RetranscriptionJob.attempts: RetranscriptionJob.attempts + 1,
+                    RetranscriptionJob.finished_at: datetime.datetime.utcnow(),
+                }
+                try:
+                    values[RetranscriptionJob.text] = future.result()
+                    values[RetranscriptionJob.status] = "done"
+                    values[RetranscriptionJob.error] = None
+                    completed += 1
+                except Exception as e:
+                    values[RetranscriptionJob.status] = "failed"
+                    values[RetranscriptionJob.error] = str(e)
+                    failed += 1
+                    print(f"Failed {job['name']} on {url}: {e}")
+
+                db.query(RetranscriptionJob).filter(
+                    RetranscriptionJob.id == job["id"]
+                ).update(values, synchronize_session=False)
+                db.commit()
+
+                finished = completed + failed
+                if finished % 25 == 0 or not (queue or inflight):
+                    print(f"[{finished}/{len(jobs)}] {completed} done, {failed} failed")
+
+    return completed, failed
+
+def find_import_session(db, batch, model, source_session_id):
+    """(user_id, session_id) that earlier imports for this source went to, or None"""
+    query = db.query(Transcript.user_id, Transcript.session_id).join(
+        RetranscriptionJob, RetranscriptionJob.transcript_id == Transcript.id
+    ).filter(
+        RetranscriptionJob.batch == batch,
+        RetranscriptionJob.model == model
+    )
+    if source_session_id is None:
+        query = query.filter(RetranscriptionJob.source_type == "file")
+    else:
+        query = query.filter(RetranscriptionJob.source_session_id == source_session_id)
+    return query.first()
+
+def import_results(db, batch, model):
+    """Bulk-insert finished, not yet imported jobs as transcripts"""
+    jobs = db.query(RetranscriptionJob).filter(
+        RetranscriptionJob.batch == batch,
+        RetranscriptionJob.model == model,
+        RetranscriptionJob.status == "done",
+        RetranscriptionJob.transcript_id.is_(None)
+    ).order_by(RetranscriptionJob.start_time).all()
+    if not jobs:
+        return 0
+
+    # Target session per source: one for the batch's files, one per archived session.
+    # A resumed run appends to the session earlier imports went to; new sessions
+    # are added in this transaction, so a failed insert leaves none behind.
+    targets = {}
+    for job in jobs:
+        key = job.source_session_id if job.source_type == "segment" else None
+        if key in targets:
+            continue
+        targets[key] = find_import_session(db, batch, model, key)
+        if targets[key] is not None:
+            continue
+        if key is None:
+            title = f"Batch import: {batch}"
+        else:
+            original = db.query(DBSession.title).filter(DBSession.id == key).scalar()
+            title = f"{original} (re-transcribed with {model})"
+        targets[key] = add_session(db, room_name=batch, title=title, source="retranscribe")
+
+    rows = []
+    for job in jobs:
+        user_id, session_id = targets[job.source_session_id if job.source_type == "segment" else None]
+        metadata = {
+            "source": "retranscribe",
+            "batch": batch,
+            "model": model,
+            "endpoint": job.endpoint,
+            job.source_type: job.source,
+        }
+        row = build_transcript_row(
+            session_id=session_id,
+            user_id=user_id,
+            text=job.text,
+            metadata=metadata,
+            start_time=job.start_time
+        )
+        rows.append(row)
+        job.transcript_id = row["id"]
+
+    # Insert the rows and mark the jobs imported in one transaction
+    db.bulk_insert_mappings(Transcript, rows)
+    update_session_counters(db, rows)
+    if ROLLUP_ON_WRITE:
+        update_rollups(db, rows)
+    db.commit()
+    return len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-transcribe recordings or archived audio in bulk")
+    parser.add_argument(
+        "--connection",
+        type=str,
+        default=os.environ.get(
+            "DATABASE_URL",
+            "sqlite:///voice_transcripts.db"
+        ),
+        help="Database connection string"
+    )
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        help="OpenAI-compatible STT base URL, optionally with @CONCURRENCY (repeatable)"
+    )
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="STT model name")
+    parser.add_argument("--api-key", default=os.environ.get("STT_API_KEY", "voxbox"), help="STT API key")
+    parser.add_argument("--batch", help="Batch name used to resume a run (defaults to the input name)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Give up on an item after this many failures")
+
+    subparsers = parser.add_subparsers(dest="source", help="What to transcribe")
+    files_parser = subparsers.add_parser("files", help="Audio files under a directory")
+    files_parser.add_argument("directory", type=str)
+    archive_parser = subparsers.add_parser("archive", help="Archived audio segments of existing sessions")
+    archive_parser.add_argument("--session", action="append", default=[], help="Session id (repeatable, default all)")
+
+    args = parser.parse_args()
+    if args.source is None:
+        parser.print_help()
+        return
+
+    endpoints = [parse_endpoint(value) for value in (args.endpoint or ["http://localhost:5002/v1"])]
+
+    engine, _ = init_db(args.connection)
+    Base.metadata.create_all(bind=engine, tables=[RetranscriptionJob.__table__])
+
+    db = next(get_db())
+    try:
+        if args.source == "files":
+            batch = args.batch or Path(args.directory).resolve().name
+            added = register_file_jobs(db, batch, args.model, args.directory)
+        else:
+            batch = args.batch or "archive"
+            session_ids = [uuid.UUID(value) for value in args.session]
+            added = register_segment_jobs(db, batch, args.model, session_ids)
+
+        jobs = load_runnable_jobs(db, batch, args.model, args.max_attempts)
+        print(f"Batch {batch}: {added} new items, {len(jobs)} to transcribe on "
+              + ", ".join(f"{url} (x{limit})" for url, limit in endpoints))
+
+        if jobs:
+            completed, failed = run_jobs(db, jobs, endpoints, args.model, args.api_key)
+            print(f"Transcribed {completed} items, {failed} failed")
+
+        imported = import_results(db, batch, args.model)
+        print(f"Imported {imported} transcripts")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Stub OpenAI-compatible STT and chat server for exercising the pipelines
+
+Answers POST /v1/audio/transcriptions with a deterministic fake transcript
+(file name and size) and POST /v1/chat/completions with a deterministic
+fake reply (a hash of the messages) after an optional delay - streamed word
+by word as server-sent events when the request sets "stream" - so
+retranscribe.py and the summarizer can be run end to end without VoxBox,
+Ollama or a GPU. GET /stats reports how many requests of each kind arrived,
+e.g. to check that the LLM response cache prevented repeat generations.
+
+    python scripts/stub_stt_server.py --port 5099 --delay 0.2
+    python scripts/retranscribe.py files ./recordings --endpoint http://localhost:5099/v1@4
+    OLLAMA_BASE_URL=http://localhost:5099/v1 python app/web_app.py
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+app.config["STT_DELAY"] = 0.0
+app.config["STT_FAIL_EVERY"] = 0
+
+_requests = {"count": 0, "chat": 0}
+_requests_lock = threading.Lock()
+
+@app.route('/v1/audio/transcriptions', methods=['POST'])
+def transcriptions():
+    """Return a fake transcript for the uploaded audio"""
+    with _requests_lock:
+        _requests["count"] += 1
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': {'message': 'file is required'}}), 400
+
+    time.sleep(app.config["STT_DELAY"])
+
+    fail_every = app.config["STT_FAIL_EVERY"]
+    if fail_every and _requests["count"] % fail_every == 0:
+        return jsonify({'error': {'message': 'stub failure'}}), 500
+
+    data = upload.read()
+    return jsonify({
+        'text': f"stub transcript of {upload.filename} ({len(data)} bytes, model {request.form.get('model')})"
+    })
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    """Return a fake completion derived from the request messages"""
+    with _requests_lock:
+        _requests["chat"] += 1
+    body = request.get_json(silent=True) or {}
+    messages = body.get('messages')
+    if not messages:
+        return jsonify({'error': {'message': 'messages is required'}}), 400
+
+    time.sleep(app.config["STT_DELAY"])
+
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()[:12]
+    prompt_chars = sum(len(m.get('content') or '') for m in messages)
+    content = f"stub summary {digest} of {prompt_chars} characters (model {body.get('model')})"
+    if body.get('stream'):
+        return Response(stream_chunks(digest, body.get('model'), content), mimetype='text/event-stream')
+    return jsonify({
+        'id': f"chatcmpl-{digest}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': {
+            'prompt_tokens': prompt_chars // 4 + 1,
+            'completion_tokens': len(content.split()),
+            'total_tokens': prompt_chars // 4 + 1 + len(content.split())
+        }
+    })
+
+def stream_chunks(digest, model, content):
+    """chat.completion.chunk events for content, one word each, spread over STT_DELAY"""
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        chunk = {
+            'id': f"chatcmpl-{digest}",
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'delta': {'content': word if i == 0 else " " + word},
+                'finish_reason': 'stop' if i == len(words) - 1 else None
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        time.sleep(app.config["STT_DELAY"] / len(words))
+    yield "data: [DONE]\n\n"
+
+@app.route('/v1/models')
+def models():
+    return jsonify({'object': 'list', 'data': [{'id': 'stub', 'object': 'model', 'owned_by': 'stub'}]})
+
+@app.route('/stats')
+def stats():
+    with _requests_lock:
+        return jsonify({'transcriptions': _requests["count"], 'chat_completions': _requests["chat"]})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub OpenAI-compatible STT and chat server")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait per request")
+    parser.add_argument("--fail-every", type=int, default=0, help="Fail every Nth request (0 = never)")
+    args = parser.parse_args()
+
+    app.config["STT_DELAY"] = args.delay
+    app.config["STT_FAIL_EVERY"] = args.fail_every
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from app.database import init_db
+from app.database.create_tables import upgrade_database
+
+@pytest.fixture
+def database(tmp_path):
+    """A migrated SQLite database bound as the process-wide engine - returns its URL"""
+    url = f"sqlite:///{tmp_path / 'transcripts.db'}"
+    upgrade_database(url)
+    init_db(url)
+    return url
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """Flask test client for the web app, bound to the test database"""
+    # Importing the web app binds the engine to DATABASE_URL
+    monkeypatch.setenv("DATABASE_URL", database)
+    from app.web_app import app
+
+    init_db(database)
+    return app.test_client()
@@ -0,0 +1,70 @@
+import datetime
+import uuid
+
+import pytest
+
+from app.database import get_db
+from app.database.helpers import (
+    build_transcript_row, create_session, decode_cursor, encode_cursor, query_transcript_rows
+)
+from app.database.models import Transcript
+
+def add_rows(session, times):
+    user_id, session_id = session
+    db = next(get_db())
+    try:
+        rows = [
+            build_transcript_row(session_id=session_id, user_id=user_id, text=f"row {i}",
+                                 duration_ms=1000, start_time=start_time)
+            for i, start_time in enumerate(times)
+        ]
+        db.bulk_insert_mappings(Transcript, rows)
+        db.commit()
+        return rows
+    finally:
+        db.close()
+
+def test_cursor_round_trip():
+    position = (datetime.datetime(2025, 7, 1, 9, 30, 15, 250), uuid.uuid4())
+    cursor = encode_cursor(*position)
+
+    assert decode_cursor(cursor) == position
+    for bad in ("", "not a cursor", "2025-07-01T09:30:15|nothex", f"yesterday|{uuid.uuid4().hex}"):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+def test_query_resumes_after_cursor(database):
+    session = create_session("cursor-test")
+    started = datetime.datetime(2025, 7, 1, 9, 0, 0)
+    # Two rows share a start time, so the id breaks the tie
+    add_rows(session, [started, started, started + datetime.timedelta(seconds=1)])
+
+    db = next(get_db())
+    try:
+        rows = query_transcript_rows(db, session[1]).all()
+        after = query_transcript_rows(db, session[1], encode_cursor(rows[0].start_time, rows[0].id)).all()
+    finally:
+        db.close()
+    assert [row.id for row in after] == [row.id for row in rows[1:]]
+
+def test_transcripts_api_pages_by_cursor(client):
+    session = create_session("cursor-test")
+    started = datetime.datetime(2025, 7, 1, 9, 0, 0)
+    rows = add_rows(session, [started + datetime.timedelta(seconds=i) for i in range(5)])
+
+    seen, cursor = [], None
+    while True:
+        response = client.get(f"/api/transcripts/{session[1]}", query_string={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200
+        seen += [row["id"] for row in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [str(row["id"]) for row in rows]
+
+def test_bad_cursor_is_rejected(client):
+    session_id = create_session("cursor-test")[1]
+
+    assert client.get(f"/api/transcripts/{session_id}?cursor=garbage").status_code == 400
+    assert client.get(f"/api/transcripts/{session_id}?limit=0").status_code == 400
+    assert client.get("/?before=garbage").status_code == 400
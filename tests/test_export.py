@@ -0,0 +1,32 @@
+import datetime
+import types
+import uuid
+
+from app.export import DEFAULT_CUE_MS, subtitle_lines
+
+def make_row(start_time, text, duration_ms=None, end_time=None):
+    return types.SimpleNamespace(
+        id=uuid.uuid4(), start_time=start_time, end_time=end_time,
+        duration_ms=duration_ms, text=text
+    )
+
+START = datetime.datetime(2025, 7, 1, 21, 15, 0)
+
+def test_srt_cues_are_relative_to_the_first_transcript():
+    rows = [
+        make_row(START, "first", duration_ms=1500),
+        make_row(START + datetime.timedelta(seconds=3, milliseconds=250), "second\n\nline",
+                 end_time=START + datetime.timedelta(seconds=5)),
+        make_row(START + datetime.timedelta(hours=1, minutes=2), "third"),
+    ]
+
+    assert "".join(subtitle_lines(rows, "srt")) == (
+        "1\n00:00:00,000 --> 00:00:01,500\nfirst\n\n"
+        "2\n00:00:03,250 --> 00:00:05,000\nsecond\nline\n\n"
+        f"3\n01:02:00,000 --> 01:02:0{DEFAULT_CUE_MS // 1000},000\nthird\n\n"
+    )
+
+def test_vtt_header_and_separator():
+    rows = [make_row(START, "hello", duration_ms=2500)]
+
+    assert "".join(subtitle_lines(rows, "vtt")) == "WEBVTT\n\n00:00:00.000 --> 00:00:02.500\nhello\n\n"
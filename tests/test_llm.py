@@ -0,0 +1,97 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from openai import OpenAI
+
+from app.llm import PromptTemplate, ResponseCache, complete, stream_complete
+
+STUB_SERVER = Path(__file__).parent.parent / "scripts" / "stub_stt_server.py"
+TEMPLATE = PromptTemplate("test-summary", "You summarize.", "Summarize: {text}")
+
+def chat_calls(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.load(response)["chat_completions"]
+
+@pytest.fixture
+def stub_server():
+    """Base URL of a stub chat server that takes half a second per request"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, str(STUB_SERVER), "--port", str(port), "--delay", "0.5"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                chat_calls(base_url)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # Every entry is 11 bytes (key plus response), so two fit
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=25)
+    cache.put("a", "model", "t", "x" * 10)
+    time.sleep(0.01)
+    cache.put("b", "model", "t", "y" * 10)
+    time.sleep(0.01)
+    assert cache.get("a") == "x" * 10
+    time.sleep(0.01)
+    cache.put("c", "model", "t", "z" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.get("c") == "z" * 10
+    assert cache.stats() == {"entries": 2, "bytes": 22, "max_bytes": 25}
+
+def test_concurrent_completions_make_one_call(tmp_path, stub_server):
+    client = OpenAI(base_url=f"{stub_server}/v1", api_key="stub")
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    before = chat_calls(stub_server)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(
+            lambda _: complete(client, "stub", TEMPLATE, cache=cache, text="the same transcript"),
+            range(6)
+        ))
+    assert len(set(results)) == 1
+    assert chat_calls(stub_server) == before + 1
+
+    # Later calls are answered from the cache; a different input is generated
+    assert complete(client, "stub", TEMPLATE, cache=cache, text="the same transcript") == results[0]
+    assert chat_calls(stub_server) == before + 1
+    complete(client, "stub", TEMPLATE, cache=cache, text="another transcript")
+    assert chat_calls(stub_server) == before + 2
+
+def test_concurrent_streams_share_one_call(tmp_path, stub_server):
+    client = OpenAI(base_url=f"{stub_server}/v1", api_key="stub")
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    before = chat_calls(stub_server)
+
+    def read(delay):
+        time.sleep(delay)
+        return "".join(stream_complete(client, "stub", TEMPLATE, cache=cache, text="streamed transcript"))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(read, [0, 0.1, 0.2, 0.3]))
+    assert len(set(results)) == 1 and results[0]
+    assert chat_calls(stub_server) == before + 1
+    assert complete(client, "stub", TEMPLATE, cache=cache, text="streamed transcript") == results[0].strip()
+    assert chat_calls(stub_server) == before + 1
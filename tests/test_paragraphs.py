@@ -0,0 +1,78 @@
+import datetime
+
+from app.database import get_db
+from app.database.helpers import build_transcript_row, create_session, save_transcripts
+from app.database.models import Session as DBSession, Transcript
+from app.database.paragraphs import UtteranceMerger, compact_session
+
+STARTED = datetime.datetime(2025, 7, 1, 9, 0, 0)
+
+def fragment(text, seconds, duration_ms=500, **fields):
+    return dict(text=text, time=STARTED + datetime.timedelta(seconds=seconds), duration_ms=duration_ms, **fields)
+
+def test_merger_closes_on_pause():
+    merger = UtteranceMerger(max_gap_ms=2000, max_chars=600)
+    assert merger.add(fragment("hello there", 1, confidence=0.8)) is None
+    assert merger.add(fragment("how are you", 2, confidence=0.6)) is None
+
+    # 10 seconds later, well past the 2 second gap
+    paragraph = merger.add(fragment("new topic", 12))
+    assert paragraph["text"] == "hello there how are you"
+    assert paragraph["start_time"] == STARTED + datetime.timedelta(seconds=1)
+    assert paragraph["end_time"] == STARTED + datetime.timedelta(seconds=2)
+    assert paragraph["duration_ms"] == 1000
+    assert abs(paragraph["confidence"] - 0.7) < 1e-9
+    assert paragraph["fragments"] == [
+        {"offset": 0, "length": 11, "start_ms": 0, "duration_ms": 500},
+        {"offset": 12, "length": 11, "start_ms": 1000, "duration_ms": 500},
+    ]
+
+    last = merger.flush()
+    assert last["text"] == "new topic" and last["fragments"] is None
+    assert merger.flush() is None and merger.idle_ms(STARTED) is None
+
+def test_merger_closes_at_max_chars():
+    merger = UtteranceMerger(max_gap_ms=2000, max_chars=20)
+    assert merger.add(fragment("a" * 10, 1)) is None
+    closed = merger.add(fragment("b" * 10, 2))
+    assert closed["text"] == "a" * 10
+    assert merger.flush()["text"] == "b" * 10
+
+def stored(session_id):
+    db = next(get_db())
+    try:
+        rows = db.query(Transcript.text, Transcript.transcript_metadata).filter(
+            Transcript.session_id == session_id
+        ).order_by(Transcript.start_time).all()
+        session = db.query(DBSession).filter(DBSession.id == session_id).one()
+        return rows, (session.transcript_count, session.total_characters)
+    finally:
+        db.close()
+
+def test_compact_session_merges_fragments(database):
+    user_id, session_id = create_session("compact-test")
+    texts = ["one", "two", "three", "four", "five"]
+    seconds = [1, 2, 3, 20, 21]
+    save_transcripts([
+        build_transcript_row(session_id=session_id, user_id=user_id, text=text, duration_ms=500,
+                             start_time=STARTED + datetime.timedelta(seconds=second))
+        for text, second in zip(texts, seconds)
+    ])
+    assert stored(session_id)[1] == (5, sum(len(text) for text in texts))
+
+    db = next(get_db())
+    try:
+        rewritten = []
+        assert compact_session(db, session_id, max_gap_ms=2000, rewritten=rewritten) == 3
+        db.commit()
+        assert len(rewritten) == 2
+
+        # Paragraph rows are left alone on a second run
+        assert compact_session(db, session_id, max_gap_ms=2000) == 0
+    finally:
+        db.close()
+
+    rows, counters = stored(session_id)
+    assert [row.text for row in rows] == ["one two three", "four five"]
+    assert [len(row.transcript_metadata["fragments"]) for row in rows] == [3, 2]
+    assert counters == (2, len("one two three") + len("four five"))
@@ -0,0 +1,77 @@
+import datetime
+import uuid
+
+import numpy as np
+
+from app.database import get_db
+from app.database.helpers import build_transcript_row, create_session, save_transcripts
+from app.database.models import Session as DBSession, Transcript
+from app.database.retention import archive_session, iter_archived_transcripts
+from app.semantic_search import VectorIndex
+
+STARTED = datetime.datetime(2025, 7, 1, 9, 0, 0)
+
+def add_session(count):
+    user_id, session_id = create_session("retention-test")
+    rows = [
+        build_transcript_row(session_id=session_id, user_id=user_id, text=f"utterance été {i}",
+                             duration_ms=1000, start_time=STARTED + datetime.timedelta(seconds=i))
+        for i in range(count)
+    ]
+    save_transcripts(rows)
+    return session_id, rows
+
+def archive(session_id, base_dir):
+    db = next(get_db())
+    try:
+        archived = []
+        count = archive_session(db, session_id, base_dir=base_dir, compression="gzip", archived=archived)
+        session = db.query(DBSession).filter(DBSession.id == session_id).one()
+        db.expunge(session)
+        left = db.query(Transcript).filter(Transcript.session_id == session_id).count()
+        return count, archived, session, left
+    finally:
+        db.close()
+
+def test_archive_round_trip_by_byte_range(database, tmp_path):
+    base_dir = tmp_path / "archive"
+    first_id, first_rows = add_session(3)
+    second_id, second_rows = add_session(2)
+
+    count, archived, first, left = archive(first_id, base_dir)
+    assert count == 3 and left == 0
+    assert archived == [row["id"] for row in first_rows]
+    _, _, second, _ = archive(second_id, base_dir)
+
+    # Both sessions share the month's file; each reads back only its own range
+    assert first.archive_path == second.archive_path
+    assert second.archive_offset == first.archive_offset + first.archive_length
+    assert first.transcript_count == 3
+    for session, rows in ((first, first_rows), (second, second_rows)):
+        read = list(iter_archived_transcripts(session, base_dir))
+        assert [(row.id, row.text, row.start_time) for row in read] == \
+            [(row["id"], row["text"], row["start_time"]) for row in rows]
+
+def test_archived_transcripts_api_pages(client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session_id, rows = add_session(5)
+    archive(session_id, tmp_path / "transcript_archive")
+
+    seen, cursor = [], None
+    while True:
+        response = client.get(f"/api/transcripts/{session_id}", query_string={"limit": 2, "cursor": cursor})
+        seen += [row["id"] for row in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [str(row["id"]) for row in rows]
+
+def test_removed_rows_leave_search(tmp_path):
+    index = VectorIndex(tmp_path / "index")
+    index.reset("test", dim=2)
+    ids = [uuid.uuid4() for _ in range(3)]
+    index.append(ids, np.array([[1, 0], [0.9, 0.1], [0, 1]], dtype=np.float32), cursor=None)
+
+    assert index.remove(ids[:1]) == 1
+    index.refresh()
+    assert [hit for hit, _ in index.search([1, 0], k=3)] == [ids[1], ids[2]]
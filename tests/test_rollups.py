@@ -0,0 +1,90 @@
+import datetime
+
+from app.database import get_db
+from app.database.helpers import build_transcript_row, create_session, save_transcripts
+from app.database.models import ActivityRollup, TermRollup
+from app.database.paragraphs import compact_session
+from app.database.retention import archive_session
+from app.database.rollups import rebuild_rollups
+
+STARTED = datetime.datetime(2025, 7, 1, 9, 0, 0)
+
+def add_rows(session, texts, start=STARTED):
+    user_id, session_id = session
+    save_transcripts([
+        build_transcript_row(session_id=session_id, user_id=user_id, text=text, duration_ms=500,
+                             start_time=start + datetime.timedelta(seconds=i))
+        for i, text in enumerate(texts)
+    ])
+
+def rollups():
+    """(hourly activity, daily terms) as stored"""
+    db = next(get_db())
+    try:
+        hours = {
+            row.bucket_start: (row.utterances, row.words, row.characters, row.speaking_ms)
+            for row in db.query(ActivityRollup)
+        }
+        days = {(row.day, row.term): row.occurrences for row in db.query(TermRollup)}
+        return hours, days
+    finally:
+        db.close()
+
+def rebuilt():
+    db = next(get_db())
+    try:
+        count = rebuild_rollups(db)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+def test_insert_adds_to_rollups(database):
+    add_rows(create_session("rollup-test"), ["coffee meeting agenda", "coffee break"])
+
+    hours, days = rollups()
+    assert hours == {STARTED: (2, 5, len("coffee meeting agenda") + len("coffee break"), 1000)}
+    assert days[(STARTED.date(), "coffee")] == 2
+    assert days[(STARTED.date(), "agenda")] == 1
+
+def test_compaction_keeps_rollups_in_step(database):
+    session = create_session("rollup-test")
+    add_rows(session, ["coffee meeting", "agenda items", "coffee break"])
+
+    db = next(get_db())
+    try:
+        assert compact_session(db, session[1]) == 2
+        db.commit()
+    finally:
+        db.close()
+
+    hours, days = rollups()
+    assert hours[STARTED][:2] == (1, 6)
+    assert days[(STARTED.date(), "coffee")] == 2
+
+    # The incremental updates agree with a recount from the transcripts
+    assert rebuilt() == 1
+    assert rollups() == (hours, days)
+
+def test_rebuild_reads_archived_sessions(database, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archived = create_session("rollup-test")
+    add_rows(archived, ["archived coffee talk"], start=STARTED - datetime.timedelta(days=1))
+    add_rows(create_session("rollup-test"), ["live coffee talk"])
+    before = rollups()
+
+    db = next(get_db())
+    try:
+        archive_session(db, archived[1], base_dir=tmp_path / "transcript_archive", compression="gzip")
+    finally:
+        db.close()
+
+    assert rebuilt() == 2
+    assert rollups() == before
+
+def test_analytics_rejects_bad_ranges(client):
+    assert client.get("/api/analytics/terms?days=7&limit=5").status_code == 200
+    assert client.get("/api/analytics/terms?days=99999999").status_code == 400
+    assert client.get("/api/analytics/terms?days=0").status_code == 400
+    assert client.get("/api/analytics/terms?limit=-5").status_code == 400
+    assert client.get("/api/analytics/activity?from=2025-07-02&to=2025-07-01").status_code == 400
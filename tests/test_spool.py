@@ -0,0 +1,140 @@
+import datetime
+import time
+import uuid
+
+from app.database import get_db
+from app.database.helpers import build_transcript_row, create_session
+from app.database.models import Session as DBSession, Transcript
+from app.database.spool import (
+    REJECTED_FILE, SpoolReplayer, TranscriptSpool, decode_record, encode_record,
+    insert_rows, read_records, replay_batch, segment_path
+)
+from app.database.writer import TranscriptWriter
+
+def make_rows(session, count, start=0):
+    user_id, session_id = session
+    started = datetime.datetime(2025, 7, 1, 9, 0, 0)
+    return [
+        build_transcript_row(
+            session_id=session_id, user_id=user_id, text=f"utterance number {i}",
+            duration_ms=1000, start_time=started + datetime.timedelta(seconds=i)
+        )
+        for i in range(start, start + count)
+    ]
+
+def stored(session_id):
+    """(transcript rows, session counters) as they are in the database"""
+    db = next(get_db())
+    try:
+        count = db.query(Transcript).filter(Transcript.session_id == session_id).count()
+        counters = db.query(
+            DBSession.transcript_count, DBSession.total_characters, DBSession.total_duration_ms
+        ).filter(DBSession.id == session_id).one()
+        return count, tuple(counters)
+    finally:
+        db.close()
+
+def test_record_round_trip():
+    row = {
+        "id": uuid.uuid4(), "session_id": uuid.uuid4(), "user_id": uuid.uuid4(),
+        "text": "hello été\nworld", "start_time": datetime.datetime(2025, 7, 1, 9, 30, 15, 250),
+        "end_time": None, "duration_ms": 1500, "transcript_metadata": {"source": "test"},
+    }
+    line = encode_record(row, 1234.5)
+
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert decode_record(line) == (row, 1234.5)
+
+def test_corrupt_record_is_rejected():
+    line = encode_record({"id": uuid.uuid4(), "text": "hello"}, 1.0)
+
+    assert decode_record(line.replace(b"hello", b"jello")) is None
+    assert decode_record(line[:len(line) // 2]) is None
+    assert decode_record(b"not a record\n") is None
+
+def test_torn_tail_is_left_unread(tmp_path):
+    rows = [{"id": uuid.uuid4(), "text": f"row {i}"} for i in range(3)]
+    complete = encode_record(rows[0], 1.0) + encode_record(rows[1], 1.0)
+    with open(segment_path(tmp_path, 1), "wb") as f:
+        f.write(complete + encode_record(rows[2], 1.0)[:10])
+
+    records, position, bytes_read = read_records(tmp_path, (1, 0), limit=10)
+    assert [row["id"] for row, _ in records] == [rows[0]["id"], rows[1]["id"]]
+    assert position == (1, len(complete)) and bytes_read == len(complete)
+
+    # Once the writer has moved on to a new segment, the torn tail is skipped
+    later = {"id": uuid.uuid4(), "text": "after the crash"}
+    segment_path(tmp_path, 2).write_bytes(encode_record(later, 2.0))
+    records, position, _ = read_records(tmp_path, position, limit=10)
+    assert [row["id"] for row, _ in records] == [later["id"]]
+    assert position == (2, len(encode_record(later, 2.0)))
+
+def test_replay_is_idempotent(database, tmp_path):
+    session = create_session("spool-test")
+    spool = TranscriptSpool(root=tmp_path / "spool").open()
+    spool.append(make_rows(session, 5))
+    spool.append(make_rows(session, 3, start=5))
+
+    records, position, _ = replay_batch(spool.directory, (1, 0), spool.end)
+    assert len(records) == 8 and position == spool.end
+    after_first = stored(session[1])
+    assert after_first[0] == 8 and after_first[1][0] == 8
+
+    # A crash before the checkpoint replays the same records again
+    records, _, _ = replay_batch(spool.directory, (1, 0), spool.end)
+    assert len(records) == 8
+    assert stored(session[1]) == after_first
+    spool.close()
+
+def test_rejected_rows_are_set_aside(database, tmp_path):
+    session = create_session("spool-test")
+    directory = tmp_path / "spool" / "owner"
+    directory.mkdir(parents=True)
+    rows = make_rows(session, 3)
+    rows[1]["text"] = None
+
+    assert insert_rows(directory, rows) == 2
+    assert stored(session[1])[0] == 2
+    rejected = (directory.parent / REJECTED_FILE).read_bytes().splitlines(keepends=True)
+    assert [decode_record(line)[0]["id"] for line in rejected] == [rows[1]["id"]]
+
+def test_abandoned_spool_is_adopted(database, tmp_path):
+    session = create_session("spool-test")
+    root = tmp_path / "spool"
+
+    # A process that spooled rows and died: its lock is released, a torn record remains
+    dead = TranscriptSpool(root=root).open()
+    dead.append(make_rows(session, 4))
+    with open(segment_path(dead.directory, dead.segment), "ab") as f:
+        f.write(encode_record(make_rows(session, 1, start=4)[0], 1.0)[:20])
+    dead._file.close()
+    dead._lock_file.close()
+
+    spool = TranscriptSpool(root=root)
+    replayer = SpoolReplayer(spool).start()
+    spool.append(make_rows(session, 2, start=10))
+    deadline = time.monotonic() + 10
+    while (replayer._orphans or stored(session[1])[0] < 6) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    replayer.close()
+
+    assert stored(session[1])[0] == 6
+    assert not dead.directory.exists()
+    assert not any(root.iterdir())
+
+def test_full_queue_spools_rows(database, tmp_path):
+    session = create_session("spool-test")
+    rows = make_rows(session, 3)
+    spool = TranscriptSpool(root=tmp_path / "spool").open()
+
+    # Not started, so nothing drains the queue
+    writer = TranscriptWriter(max_queue_size=1, spool=spool)
+    assert all(writer.submit(row) for row in rows)
+    assert writer.stats()["rows_diverted"] == 2 and writer.stats()["rows_dropped"] == 0
+    records, _, _ = read_records(spool.directory, (1, 0), limit=10)
+    assert [row["id"] for row, _ in records] == [row["id"] for row in rows[1:]]
+    spool.close()
+
+    unspooled = TranscriptWriter(max_queue_size=1, submit_timeout=0.01)
+    assert unspooled.submit(rows[0]) and not unspooled.submit(rows[1])
+    assert unspooled.stats()["rows_dropped"] == 1